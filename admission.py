@@ -0,0 +1,261 @@
+"""
+Admission Control for /detect
+
+Keeps a burst from piling every request onto the CPU at once. Each worker
+process runs at most MAX_INFLIGHT_ANALYSES analyses (by default its share of
+the CPU cores: cores / WEB_CONCURRENCY workers); further requests wait
+in a FIFO queue bounded both in requests (ADMISSION_QUEUE_SIZE) and in
+seconds of queued audio (ADMISSION_QUEUE_AUDIO_SECONDS), for at most
+ADMISSION_QUEUE_TIMEOUT seconds. Anything beyond that is answered straight
+away with 503 and a Retry-After estimated from the work ahead of it,
+instead of sitting until gunicorn's timeout.
+
+Per API key, a token bucket meters seconds of audio rather than requests:
+it refills at RATE_LIMIT_AUDIO_SECONDS per second up to
+RATE_LIMIT_BURST_SECONDS, and a request spends its clip's duration (429
+with Retry-After when the bucket is short). A clip longer than the burst
+is admitted once the bucket is full and leaves it in debt.
+
+All limits are per worker process. The queue only forms with a threaded
+worker class (gunicorn --worker-class gthread --threads N, as in the
+Procfile); sync workers accept one request at a time.
+"""
+
+import os
+import math
+import time
+import threading
+from collections import deque
+
+from metrics import (ADMISSION_INFLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUED_SECONDS,
+                     ADMISSION_REJECTIONS)
+
+# gunicorn worker processes sharing this host's cores (the Procfile passes the same value)
+WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY', 2)))
+# Analyses running at once per worker (0 disables admission control). Analysis is
+# CPU-bound, so the default is this worker's share of the cores; threads beyond it
+# wait in the queue or serve the cheap requests (polls, /health, /live chunks).
+MAX_INFLIGHT_ANALYSES = int(os.environ.get('MAX_INFLIGHT_ANALYSES',
+                                           max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 4))
+ADMISSION_QUEUE_AUDIO_SECONDS = float(os.environ.get('ADMISSION_QUEUE_AUDIO_SECONDS', 600))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 30))
+
+# Audio seconds per second each API key may submit (0 disables rate limiting)
+RATE_LIMIT_AUDIO_SECONDS = float(os.environ.get('RATE_LIMIT_AUDIO_SECONDS', 0))
+RATE_LIMIT_BURST_SECONDS = float(os.environ.get('RATE_LIMIT_BURST_SECONDS', 600))
+
+# Starting guess for analysis seconds per second of audio, refined as requests finish
+INITIAL_SECONDS_PER_AUDIO_SECOND = 0.1
+# Weight of the newest analysis in the moving average
+COST_SMOOTHING = 0.2
+# Shorter (or undecodable) clips are all fixed overhead and would skew the average
+MIN_COST_SAMPLE_SECONDS = 0.5
+# Longest Retry-After ever sent
+MAX_RETRY_AFTER = int(os.environ.get('MAX_RETRY_AFTER', 300))
+
+
+class Rejected(Exception):
+    """Raised when a request is turned away; carries the status and Retry-After seconds"""
+
+    def __init__(self, reason, status, retry_after, message):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+        self.message = message
+
+
+class TokenBucket:
+    """Refills at rate tokens per second up to capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost):
+        """Spend cost tokens; returns 0 on success, else seconds until it would succeed"""
+        self._refill(time.monotonic())
+        # A cost over capacity needs a full bucket, then leaves it negative
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def refund(self, cost):
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+
+class RateLimiter:
+    """One TokenBucket per API key"""
+
+    def __init__(self, rate=RATE_LIMIT_AUDIO_SECONDS, burst=RATE_LIMIT_BURST_SECONDS):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def take(self, key, cost):
+        """Charge cost audio seconds to key; raises Rejected when the key is over its rate"""
+        if not self.enabled:
+            return
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            wait = bucket.take(cost)
+        if wait:
+            ADMISSION_REJECTIONS.inc(reason='rate_limited')
+            raise Rejected('rate_limited', 429, min(MAX_RETRY_AFTER, math.ceil(wait)),
+                           f"Rate limit of {self.rate:g} audio seconds per second exceeded")
+
+    def refund(self, key, cost):
+        """Give back a charge for a request that was not analysed"""
+        if not self.enabled:
+            return
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.refund(cost)
+
+
+class AdmissionController:
+    """
+    Bounded concurrency with a bounded FIFO wait queue
+
+    Use as admit(cost) around an analysis, where cost is the clip's audio
+    seconds: the queue limit and Retry-After estimate are weighted by it.
+    """
+
+    def __init__(self, max_inflight=MAX_INFLIGHT_ANALYSES, queue_size=ADMISSION_QUEUE_SIZE,
+                 queue_seconds=ADMISSION_QUEUE_AUDIO_SECONDS, queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.max_inflight = max_inflight
+        self.queue_size = queue_size
+        self.queue_seconds = queue_seconds
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self.inflight_seconds = 0.0
+        self.queued_seconds = 0.0
+        self.seconds_per_audio_second = INITIAL_SECONDS_PER_AUDIO_SECOND
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._update_gauges()
+
+    @property
+    def enabled(self):
+        return self.max_inflight > 0
+
+    def _update_gauges(self):
+        ADMISSION_INFLIGHT.set(self.inflight)
+        ADMISSION_QUEUE_DEPTH.set(len(self._queue))
+        ADMISSION_QUEUED_SECONDS.set(self.queued_seconds)
+
+    def _retry_after(self, extra_seconds=0.0):
+        """Seconds until the work ahead (running + queued audio) should have drained"""
+        backlog = self.inflight_seconds + self.queued_seconds + extra_seconds
+        estimate = math.ceil(backlog * self.seconds_per_audio_second / self.max_inflight)
+        return min(MAX_RETRY_AFTER, max(1, estimate))
+
+    def _reject(self, reason, message, extra_seconds=0.0):
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        return Rejected(reason, 503, self._retry_after(extra_seconds), message)
+
+    def check(self):
+        """Fail fast, before the body is read, when the queue is already full"""
+        if not self.enabled:
+            return
+        with self._condition:
+            if self.inflight >= self.max_inflight and len(self._queue) >= self.queue_size:
+                raise self._reject('queue_full', "Server is at capacity; try again later")
+
+    def acquire(self, cost):
+        """Take an analysis slot, waiting in the queue if needed; raises Rejected"""
+        if not self.enabled:
+            return
+        with self._condition:
+            if self.inflight < self.max_inflight and not self._queue:
+                self._start(cost)
+                return
+            if len(self._queue) >= self.queue_size or (
+                    self._queue and self.queued_seconds + cost > self.queue_seconds):
+                raise self._reject('queue_full', "Server is at capacity; try again later", cost)
+
+            ticket = object()
+            self._queue.append(ticket)
+            self.queued_seconds += cost
+            self._update_gauges()
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self._queue[0] is not ticket or self.inflight >= self.max_inflight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._reject('queue_timeout', "Timed out waiting for an analysis slot")
+                    self._condition.wait(remaining)
+            finally:
+                self._queue.remove(ticket)
+                self.queued_seconds = max(0.0, self.queued_seconds - cost)
+                self._update_gauges()
+                # The next ticket may be at the head now
+                self._condition.notify_all()
+            self._start(cost)
+
+    def _start(self, cost):
+        self.inflight += 1
+        self.inflight_seconds += cost
+        self._update_gauges()
+
+    def release(self, cost, elapsed=None):
+        """Free the slot; elapsed analysis seconds refine the Retry-After estimate"""
+        if not self.enabled:
+            return
+        with self._condition:
+            self.inflight -= 1
+            self.inflight_seconds = max(0.0, self.inflight_seconds - cost)
+            if elapsed is not None and cost >= MIN_COST_SAMPLE_SECONDS:
+                self.seconds_per_audio_second += COST_SMOOTHING * (
+                    elapsed / cost - self.seconds_per_audio_second)
+            self._update_gauges()
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "enabled": self.enabled,
+                "max_inflight": self.max_inflight,
+                "inflight": self.inflight,
+                "queue_depth": len(self._queue),
+                "queue_size": self.queue_size,
+                "queued_audio_seconds": self.queued_seconds,
+                "seconds_per_audio_second": self.seconds_per_audio_second,
+            }
+
+
+_controller = None
+_limiter = None
+
+
+def get_admission():
+    """Process-wide AdmissionController"""
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
+
+
+def get_rate_limiter():
+    """Process-wide RateLimiter"""
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
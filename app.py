@@ -1,104 +1,142 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 import base64
+import json
 import os
-import tempfile
+import time
+import threading
+from functools import partial
 import librosa
-import numpy as np
-from scipy import signal
-from scipy.stats import kurtosis, skew
-import io
+
+from admission import Rejected, get_admission, get_rate_limiter
+from audio_io import audio_duration, decode_audio, iter_audio_windows
+from batch import map_ordered
+from jobs import complete_job, get_job_store, submit_job
+from result_cache import cache_key, get_cache, to_cacheable
+from metrics import record_request, render_metrics
+from rule_engine import evaluate_rules, explain, feature_matrix, load_threshold_config, mean_dtype_for
+from feature_engine import (HOP_LENGTH, N_FFT, PITCH_METHOD, compute_spectral_frames, feature_record,
+                            frame_groups_for, ml_feature_vector, rule_features)
+from app_ml import ml_classify
+from model_registry import get_registry, preload as preload_model
+from profiles import ANALYSIS_PROFILES, DEFAULT_PROFILE, apply_profile, describe_profiles, get_profile
+from streaming import STREAM_WINDOW_SECONDS, analyze_windows
+from vad import VAD_DEFAULT, trim_silence
+from live import LIVE_VERDICT_SECONDS, LiveStream, get_live_store
+from warmup import WARMUP_ON_START, is_ready, mark_ready, record_first_request, startup_status, warm_up
 
 app = Flask(__name__)
 
 # API Key for authentication
 API_KEY = "your_secure_api_key_here_123456"
 
-def verify_api_key():
-    """Verify API key from request headers"""
+# Bump whenever features or rules change, so cached verdicts are not reused
+DETECTOR_VERSION = "rules-1.0"
+
+# Calibrated rule thresholds (calibrate.py), or the built-in defaults; a
+# loaded config is part of the version so cached verdicts follow it
+RULE_CONFIG = load_threshold_config()
+RULES_VERSION = DETECTOR_VERSION if RULE_CONFIG.version is None else f"{DETECTOR_VERSION}+{RULE_CONFIG.version}"
+
+# Upload limits: decoded audio size, and whole request size (base64 JSON
+# bodies are ~4/3 of the audio they carry)
+MAX_AUDIO_BYTES = int(os.environ.get('MAX_AUDIO_BYTES', 25 * 1024 * 1024))
+MAX_REQUEST_BYTES = MAX_AUDIO_BYTES * 4 // 3 + 64 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# /detect/batch limits
+MAX_BATCH_ITEMS = int(os.environ.get('MAX_BATCH_ITEMS', 256))
+MAX_BATCH_REQUEST_BYTES = int(os.environ.get('MAX_BATCH_REQUEST_BYTES', 256 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = max(MAX_REQUEST_BYTES, MAX_BATCH_REQUEST_BYTES)
+
+# Seconds clients are told to wait when the job queue is full
+JOB_RETRY_AFTER = int(os.environ.get('JOB_RETRY_AFTER', 5))
+
+# Load model.pkl once, before gunicorn --preload forks the workers
+preload_model()
+
+# Detectors selectable per request with ?mode=
+DETECTION_MODES = ('rules', 'ml', 'hybrid')
+
+# Weight of the ML model's AI probability in mode=hybrid (the rules get the rest)
+HYBRID_ML_WEIGHT = float(os.environ.get('HYBRID_ML_WEIGHT', 0.5))
+
+# Shortest window accepted for ?stream=1 analysis
+MIN_STREAM_WINDOW_SECONDS = 0.5
+
+# Largest PCM chunk accepted per /live push (~10 s of 48 kHz 16-bit stereo)
+MAX_LIVE_CHUNK_BYTES = int(os.environ.get('MAX_LIVE_CHUNK_BYTES', 2 * 1024 * 1024))
+
+# Include per-stage timings (seconds) in /detect responses
+DEBUG_TIMINGS = os.environ.get('DEBUG_TIMINGS', '0') == '1'
+
+def request_api_key():
+    """API key sent with the request, or None"""
     auth_header = request.headers.get('Authorization') or request.headers.get('X-API-Key')
     if not auth_header:
-        return False
+        return None
     
     # Support both "Bearer <key>" and direct key
     if auth_header.startswith('Bearer '):
-        provided_key = auth_header.replace('Bearer ', '')
-    else:
-        provided_key = auth_header
+        return auth_header.replace('Bearer ', '')
+    return auth_header
+
+def verify_api_key():
+    """Verify API key from request headers"""
+    provided_key = request_api_key()
+    if not provided_key:
+        return False
     
     return provided_key == API_KEY
 
-def extract_audio_features(audio_path):
-    """Extract comprehensive audio features for AI detection"""
+def extract_audio_features(audio_path, vad=False):
+    """Extract comprehensive audio features for AI detection (speech regions only with vad)"""
     try:
         # Load audio
         y, sr = librosa.load(audio_path, sr=None)
+    except Exception as e:
+        print(f"Feature extraction error: {e}")
+        return None
+    
+    if vad:
+        y, _ = trim_silence(y, sr)
+    return extract_signal_features(y, sr)
+
+def extract_signal_ml_features(y, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, timings=None):
+    """Extract the app_ml feature vector from an already decoded signal"""
+    try:
+        frames = compute_spectral_frames(y, sr, n_fft=n_fft, hop_length=hop_length, timings=timings)
+        return ml_feature_vector(y, sr, frames, timings=timings)
+    
+    except Exception as e:
+        print(f"Feature extraction error: {e}")
+        return None
+
+def extract_signal_features(y, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, timings=None):
+    """Extract features from an already decoded signal"""
+    try:
+        # One STFT shared by every spectral feature
+        frames = compute_spectral_frames(y, sr, n_fft=n_fft, hop_length=hop_length, timings=timings)
         
-        features = {}
-        
-        # 1. Spectral Features
-        spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-        features['spectral_centroid_mean'] = np.mean(spectral_centroids)
-        features['spectral_centroid_std'] = np.std(spectral_centroids)
-        
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-        features['spectral_rolloff_mean'] = np.mean(spectral_rolloff)
-        
-        spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
-        features['spectral_bandwidth_mean'] = np.mean(spectral_bandwidth)
-        features['spectral_bandwidth_std'] = np.std(spectral_bandwidth)
-        
-        # 2. MFCCs (Mel-frequency cepstral coefficients)
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=20)
-        for i in range(min(13, mfccs.shape[0])):
-            features[f'mfcc_{i}_mean'] = np.mean(mfccs[i])
-            features[f'mfcc_{i}_std'] = np.std(mfccs[i])
-        
-        # 3. Zero Crossing Rate
-        zcr = librosa.feature.zero_crossing_rate(y)[0]
-        features['zcr_mean'] = np.mean(zcr)
-        features['zcr_std'] = np.std(zcr)
-        
-        # 4. Energy and RMS
-        rms = librosa.feature.rms(y=y)[0]
-        features['rms_mean'] = np.mean(rms)
-        features['rms_std'] = np.std(rms)
-        
-        # 5. Pitch and Harmonics
-        pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
-        pitch_values = []
-        for t in range(pitches.shape[1]):
-            index = magnitudes[:, t].argmax()
-            pitch = pitches[index, t]
-            if pitch > 0:
-                pitch_values.append(pitch)
-        
-        if pitch_values:
-            features['pitch_mean'] = np.mean(pitch_values)
-            features['pitch_std'] = np.std(pitch_values)
-            features['pitch_range'] = np.max(pitch_values) - np.min(pitch_values)
-        else:
-            features['pitch_mean'] = 0
-            features['pitch_std'] = 0
-            features['pitch_range'] = 0
-        
-        # 6. Temporal Features
-        features['duration'] = len(y) / sr
-        
-        # 7. Spectral Flatness (AI voices tend to be flatter)
-        spectral_flatness = librosa.feature.spectral_flatness(y=y)[0]
-        features['spectral_flatness_mean'] = np.mean(spectral_flatness)
-        features['spectral_flatness_std'] = np.std(spectral_flatness)
-        
-        # 8. Chroma features
-        chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-        features['chroma_mean'] = np.mean(chroma)
-        features['chroma_std'] = np.std(chroma)
-        
-        # 9. Statistical measures
-        features['audio_kurtosis'] = kurtosis(y)
-        features['audio_skew'] = skew(y)
-        
-        return features
+        return rule_features(y, sr, frames, timings=timings)
+    
+    except Exception as e:
+        print(f"Feature extraction error: {e}")
+        return None
+
+def extract_signal_record(y, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, rules=True, ml=True, timings=None,
+                          ml_features=None):
+    """
+    Extract a FeatureRecord (rule and/or ML features) from one shared STFT
+    
+    ml_features is a pruned model's feature list; without the rules only
+    the frame features it needs are computed.
+    """
+    try:
+        groups = None if rules else frame_groups_for(ml_features)
+        frames = compute_spectral_frames(y, sr, n_fft=n_fft, hop_length=hop_length, timings=timings,
+                                         groups=groups)
+        return feature_record(y, sr, frames, rules=rules, ml=ml, timings=timings, ml_features=ml_features)
     
     except Exception as e:
         print(f"Feature extraction error: {e}")
@@ -112,82 +150,317 @@ def detect_ai_voice(features):
     - Less natural pitch variation
     - Smoother transitions
     - More consistent energy levels
+    
+    The checks live in rule_engine.RULES, with thresholds from RULE_CONFIG;
+    this scores a single feature dict through the vectorized engine.
     """
     
     if not features:
         return "HUMAN", 0.5, "Unable to extract features, defaulting to human"
     
-    ai_indicators = 0
-    total_checks = 0
-    reasons = []
-    
-    # Check 1: Spectral Flatness (AI voices are often flatter)
-    total_checks += 1
-    if features.get('spectral_flatness_mean', 0) > 0.3:
-        ai_indicators += 1
-        reasons.append("High spectral flatness suggests synthetic generation")
-    
-    # Check 2: Pitch Variation (AI voices have less natural variation)
-    total_checks += 1
-    if features.get('pitch_std', 0) < 20:
-        ai_indicators += 1
-        reasons.append("Low pitch variation indicates artificial voice")
-    
-    # Check 3: Spectral Centroid Consistency (AI is more consistent)
-    total_checks += 1
-    if features.get('spectral_centroid_std', 0) < 300:
-        ai_indicators += 1
-        reasons.append("Very consistent spectral centroid pattern")
-    
-    # Check 4: Energy Consistency (AI has more uniform energy)
-    total_checks += 1
-    if features.get('rms_std', 0) < 0.02:
-        ai_indicators += 1
-        reasons.append("Unnaturally consistent energy levels")
-    
-    # Check 5: Zero Crossing Rate variation
-    total_checks += 1
-    if features.get('zcr_std', 0) < 0.02:
-        ai_indicators += 1
-        reasons.append("Limited zero-crossing rate variation")
-    
-    # Check 6: MFCC patterns (AI voices have different MFCC patterns)
-    total_checks += 1
-    mfcc_stds = [features.get(f'mfcc_{i}_std', 0) for i in range(5)]
-    if mfcc_stds and np.mean(mfcc_stds) < 10:
-        ai_indicators += 1
-        reasons.append("MFCC patterns suggest synthetic voice")
-    
-    # Check 7: Spectral Bandwidth (AI voices often have narrower bandwidth)
-    total_checks += 1
-    if features.get('spectral_bandwidth_mean', 0) < 1000:
-        ai_indicators += 1
-        reasons.append("Narrow spectral bandwidth typical of AI")
-    
-    # Check 8: Chroma variation
-    total_checks += 1
-    if features.get('chroma_std', 0) < 0.1:
-        ai_indicators += 1
-        reasons.append("Limited chroma variation")
-    
-    # Calculate confidence
-    ai_score = ai_indicators / total_checks
-    
-    # Determine classification
-    if ai_score > 0.55:  # More than 55% AI indicators
-        classification = "AI_GENERATED"
-        confidence = min(0.6 + (ai_score - 0.55) * 0.8, 0.95)
-        explanation = "AI-generated voice detected. " + "; ".join(reasons[:3])
+    scores = evaluate_rules(feature_matrix([features]), thresholds=RULE_CONFIG.thresholds,
+                            decision_threshold=RULE_CONFIG.decision_threshold,
+                            mean_dtype=mean_dtype_for(features))
+    classification = str(scores.classifications[0])
+    explanation = explain(classification, scores.indicators[0])
+    
+    return classification, float(scores.confidences[0]), explanation
+
+def ai_probability(classification, confidence):
+    """A verdict's confidence restated as the probability the voice is AI"""
+    return confidence if classification == "AI_GENERATED" else 1 - confidence
+
+def combine_verdicts(rule_verdict, ml_verdict, ml_weight=HYBRID_ML_WEIGHT):
+    """
+    Hybrid verdict: weighted average of the two detectors' AI probabilities
+    
+    The explanation comes from the more confident detector among those that
+    agree with the combined classification.
+    """
+    p_ai = (1 - ml_weight) * ai_probability(*rule_verdict[:2]) + ml_weight * ai_probability(*ml_verdict[:2])
+    classification = "AI_GENERATED" if p_ai > 0.5 else "HUMAN"
+    confidence = round(max(p_ai, 1 - p_ai), 2)
+    
+    agreeing = [v for v in (ml_verdict, rule_verdict) if v[0] == classification] or [ml_verdict]
+    reason = max(agreeing, key=lambda v: v[1])[2]
+    explanation = (f"Hybrid verdict (rules: {rule_verdict[0]} {rule_verdict[1]:.2f}, "
+                   f"ML: {ml_verdict[0]} {ml_verdict[1]:.2f}). {reason}")
+    return classification, confidence, explanation
+
+def read_upload_stream(stream, limit=None):
+    """Read an upload stream in chunks; returns None if it exceeds limit bytes"""
+    limit = MAX_AUDIO_BYTES if limit is None else limit
+    buffer = bytearray()
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.extend(chunk)
+        if len(buffer) > limit:
+            return None
+    return buffer
+
+def payload_too_large():
+    """413 response for uploads over MAX_AUDIO_BYTES"""
+    return jsonify({
+        "error": "Payload Too Large",
+        "message": f"Audio exceeds the maximum size of {MAX_AUDIO_BYTES} bytes"
+    }), 413
+
+def detector_version(mode, profile=DEFAULT_PROFILE, bundle=None, vad=False):
+    """
+    Version tag for cache keys: the rules version, the ML model version
+    (None if untrained) or both for hybrid, scoped to the analysis profile,
+    the pitch method (when not the default piptrack) and whether silence
+    was trimmed
+    """
+    if mode in ('ml', 'hybrid') and bundle is None:
+        bundle = get_registry().get()
+    scope = profile if PITCH_METHOD == 'piptrack' else f"{profile}+{PITCH_METHOD}"
+    if vad:
+        scope = f"{scope}+vad"
+    if mode == 'ml':
+        return f"ml-{bundle.version}/{scope}" if bundle is not None else None
+    if mode == 'hybrid':
+        ml_version = bundle.version if bundle is not None else 'none'
+        return f"hybrid-{RULES_VERSION}-ml-{ml_version}/{scope}"
+    return f"{RULES_VERSION}/{scope}"
+
+def cached_result(audio_bytes, version, timings):
+    """(features, classification, confidence, explanation) from the result cache, or None on a miss"""
+    cache = get_cache()
+    if cache is None or version is None:
+        return None
+    entry = cache.get(cache_key(audio_bytes, version))
+    timings['cache'] = 'hit' if entry is not None else 'miss'
+    if entry is None:
+        return None
+    if entry.get('speech_activity') is not None:
+        timings['speech_activity'] = entry['speech_activity']
+    return entry['features'], entry['classification'], entry['confidence'], entry['explanation']
+
+def analyze_audio_bytes(audio_bytes, timings=None, use_cache=True, mode='rules', profile=None, vad=False,
+                        lookup=True):
+    """
+    Decode audio bytes, extract features and run the selected detector
+    
+    mode is 'rules' (detect_ai_voice), 'ml' (the registry's RandomForest)
+    or 'hybrid' (both, from one extraction, see combine_verdicts); profile names the analysis profile (sample rate, duration cap, frame
+    sizes), DEFAULT_PROFILE if None. Returns (features, classification,
+    confidence, explanation); features is a FeatureRecord, or None when the
+    audio could not be decoded or analysed. Results for byte-identical audio are served from
+    the result cache (lookup=False skips the read when the caller already missed, the
+    result is still stored). With vad, only the speech regions found by vad.trim_silence are
+    analysed and timings['speech_activity'] reports what was trimmed.
+    """
+    timings = {} if timings is None else timings
+    profile = get_profile(profile)
+    
+    # Resolve the model once so the whole request uses one version
+    bundle = None
+    if mode in ('ml', 'hybrid'):
+        bundle = get_registry().get()
+        if bundle is None and mode == 'ml':
+            return None, "HUMAN", 0.5, "ML model not trained. Using default classification."
+    version = detector_version(mode, profile.name, bundle, vad)
+    use_rules = mode != 'ml'
+    use_ml = bundle is not None
+    
+    cache = get_cache() if use_cache else None
+    if cache is not None and lookup:
+        cached = cached_result(audio_bytes, version, timings)
+        if cached is not None:
+            return cached
+    
+    # Decode audio in memory (temp file only for codecs that need one),
+    # resampled and truncated as the profile asks
+    try:
+        y, sr = decode_audio(audio_bytes, sr=profile.sample_rate, timings=timings,
+                             duration=profile.max_duration)
+        y = apply_profile(y, profile)
+    except Exception as e:
+        print(f"Audio decoding error: {e}")
+        y = None
+    
+    # Drop silence before any feature work
+    if y is not None and vad:
+        stage_start = time.perf_counter()
+        y, timings['speech_activity'] = trim_silence(y, sr)
+        timings['vad'] = time.perf_counter() - stage_start
+    if y is not None:
+        timings['audio_seconds'] = len(y) / sr
+    
+    # Extract features
+    stage_start = time.perf_counter()
+    if y is None:
+        features = None
     else:
-        classification = "HUMAN"
-        confidence = min(0.6 + (1 - ai_score) * 0.8, 0.95)
-        explanation = "Human voice detected with natural variations in pitch, energy, and spectral characteristics"
+        features = extract_signal_record(y, sr, profile.n_fft, profile.hop_length,
+                                         rules=use_rules, ml=use_ml, timings=timings,
+                                         ml_features=bundle.feature_names if use_ml else None)
+    timings['features'] = time.perf_counter() - stage_start
+    
+    # Detect AI voice
+    stage_start = time.perf_counter()
+    if features is None:
+        classification, confidence, explanation = detect_ai_voice(features)
+    else:
+        if use_rules:
+            rule_verdict = detect_ai_voice(features)
+        if use_ml:
+            try:
+                ml_verdict = ml_classify(features.ml_vector(bundle.feature_names), bundle)
+            except Exception as e:
+                ml_verdict = "HUMAN", 0.5, f"Error in ML detection: {str(e)}"
+        
+        if mode == 'ml':
+            classification, confidence, explanation = ml_verdict
+        elif mode == 'hybrid' and use_ml:
+            classification, confidence, explanation = combine_verdicts(rule_verdict, ml_verdict)
+        elif mode == 'hybrid':
+            classification, confidence, explanation = rule_verdict
+            explanation = f"ML model not trained; rule-based verdict only. {explanation}"
+        else:
+            classification, confidence, explanation = rule_verdict
+    timings['classification'] = time.perf_counter() - stage_start
+    
+    if cache is not None and features is not None:
+        entry = to_cacheable(features, classification, confidence, explanation)
+        if vad:
+            entry['speech_activity'] = timings.get('speech_activity')
+        cache.set(cache_key(audio_bytes, version), entry)
+    
+    return features, classification, confidence, explanation
+
+def score_audio_item(audio_bytes, mode='rules', profile=None, vad=False):
+    """
+    Score one clip in a pool worker
+    
+    The result cache is consulted in the parent process, so the worker
+    skips it and returns the cacheable entry (features included, and the
+    speech activity when vad is on).
+    """
+    timings = {}
+    features, classification, confidence, explanation = analyze_audio_bytes(
+        audio_bytes, timings, use_cache=False, mode=mode, profile=profile, vad=vad)
+    entry = to_cacheable(features, classification, confidence, explanation)
+    if vad:
+        entry['speech_activity'] = timings.get('speech_activity')
+    return entry
+
+def param_flag(value):
+    """Interpret a query/form/JSON option as a boolean"""
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+def service_busy(rejection):
+    """429 (rate limited) or 503 (at capacity) response with Retry-After"""
+    return jsonify({
+        "error": "Too Many Requests" if rejection.status == 429 else "Service Unavailable",
+        "message": rejection.message,
+        "retry_after": rejection.retry_after
+    }), rejection.status, {"Retry-After": str(rejection.retry_after)}
+
+def admission_cost(audio_bytes, profile):
+    """Seconds of audio a request will analyse, for rate limits and the admission queue"""
+    seconds = audio_duration(audio_bytes)
+    if profile.max_duration is not None:
+        seconds = min(seconds, profile.max_duration)
+    return seconds
+
+def bad_request(message):
+    """400 response in the API's error format"""
+    return jsonify({
+        "error": "Bad Request",
+        "message": message
+    }), 400
+
+def read_audio_request(timings):
+    """
+    Read the audio payload of a /detect-style request
+    
+    Accepts JSON with a base64 'audio' field, a raw binary body
+    (application/octet-stream or audio/*), or a multipart/form-data upload
+    with the file in an 'audio' field. Returns (audio_bytes, params,
+    error_response); params holds the query-string options updated with
+    form fields or the JSON body's other fields (e.g. 'mode', 'profile').
+    """
+    start = time.perf_counter()
+    mimetype = request.mimetype
+    params = request.args.to_dict()
+    
+    if request.content_length is not None and request.content_length > MAX_REQUEST_BYTES:
+        return None, params, payload_too_large()
+    
+    if mimetype == 'application/octet-stream' or mimetype.startswith('audio/'):
+        # Raw binary body, read in chunks
+        audio_bytes = read_upload_stream(request.stream)
+        if audio_bytes is None:
+            return None, params, payload_too_large()
+        timings['upload_read'] = time.perf_counter() - start
+    
+    elif mimetype == 'multipart/form-data':
+        params.update(request.form.to_dict())
+        upload = request.files.get('audio')
+        if upload is None:
+            return None, params, bad_request("Missing 'audio' file in multipart body")
+        audio_bytes = read_upload_stream(upload.stream)
+        if audio_bytes is None:
+            return None, params, payload_too_large()
+        timings['upload_read'] = time.perf_counter() - start
+    
+    else:
+        # Get request data
+        data = request.get_json()
+        
+        if not data or 'audio' not in data:
+            return None, params, bad_request("Missing 'audio' field in request body")
+        
+        params.update({k: v for k, v in data.items() if k != 'audio'})
+        
+        # Decode base64 audio
+        try:
+            audio_bytes = base64.b64decode(data['audio'])
+        except Exception as e:
+            return None, params, bad_request(f"Invalid base64 encoding: {str(e)}")
+        
+        if len(audio_bytes) > MAX_AUDIO_BYTES:
+            return None, params, payload_too_large()
+        timings['base64_decode'] = time.perf_counter() - start
     
-    return classification, round(confidence, 2), explanation
+    if not audio_bytes:
+        return None, params, bad_request("Empty audio payload")
+    
+    mode = params.setdefault('mode', 'rules')
+    if mode not in DETECTION_MODES:
+        return None, params, bad_request(
+            f"Unknown mode '{mode}'; expected one of {', '.join(DETECTION_MODES)}")
+    
+    profile = params.setdefault('profile', DEFAULT_PROFILE)
+    if profile not in ANALYSIS_PROFILES:
+        return None, params, bad_request(
+            f"Unknown profile '{profile}'; expected one of {', '.join(ANALYSIS_PROFILES)}")
+    
+    params['vad'] = param_flag(params.get('vad', VAD_DEFAULT))
+    
+    return audio_bytes, params, None
 
 @app.route('/detect', methods=['POST'])
 def detect_voice():
-    """Main endpoint for voice detection"""
+    """
+    Main endpoint for voice detection
+    
+    Accepts JSON with a base64 'audio' field, a raw binary body
+    (application/octet-stream or audio/*), or a multipart/form-data
+    upload with the file in an 'audio' field. The detector is chosen with
+    ?mode=rules (default), ?mode=ml or ?mode=hybrid, or a 'mode' field in the body, and
+    the analysis profile with ?profile=fast|balanced|full.
+    
+    Admission control (admission.py) bounds concurrent analyses and the wait
+    queue, and rate-limits each API key by seconds of audio: 503 or 429 with
+    Retry-After when a request can't be taken on. Result cache hits skip both.
+    """
     
     # Verify API key
     if not verify_api_key():
@@ -196,54 +469,415 @@ def detect_voice():
             "message": "Invalid or missing API key"
         }), 401
     
+    # Turn the request away before reading its body if the queue is already full
+    admission = get_admission()
     try:
-        # Get request data
-        data = request.get_json()
+        admission.check()
+    except Rejected as e:
+        return service_busy(e)
+    
+    try:
+        timings = {}
+        start = time.perf_counter()
+        # Picked up by record_metrics once the response is ready
+        g.timings = timings
         
-        if not data or 'audio' not in data:
+        audio_bytes, params, error_response = read_audio_request(timings)
+        if error_response is not None:
+            return error_response
+        
+        stream = param_flag(params.get('stream'))
+        if stream:
+            if params['mode'] != 'rules':
+                return bad_request("Streaming analysis supports mode=rules only")
+            if params['vad']:
+                return bad_request("Silence trimming (vad) is not supported with stream=1")
+            try:
+                window_seconds = float(params.get('window_seconds', STREAM_WINDOW_SECONDS))
+                stable_windows = int(params.get('stable_windows', 0))
+            except (TypeError, ValueError):
+                return bad_request("'window_seconds' and 'stable_windows' must be numbers")
+            if window_seconds < MIN_STREAM_WINDOW_SECONDS or stable_windows < 0:
+                return bad_request(
+                    f"'window_seconds' must be at least {MIN_STREAM_WINDOW_SECONDS} and 'stable_windows' non-negative")
+        
+        # Cache hits are answered without spending the key's budget or an analysis slot
+        profile = get_profile(params['profile'])
+        cached = None
+        if not stream:
+            version = detector_version(params['mode'], profile.name, vad=params['vad'])
+            cached = cached_result(audio_bytes, version, timings)
+        
+        # Charge the key's audio-seconds budget, then wait for an analysis slot
+        cost = admission_cost(audio_bytes, profile)
+        timings['audio_cost_seconds'] = cost
+        if cached is None:
+            api_key = request_api_key()
+            try:
+                get_rate_limiter().take(api_key, cost)
+                wait_start = time.perf_counter()
+                try:
+                    admission.acquire(cost)
+                except Rejected:
+                    get_rate_limiter().refund(api_key, cost)
+                    raise
+                timings['admission_wait'] = time.perf_counter() - wait_start
+            except Rejected as e:
+                return service_busy(e)
+        
+        analysis_start = time.perf_counter()
+        try:
+            stream_details = None
+            if cached is not None:
+                features, classification, confidence, explanation = cached
+            elif stream:
+                # Windowed analysis of long recordings, optionally stopping early
+                windows = iter_audio_windows(audio_bytes, window_seconds, sr=profile.sample_rate,
+                                             duration=profile.max_duration)
+                stage_start = time.perf_counter()
+                features, classification, confidence, explanation, stream_details = analyze_windows(
+                    windows, detect_ai_voice, stable_windows,
+                    n_fft=profile.n_fft, hop_length=profile.hop_length)
+                timings['stream_analysis'] = time.perf_counter() - stage_start
+                timings['audio_seconds'] = stream_details['analyzed_seconds']
+            else:
+                features, classification, confidence, explanation = analyze_audio_bytes(
+                    audio_bytes, timings, mode=params['mode'], profile=params['profile'], vad=params['vad'],
+                    lookup=False)
+        finally:
+            if cached is None:
+                admission.release(cost, time.perf_counter() - analysis_start)
+        
+        # Prepare response
+        response = {
+            "classification": classification,
+            "confidence": confidence,
+            "explanation": explanation,
+            "language_support": ["Tamil", "English", "Hindi", "Malayalam", "Telugu"],
+            "profile": params['profile'],
+            "status": "success"
+        }
+        
+        if stream_details is not None:
+            response["stream"] = stream_details
+        
+        if params['vad']:
+            response["speech_activity"] = timings.get('speech_activity')
+        
+        record_first_request(time.perf_counter() - start)
+        
+        if DEBUG_TIMINGS:
+            timings['total'] = time.perf_counter() - start
+            response["timings"] = timings
+        
+        return jsonify(response), 200
+    
+    except RequestEntityTooLarge:
+        return payload_too_large()
+    
+    except Exception as e:
+        return jsonify({
+            "error": "Internal Server Error",
+            "message": f"Error processing request: {str(e)}"
+        }), 500
+
+@app.route('/jobs', methods=['POST'])
+def submit_detection_job():
+    """
+    Submit a clip for asynchronous detection
+    
+    Takes the same body as /detect and returns 202 with a job id straight
+    away; poll /jobs/<job_id> for the result. Returns 503 with Retry-After
+    when MAX_QUEUED_JOBS jobs are already pending, and 429 when the API key
+    is over its audio-seconds rate limit (cache hits are not charged).
+    """
+    
+    # Verify API key
+    if not verify_api_key():
+        return jsonify({
+            "error": "Unauthorized",
+            "message": "Invalid or missing API key"
+        }), 401
+    
+    try:
+        audio_bytes, params, error_response = read_audio_request({})
+        if error_response is not None:
+            return error_response
+        audio_bytes = bytes(audio_bytes)
+        mode = params['mode']
+        profile = params['profile']
+        vad = params['vad']
+        
+        version = detector_version(mode, profile, vad=vad)
+        if version is None:
+            return jsonify({
+                "error": "Service Unavailable",
+                "message": "ML model not trained"
+            }), 503
+        
+        # Repeated clips complete immediately from the cache
+        cache = get_cache()
+        key = cache_key(audio_bytes, version)
+        entry = cache.get(key) if cache is not None else None
+        if entry is not None:
+            job_id = complete_job(entry)
+        else:
+            # New work is charged to the key's audio-seconds budget; MAX_QUEUED_JOBS bounds it
+            api_key = request_api_key()
+            cost = admission_cost(audio_bytes, get_profile(profile))
+            try:
+                get_rate_limiter().take(api_key, cost)
+            except Rejected as e:
+                return service_busy(e)
+            
+            def store_result(result):
+                if cache is not None and result['features'] is not None:
+                    cache.set(key, result)
+            try:
+                job_id = submit_job(partial(score_audio_item, mode=mode, profile=profile, vad=vad),
+                                    audio_bytes, on_result=store_result)
+            except Exception:
+                get_rate_limiter().refund(api_key, cost)
+                raise
+            if job_id is None:
+                get_rate_limiter().refund(api_key, cost)
+        
+        if job_id is None:
+            response = jsonify({
+                "error": "Service Unavailable",
+                "message": "Job queue is full, retry later"
+            })
+            response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+            return response, 503
+        
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued" if entry is None else "done",
+            "poll_url": f"/jobs/{job_id}"
+        }), 202
+    
+    except RequestEntityTooLarge:
+        return payload_too_large()
+    
+    except Exception as e:
+        return jsonify({
+            "error": "Internal Server Error",
+            "message": f"Error processing request: {str(e)}"
+        }), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_detection_job(job_id):
+    """Poll an asynchronous detection job"""
+    
+    # Verify API key
+    if not verify_api_key():
+        return jsonify({
+            "error": "Unauthorized",
+            "message": "Invalid or missing API key"
+        }), 401
+    
+    job = get_job_store().get(job_id)
+    if job is None:
+        return jsonify({
+            "error": "Not Found",
+            "message": "Unknown or expired job id"
+        }), 404
+    
+    response = {
+        "job_id": job['job_id'],
+        "status": job['status'],
+        "created": job['created'],
+        "finished": job['finished']
+    }
+    if job['status'] == 'done':
+        result = job['result']
+        response.update({
+            "classification": result['classification'],
+            "confidence": result['confidence'],
+            "explanation": result['explanation'],
+            "language_support": ["Tamil", "English", "Hindi", "Malayalam", "Telugu"]
+        })
+        if result.get('speech_activity') is not None:
+            response["speech_activity"] = result['speech_activity']
+    elif job['status'] == 'failed':
+        response["error"] = job['error']
+    
+    return jsonify(response), 200
+
+@app.route('/detect/batch', methods=['POST'])
+def detect_voice_batch():
+    """
+    Batch detection endpoint
+    
+    Accepts JSON {"items": [{"id": ..., "audio": <base64>}, ...]} or a
+    multipart/form-data body with one or more 'audio' files. Items are
+    scored in parallel across the process pool and returned in input order;
+    a bad item gets an error entry without failing the batch.
+    
+    The items not served from the cache are charged to the API key's
+    audio-seconds rate limit and take one admission slot between them, sized
+    by their total audio (429 or 503 with Retry-After, as for /detect).
+    """
+    
+    # Verify API key
+    if not verify_api_key():
+        return jsonify({
+            "error": "Unauthorized",
+            "message": "Invalid or missing API key"
+        }), 401
+    
+    # Turn the request away before reading its body if the queue is already full
+    admission = get_admission()
+    try:
+        admission.check()
+    except Rejected as e:
+        return service_busy(e)
+    
+    try:
+        # Collect (id, audio bytes or None, error) per item
+        entries = []
+        mode = request.args.get('mode', 'rules')
+        profile = request.args.get('profile', DEFAULT_PROFILE)
+        vad = request.args.get('vad', VAD_DEFAULT)
+        if request.mimetype == 'multipart/form-data':
+            mode = request.form.get('mode', mode)
+            profile = request.form.get('profile', profile)
+            vad = request.form.get('vad', vad)
+            for upload in request.files.getlist('audio'):
+                audio_bytes = read_upload_stream(upload.stream)
+                if audio_bytes is None:
+                    entries.append((upload.filename, None, f"Audio exceeds {MAX_AUDIO_BYTES} bytes"))
+                else:
+                    entries.append((upload.filename, bytes(audio_bytes), None))
+        else:
+            data = request.get_json()
+            items = data.get('items') if isinstance(data, dict) else None
+            if not isinstance(items, list):
+                return jsonify({
+                    "error": "Bad Request",
+                    "message": "Missing 'items' list in request body"
+                }), 400
+            mode = data.get('mode', mode)
+            profile = data.get('profile', profile)
+            vad = data.get('vad', vad)
+            
+            for index, item in enumerate(items):
+                item_id = item.get('id', index) if isinstance(item, dict) else index
+                if not isinstance(item, dict) or 'audio' not in item:
+                    entries.append((item_id, None, "Missing 'audio' field"))
+                    continue
+                try:
+                    audio_bytes = base64.b64decode(item['audio'])
+                except Exception as e:
+                    entries.append((item_id, None, f"Invalid base64 encoding: {str(e)}"))
+                    continue
+                if not audio_bytes:
+                    entries.append((item_id, None, "Empty audio payload"))
+                elif len(audio_bytes) > MAX_AUDIO_BYTES:
+                    entries.append((item_id, None, f"Audio exceeds {MAX_AUDIO_BYTES} bytes"))
+                else:
+                    entries.append((item_id, audio_bytes, None))
+        
+        if not entries:
             return jsonify({
                 "error": "Bad Request",
-                "message": "Missing 'audio' field in request body"
+                "message": "No audio items in request"
             }), 400
         
-        audio_base64 = data['audio']
+        if len(entries) > MAX_BATCH_ITEMS:
+            return jsonify({
+                "error": "Bad Request",
+                "message": f"Batch has {len(entries)} items; the maximum is {MAX_BATCH_ITEMS}"
+            }), 400
         
-        # Decode base64 audio
-        try:
-            audio_bytes = base64.b64decode(audio_base64)
-        except Exception as e:
+        if mode not in DETECTION_MODES:
             return jsonify({
                 "error": "Bad Request",
-                "message": f"Invalid base64 encoding: {str(e)}"
+                "message": f"Unknown mode '{mode}'; expected one of {', '.join(DETECTION_MODES)}"
             }), 400
         
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-            tmp_file.write(audio_bytes)
-            tmp_path = tmp_file.name
+        if profile not in ANALYSIS_PROFILES:
+            return jsonify({
+                "error": "Bad Request",
+                "message": f"Unknown profile '{profile}'; expected one of {', '.join(ANALYSIS_PROFILES)}"
+            }), 400
         
-        try:
-            # Extract features
-            features = extract_audio_features(tmp_path)
-            
-            # Detect AI voice
-            classification, confidence, explanation = detect_ai_voice(features)
-            
-            # Prepare response
-            response = {
-                "classification": classification,
-                "confidence": confidence,
-                "explanation": explanation,
-                "language_support": ["Tamil", "English", "Hindi", "Malayalam", "Telugu"],
-                "status": "success"
-            }
-            
-            return jsonify(response), 200
+        vad = param_flag(vad)
+        version = detector_version(mode, profile, vad=vad)
+        if version is None:
+            return jsonify({
+                "error": "Service Unavailable",
+                "message": "ML model not trained"
+            }), 503
+        
+        # Serve repeated clips from the cache, fan the rest out across the process pool
+        cache = get_cache()
+        scored = {}
+        pending = []
+        for index, (_, audio_bytes, error) in enumerate(entries):
+            if error is not None:
+                continue
+            entry = cache.get(cache_key(audio_bytes, version)) if cache is not None else None
+            if entry is not None:
+                scored[index] = (entry, None)
+            else:
+                pending.append(index)
+        
+        # The batch fans out over the whole pool, so it holds one analysis slot for its total audio
+        cost = sum(admission_cost(entries[i][1], get_profile(profile)) for i in pending)
+        if pending:
+            api_key = request_api_key()
+            try:
+                get_rate_limiter().take(api_key, cost)
+                try:
+                    admission.acquire(cost)
+                except Rejected:
+                    get_rate_limiter().refund(api_key, cost)
+                    raise
+            except Rejected as e:
+                return service_busy(e)
         
+        score = partial(score_audio_item, mode=mode, profile=profile, vad=vad)
+        analysis_start = time.perf_counter()
+        try:
+            outcomes = map_ordered(score, [entries[i][1] for i in pending]) if pending else []
         finally:
-            # Clean up temp file
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+            if pending:
+                admission.release(cost, time.perf_counter() - analysis_start)
+        for index, (entry, error) in zip(pending, outcomes):
+            scored[index] = (entry, error)
+            if cache is not None and error is None and entry['features'] is not None:
+                cache.set(cache_key(entries[index][1], version), entry)
+        
+        results = []
+        for index, (item_id, _, error) in enumerate(entries):
+            if error is None:
+                entry, error = scored[index]
+            if error is not None:
+                result = {"status": "error", "error": error}
+            else:
+                result = {
+                    "classification": entry['classification'],
+                    "confidence": entry['confidence'],
+                    "explanation": entry['explanation'],
+                    "status": "success"
+                }
+                if entry.get('speech_activity') is not None:
+                    result["speech_activity"] = entry['speech_activity']
+            results.append({"index": index, "id": item_id, **result})
+        
+        return jsonify({
+            "results": results,
+            "count": len(results),
+            "failed": sum(1 for r in results if r["status"] != "success"),
+            "status": "success"
+        }), 200
+    
+    except RequestEntityTooLarge:
+        return jsonify({
+            "error": "Payload Too Large",
+            "message": f"Batch exceeds the maximum size of {MAX_BATCH_REQUEST_BYTES} bytes"
+        }), 413
     
     except Exception as e:
         return jsonify({
@@ -251,14 +885,227 @@ def detect_voice():
             "message": f"Error processing request: {str(e)}"
         }), 500
 
+def open_live_stream(options):
+    """
+    Create a LiveStream from JSON-style options and register it
+    
+    Returns (stream_id, stream, error_response).
+    """
+    try:
+        stream = LiveStream(
+            int(options.get('sample_rate', 16000)),
+            detect_ai_voice,
+            encoding=options.get('encoding', 'pcm_s16le'),
+            channels=int(options.get('channels', 1)),
+            verdict_seconds=float(options.get('verdict_seconds', LIVE_VERDICT_SECONDS)))
+    except (TypeError, ValueError) as e:
+        return None, None, bad_request(str(e))
+    
+    stream_id = get_live_store().open(stream)
+    if stream_id is None:
+        return None, None, (jsonify({
+            "error": "Service Unavailable",
+            "message": "Too many live streams are open; try again later"
+        }), 503, {"Retry-After": str(JOB_RETRY_AFTER)})
+    return stream_id, stream, None
+
+def push_live_chunk(stream, data):
+    """Feed one PCM chunk to a stream and build the response body"""
+    start = time.perf_counter()
+    received = stream.seconds
+    verdicts = stream.push(bytes(data))
+    seconds = stream.seconds
+    elapsed = time.perf_counter() - start
+    g.timings = {'live_chunk': elapsed, 'audio_seconds': seconds - received}
+    return {
+        "verdicts": verdicts,
+        "seconds": round(seconds, 3),
+        "processing_ms": elapsed * 1000
+    }
+
+def live_stream_not_found():
+    return jsonify({
+        "error": "Not Found",
+        "message": "Unknown or expired stream id"
+    }), 404
+
+@app.route('/live', methods=['POST'])
+def open_live():
+    """
+    Open a live detection stream
+    
+    JSON body (all optional): sample_rate (default 16000), encoding
+    (pcm_s16le or pcm_f32le), channels, verdict_seconds. PCM chunks are then
+    POSTed to /live/<stream_id> as raw bodies, and DELETE /live/<stream_id>
+    returns the final verdict.
+    """
+    
+    # Verify API key
+    if not verify_api_key():
+        return jsonify({
+            "error": "Unauthorized",
+            "message": "Invalid or missing API key"
+        }), 401
+    
+    stream_id, stream, error_response = open_live_stream(request.get_json(silent=True) or {})
+    if error_response is not None:
+        return error_response
+    
+    return jsonify({
+        "stream_id": stream_id,
+        "push_url": f"/live/{stream_id}",
+        "sample_rate": stream.sample_rate,
+        "encoding": stream.encoding,
+        "channels": stream.channels,
+        "verdict_seconds": stream.verdict_seconds
+    }), 201
+
+@app.route('/live/<stream_id>', methods=['POST'])
+def push_live(stream_id):
+    """Append a raw PCM chunk; returns any verdicts that became due"""
+    
+    # Verify API key
+    if not verify_api_key():
+        return jsonify({
+            "error": "Unauthorized",
+            "message": "Invalid or missing API key"
+        }), 401
+    
+    stream = get_live_store().get(stream_id)
+    if stream is None:
+        return live_stream_not_found()
+    
+    if request.content_length is not None and request.content_length > MAX_LIVE_CHUNK_BYTES:
+        return bad_request(f"Chunk exceeds {MAX_LIVE_CHUNK_BYTES} bytes; send smaller chunks")
+    data = read_upload_stream(request.stream, MAX_LIVE_CHUNK_BYTES)
+    if data is None:
+        return bad_request(f"Chunk exceeds {MAX_LIVE_CHUNK_BYTES} bytes; send smaller chunks")
+    
+    # The stream is loaded from and saved back to the shared store, so any worker can take the chunk;
+    # a chunk that fails is never saved and leaves the stream as it was
+    try:
+        body = push_live_chunk(stream, data)
+    except Exception as e:
+        return jsonify({
+            "error": "Internal Server Error",
+            "message": f"Error processing chunk: {str(e)}"
+        }), 500
+    
+    if not get_live_store().save(stream_id, stream):
+        return jsonify({
+            "error": "Conflict",
+            "message": "Another chunk for this stream was processed at the same time; send chunks in order, one at a time"
+        }), 409
+    return jsonify(body), 200
+
+@app.route('/live/<stream_id>', methods=['DELETE'])
+def close_live(stream_id):
+    """Close a live stream; returns the verdict over all audio received"""
+    
+    # Verify API key
+    if not verify_api_key():
+        return jsonify({
+            "error": "Unauthorized",
+            "message": "Invalid or missing API key"
+        }), 401
+    
+    stream = get_live_store().close(stream_id)
+    if stream is None:
+        return live_stream_not_found()
+    
+    if not stream.features.frames:
+        return bad_request("Not enough audio received for a verdict")
+    return jsonify(stream.close()), 200
+
+try:
+    # Optional WebSocket transport for /live (pip install flask-sock)
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
+if Sock is not None:
+    sock = Sock(app)
+    
+    @sock.route('/live/ws')
+    def live_socket(ws):
+        """
+        Live detection over one WebSocket
+        
+        The first message is the JSON options of POST /live; binary
+        messages are PCM chunks, answered with the same JSON as
+        POST /live/<id> when a verdict is due; a text message "close" returns
+        the final verdict and ends the stream.
+        """
+        if not verify_api_key():
+            ws.send(json.dumps({"error": "Unauthorized", "message": "Invalid or missing API key"}))
+            return
+        try:
+            options = json.loads(ws.receive() or '{}')
+        except ValueError:
+            options = None
+        if not isinstance(options, dict):
+            ws.send(json.dumps({"error": "Bad Request", "message": "First message must be a JSON object"}))
+            return
+        stream_id, stream, error_response = open_live_stream(options)
+        if error_response is not None:
+            ws.send(json.dumps(error_response[0].get_json()))
+            return
+        
+        try:
+            ws.send(json.dumps({"stream_id": stream_id, "verdict_seconds": stream.verdict_seconds}))
+            while True:
+                message = ws.receive()
+                if message is None or message == 'close':
+                    break
+                if isinstance(message, str) or len(message) > MAX_LIVE_CHUNK_BYTES:
+                    ws.send(json.dumps({"error": "Bad Request", "message": "Expected a binary PCM chunk"}))
+                    continue
+                body = push_live_chunk(stream, message)
+                # The connection holds the stream; saving keeps it counted and unexpired
+                get_live_store().save(stream_id, stream)
+                if body['verdicts']:
+                    ws.send(json.dumps(body))
+            if stream.features.frames:
+                ws.send(json.dumps(stream.close()))
+        finally:
+            get_live_store().close(stream_id)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_metrics(response):
+    """Count every request and feed /detect stage timings into the histograms"""
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    record_request(endpoint, request.method, response.status_code,
+                   request.content_length or 0, elapsed, g.get('timings'))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for this worker process"""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (503 until start-up warm-up has finished)"""
+    cache = get_cache()
+    ready = is_ready()
     return jsonify({
-        "status": "healthy",
+        "status": "healthy" if ready else "starting",
+        "ready": ready,
         "message": "AI Voice Detection API is running",
-        "version": "1.0.0"
-    }), 200
+        "version": "1.0.0",
+        "startup": startup_status(),
+        "cache": cache.stats() if cache is not None else {"backend": "off"},
+        "model": get_registry().status(),
+        "rules": {"version": RULES_VERSION, "thresholds_path": RULE_CONFIG.path},
+        "jobs": get_job_store().stats(),
+        "admission": get_admission().stats(),
+        "live_streams": get_live_store().stats()
+    }), 200 if ready else 503
 
 @app.route('/', methods=['GET'])
 def index():
@@ -269,12 +1116,58 @@ def index():
         "description": "Detects whether a voice sample is AI-generated or human",
         "supported_languages": ["Tamil", "English", "Hindi", "Malayalam", "Telugu"],
         "endpoints": {
-            "/detect": "POST - Main detection endpoint (requires API key)",
+            "/detect": "POST - Main detection endpoint (requires API key); JSON base64, raw binary or multipart body",
+            "/detect/batch": "POST - Score a list of audio items in parallel (requires API key)",
+            "/jobs": "POST - Submit a clip for asynchronous detection; returns a job id (requires API key)",
+            "/jobs/<job_id>": "GET - Poll an asynchronous detection job (requires API key)",
+            "/live": "POST - Open a live PCM stream; POST chunks to /live/<id>, DELETE it for the final verdict (requires API key)",
             "/health": "GET - Health check",
+            "/metrics": "GET - Prometheus metrics (per-stage latency histograms, request counters)",
             "/": "GET - API information"
         },
+        "detection_modes": list(DETECTION_MODES),
+        "analysis_profiles": describe_profiles(),
         "authentication": "API key required in 'Authorization' or 'X-API-Key' header"
     }), 200
 
+def warm_up_steps():
+    """Pipeline paths exercised on the synthetic clip before serving traffic"""
+    steps = [
+        (f"rules/{name}", partial(analyze_audio_bytes, use_cache=False, mode='rules', profile=name))
+        for name in ANALYSIS_PROFILES
+    ]
+    if get_registry().get() is not None:
+        steps.append(("ml", partial(analyze_audio_bytes, use_cache=False, mode='ml')))
+    steps.append(("stream", lambda audio_bytes: analyze_windows(
+        iter_audio_windows(audio_bytes, 1.0), detect_ai_voice)))
+    steps.append(("live", warm_up_live))
+    return steps
+
+def warm_up_live(audio_bytes):
+    """Push the clip through a LiveStream in 100 ms chunks (unpadded STFT path)"""
+    y, sr = decode_audio(audio_bytes)
+    stream = LiveStream(sr, detect_ai_voice, encoding='pcm_f32le', verdict_seconds=1.0)
+    pcm = y.astype('<f4').tobytes()
+    chunk = sr // 10 * 4
+    for start in range(0, len(pcm), chunk):
+        stream.push(pcm[start:start + chunk])
+    stream.close()
+
+def start_warm_up(background=False):
+    """
+    Compile librosa's kernels before serving traffic (or skip, with WARMUP_ON_START=0)
+    
+    Called by the server entry points (gunicorn.conf.py hooks, __main__),
+    never at import, so scripts that import app don't pay for it. In the
+    background, /health answers 503 "starting" until it has finished.
+    """
+    if not WARMUP_ON_START:
+        mark_ready(skipped=True)
+    elif background:
+        threading.Thread(target=warm_up, args=(warm_up_steps(),), name='warm-up', daemon=True).start()
+    else:
+        warm_up(warm_up_steps())
+
 if __name__ == '__main__':
+    start_warm_up(background=True)
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -5,78 +5,42 @@ This is an enhanced version using machine learning for better accuracy.
 To use this:
 1. Collect training data (AI and human voice samples)
 2. Run train_model() to create model.pkl
-3. Replace the detect_ai_voice() function in app.py with ml_detect_ai_voice()
+3. Call /detect with ?mode=ml (app.py serves the model through model_registry)
 
 Note: This requires training data which you'll need to collect.
 """
 
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
 import pickle
 import os
 
-def extract_ml_features(audio_path):
-    """Extract features optimized for ML model"""
+from compiled_forest import COMPILED_MODEL_PATH, export_compiled_model, source_digest
+from model_registry import MODEL_PATH, SCALER_PATH, get_registry
+
+def extract_ml_features(audio_path, feature_names=None):
+    """Extract features optimized for ML model (only feature_names, if given)"""
     import librosa
+    from feature_engine import compute_spectral_frames, frame_groups_for, ml_feature_vector
     
     y, sr = librosa.load(audio_path, sr=None)
     
-    features = []
-    
-    # Spectral features
-    spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-    features.extend([
-        np.mean(spectral_centroids),
-        np.std(spectral_centroids),
-        np.max(spectral_centroids),
-        np.min(spectral_centroids)
-    ])
-    
-    # MFCCs (more coefficients for ML)
-    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=20)
-    for i in range(20):
-        features.extend([
-            np.mean(mfccs[i]),
-            np.std(mfccs[i]),
-            np.max(mfccs[i]),
-            np.min(mfccs[i])
-        ])
-    
-    # Zero crossing rate
-    zcr = librosa.feature.zero_crossing_rate(y)[0]
-    features.extend([np.mean(zcr), np.std(zcr)])
-    
-    # RMS Energy
-    rms = librosa.feature.rms(y=y)[0]
-    features.extend([np.mean(rms), np.std(rms)])
-    
-    # Spectral rolloff
-    rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-    features.extend([np.mean(rolloff), np.std(rolloff)])
-    
-    # Spectral bandwidth
-    bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
-    features.extend([np.mean(bandwidth), np.std(bandwidth)])
-    
-    # Spectral flatness
-    flatness = librosa.feature.spectral_flatness(y=y)[0]
-    features.extend([np.mean(flatness), np.std(flatness)])
-    
-    # Chroma
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-    features.extend([np.mean(chroma), np.std(chroma)])
-    
-    # Tempo
-    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-    features.append(tempo)
-    
-    return np.array(features)
+    # One STFT shared by every spectral feature (same engine as app.py)
+    frames = compute_spectral_frames(y, sr, groups=frame_groups_for(feature_names))
+    
+    return ml_feature_vector(y, sr, frames, feature_names=feature_names)
 
-def train_model(training_data_folder):
+def train_model(training_data_folder, feature_store_path=None, feature_set_path=None):
     """
     Train ML model on collected data
     
+    Features are extracted in parallel (BATCH_WORKERS processes) and kept in
+    an on-disk feature store (default training_data/feature_store.npz), so
+    retraining only extracts files added or modified since the last run.
+    
+    If a pruned feature set exists (FEATURE_SET_PATH, written by
+    feature_profiler.py) the model is trained on those features only and
+    records their names, so serving extracts just that subset.
+    
     Expected folder structure:
     training_data/
         human/
@@ -89,39 +53,39 @@ def train_model(training_data_folder):
             ...
     """
     
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+    
+    from feature_engine import FEATURE_INDEX, ML_FEATURE_NAMES, ML_FEATURE_SCHEMA_VERSION
+    from feature_profiler import FEATURE_SET_PATH, load_feature_set
+    from feature_store import collect_labelled_files, extract_with_store
+    
     print("Loading training data...")
+    
+    # Collect labelled files: 0 = Human, 1 = AI
+    samples = collect_labelled_files(training_data_folder)
+    
+    # Reuse stored features for files unchanged since the last run
+    store_path = feature_store_path or os.path.join(training_data_folder, 'feature_store.npz')
+    vectors = extract_with_store([filepath for filepath, _ in samples], store_path,
+                                 ML_FEATURE_SCHEMA_VERSION, extract_ml_features)
+    
     X = []
     y = []
-    
-    # Load human samples
-    human_folder = os.path.join(training_data_folder, 'human')
-    for filename in os.listdir(human_folder):
-        if filename.endswith('.mp3') or filename.endswith('.wav'):
-            try:
-                filepath = os.path.join(human_folder, filename)
-                features = extract_ml_features(filepath)
-                X.append(features)
-                y.append(0)  # 0 = Human
-                print(f"Loaded human sample: {filename}")
-            except Exception as e:
-                print(f"Error loading {filename}: {e}")
-    
-    # Load AI samples
-    ai_folder = os.path.join(training_data_folder, 'ai')
-    for filename in os.listdir(ai_folder):
-        if filename.endswith('.mp3') or filename.endswith('.wav'):
-            try:
-                filepath = os.path.join(ai_folder, filename)
-                features = extract_ml_features(filepath)
-                X.append(features)
-                y.append(1)  # 1 = AI
-                print(f"Loaded AI sample: {filename}")
-            except Exception as e:
-                print(f"Error loading {filename}: {e}")
+    for filepath, label in samples:
+        if filepath in vectors:
+            X.append(vectors[filepath])
+            y.append(label)
     
     X = np.array(X)
     y = np.array(y)
     
+    # The store keeps full vectors; a pruned model sees only its columns
+    feature_names = load_feature_set(feature_set_path or FEATURE_SET_PATH)
+    if feature_names is not None:
+        X = X[:, [FEATURE_INDEX[name] for name in feature_names]]
+        print(f"\nUsing pruned feature set: {len(feature_names)} of {len(ML_FEATURE_NAMES)} features")
+    
     print(f"\nTraining on {len(X)} samples...")
     print(f"Human samples: {np.sum(y == 0)}")
     print(f"AI samples: {np.sum(y == 1)}")
@@ -142,63 +106,95 @@ def train_model(training_data_folder):
     
     model.fit(X_scaled, y)
     
-    print("\nTraining complete!")
+    # Record the schema the model was trained on (None = full ML_FEATURE_NAMES)
+    model.voice_feature_schema_version = ML_FEATURE_SCHEMA_VERSION
+    model.voice_feature_names = feature_names
     
-    # Save model and scaler
-    with open('model.pkl', 'wb') as f:
-        pickle.dump(model, f)
+    print("\nTraining complete!")
     
-    with open('scaler.pkl', 'wb') as f:
-        pickle.dump(scaler, f)
+    # Save model and scaler (write-then-rename, so a serving registry never
+    # reads a half-written file; the model goes last as it triggers the reload).
+    # The array export comes first so the reload finds it already in place.
+    model_bytes = pickle.dumps(model)
+    scaler_bytes = pickle.dumps(scaler)
+    export_compiled_model(model, scaler, COMPILED_MODEL_PATH, source_digest(model_bytes, scaler_bytes))
+    save_bytes_atomic(scaler_bytes, SCALER_PATH)
+    save_bytes_atomic(model_bytes, MODEL_PATH)
     
-    print("Model saved as model.pkl")
-    print("Scaler saved as scaler.pkl")
+    print(f"Model saved as {MODEL_PATH}")
+    print(f"Scaler saved as {SCALER_PATH}")
+    print(f"Compiled forest saved as {COMPILED_MODEL_PATH}")
     
     # Print feature importances
     importances = model.feature_importances_
     print("\nTop 10 most important features:")
     indices = np.argsort(importances)[::-1][:10]
+    names = feature_names or ML_FEATURE_NAMES
     for i, idx in enumerate(indices):
-        print(f"{i+1}. Feature {idx}: {importances[idx]:.4f}")
+        print(f"{i+1}. Feature {idx} ({names[idx]}): {importances[idx]:.4f}")
     
     return model, scaler
 
+def save_bytes_atomic(data, path):
+    """Write data to path via a temp file and rename"""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def ml_classify(features, bundle=None):
+    """
+    Classify one ML feature vector with the registry's current model
+    
+    The vector must hold the model's features in its order
+    (bundle.feature_names; the full ML_FEATURE_NAMES vector when None).
+    
+    Returns (classification, confidence, explanation) like detect_ai_voice.
+    """
+    bundle = bundle or get_registry().get()
+    if bundle is None:
+        return "HUMAN", 0.5, "ML model not trained. Using default classification."
+    
+    if bundle.compiled is not None:
+        # Flattened forest: same probabilities without sklearn's per-call overhead
+        probabilities = bundle.compiled.predict_proba(features)[0]
+        prediction = bundle.compiled.classes[np.argmax(probabilities)]
+    else:
+        features_scaled = bundle.scaler.transform(features.reshape(1, -1))
+        
+        # Predict
+        prediction = bundle.model.predict(features_scaled)[0]
+        probabilities = bundle.model.predict_proba(features_scaled)[0]
+    
+    if prediction == 1:  # AI
+        classification = "AI_GENERATED"
+        confidence = probabilities[1]
+        explanation = f"ML model detected AI voice with {confidence*100:.1f}% confidence based on spectral and temporal patterns"
+    else:  # Human
+        classification = "HUMAN"
+        confidence = probabilities[0]
+        explanation = f"ML model detected human voice with {confidence*100:.1f}% confidence based on natural variation patterns"
+    
+    return classification, round(confidence, 2), explanation
+
 def ml_detect_ai_voice(audio_path):
     """
     ML-based detection (replaces rule-based detection)
     
-    Use this function in app.py instead of detect_ai_voice()
+    Use this function in app.py instead of detect_ai_voice(). The model and
+    scaler come from the shared registry, so they are unpickled once per
+    process and hot-reloaded when model.pkl changes.
     """
     
     # Load model and scaler
-    if not os.path.exists('model.pkl') or not os.path.exists('scaler.pkl'):
+    bundle = get_registry().get()
+    if bundle is None:
         return "HUMAN", 0.5, "ML model not trained. Using default classification."
     
-    with open('model.pkl', 'rb') as f:
-        model = pickle.load(f)
-    
-    with open('scaler.pkl', 'rb') as f:
-        scaler = pickle.load(f)
-    
     try:
         # Extract features
-        features = extract_ml_features(audio_path)
-        features_scaled = scaler.transform(features.reshape(1, -1))
-        
-        # Predict
-        prediction = model.predict(features_scaled)[0]
-        probabilities = model.predict_proba(features_scaled)[0]
-        
-        if prediction == 1:  # AI
-            classification = "AI_GENERATED"
-            confidence = probabilities[1]
-            explanation = f"ML model detected AI voice with {confidence*100:.1f}% confidence based on spectral and temporal patterns"
-        else:  # Human
-            classification = "HUMAN"
-            confidence = probabilities[0]
-            explanation = f"ML model detected human voice with {confidence*100:.1f}% confidence based on natural variation patterns"
-        
-        return classification, round(confidence, 2), explanation
+        features = extract_ml_features(audio_path, bundle.feature_names)
+        return ml_classify(features, bundle)
     
     except Exception as e:
         return "HUMAN", 0.5, f"Error in ML detection: {str(e)}"
@@ -219,9 +215,10 @@ if __name__ == "__main__":
     print("3. Run:")
     print("   python app_ml.py")
     print()
-    print("4. Copy model.pkl and scaler.pkl to your deployment")
+    print("4. Copy model.pkl, scaler.pkl and model_arrays.bin to your deployment")
+    print("   (a running API picks up a new model.pkl without a restart)")
     print()
-    print("5. Update app.py to use ml_detect_ai_voice()")
+    print("5. Call /detect with ?mode=ml to use the ML detector")
     print()
     print("=" * 60)
     
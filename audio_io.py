@@ -0,0 +1,184 @@
+"""
+In-Memory Audio Decoding
+
+Decodes uploaded audio bytes without writing them to disk. The container is
+sniffed from its magic bytes; anything libsndfile can read (WAV, FLAC, OGG,
+AIFF and, with libsndfile >= 1.1, MP3) is decoded straight from a BytesIO
+buffer through soundfile. Only formats it cannot handle (e.g. M4A/AAC, WebM)
+fall back to a temporary file with the correct suffix and librosa/audioread.
+"""
+
+import io
+import os
+import tempfile
+import time
+
+import librosa
+import soundfile as sf
+
+from metrics import StageTimer
+
+# Container name -> (temp file suffix, libsndfile format name)
+FORMATS = {
+    'wav': ('.wav', 'WAV'),
+    'flac': ('.flac', 'FLAC'),
+    'ogg': ('.ogg', 'OGG'),
+    'aiff': ('.aiff', 'AIFF'),
+    'mp3': ('.mp3', 'MP3'),
+    'mp4': ('.m4a', None),
+    'webm': ('.webm', None),
+}
+
+SOUNDFILE_FORMATS = set(sf.available_formats())
+
+# Bitrate assumed for duration estimates of formats soundfile can't parse
+# (M4A/AAC, WebM); 128 kbit/s is typical for voice recordings
+ESTIMATE_BYTES_PER_SECOND = 16000
+
+
+def sniff_format(data):
+    """Identify the audio container from its leading magic bytes"""
+    head = bytes(data[:12])
+    if head[:4] in (b'RIFF', b'RF64') and head[8:12] == b'WAVE':
+        return 'wav'
+    if head[:4] == b'fLaC':
+        return 'flac'
+    if head[:4] == b'OggS':
+        return 'ogg'
+    if head[:4] == b'FORM' and head[8:12] in (b'AIFF', b'AIFC'):
+        return 'aiff'
+    if head[4:8] == b'ftyp':
+        return 'mp4'
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return 'webm'
+    # ID3 tag, or a bare MPEG audio frame sync
+    if head[:3] == b'ID3' or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return 'mp3'
+    return None
+
+
+def _decode_in_memory(data, sr, mono, duration=None, timings=None):
+    """Decode through soundfile from a memory buffer, as librosa.load would"""
+    timer = StageTimer(timings)
+    with sf.SoundFile(io.BytesIO(data)) as sound_file:
+        native_sr = sound_file.samplerate
+        frames = -1 if duration is None else int(duration * native_sr)
+        y = sound_file.read(frames=frames, dtype='float32', always_2d=False)
+    y = y.T
+    if mono:
+        y = librosa.to_mono(y)
+    timer.lap('decode_read')
+    if sr is not None and sr != native_sr:
+        y = librosa.resample(y, orig_sr=native_sr, target_sr=sr)
+        timer.lap('resample')
+        return y, sr
+    return y, native_sr
+
+
+def _decode_via_tempfile(data, sr, mono, suffix, duration=None, timings=None):
+    """Fallback for codecs that need a real file (audioread/ffmpeg)"""
+    timer = StageTimer(timings)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
+        tmp_file.write(data)
+        tmp_path = tmp_file.name
+    timer.lap('tempfile_write')
+    try:
+        result = librosa.load(tmp_path, sr=sr, mono=mono, duration=duration)
+        timer.lap('decode_read')
+        return result
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def decode_audio(data, sr=None, mono=True, timings=None, duration=None):
+    """
+    Decode audio bytes into a float32 signal
+
+    Returns (y, sr) exactly like librosa.load(path, sr=sr, mono=mono,
+    duration=duration); with a duration only that many seconds from the
+    start are read and resampled. If a timings dict is given, the decode
+    time in seconds is stored under 'decode' (split into 'decode_read',
+    'resample' and 'tempfile_write') and the path taken ('memory' or
+    'tempfile') under 'decode_path'.
+    """
+    start = time.perf_counter()
+    container = sniff_format(data)
+    suffix, sf_format = FORMATS.get(container, ('.mp3', None))
+
+    # Unrecognised containers still get a soundfile attempt, as librosa.load does
+    result = None
+    path = 'memory'
+    if container is None or sf_format in SOUNDFILE_FORMATS:
+        try:
+            result = _decode_in_memory(data, sr, mono, duration, timings)
+        except RuntimeError:
+            result = None
+    if result is None:
+        path = 'tempfile'
+        result = _decode_via_tempfile(data, sr, mono, suffix, duration, timings)
+
+    if timings is not None:
+        timings['decode'] = time.perf_counter() - start
+        timings['decode_path'] = path
+    return result
+
+
+def audio_duration(data):
+    """
+    Seconds of audio in data, from the container header without decoding
+
+    Formats soundfile can open report their exact length; anything else is
+    estimated from its size at ESTIMATE_BYTES_PER_SECOND.
+    """
+    container = sniff_format(data)
+    _, sf_format = FORMATS.get(container, ('.mp3', None))
+    if container is None or sf_format in SOUNDFILE_FORMATS:
+        try:
+            info = sf.info(io.BytesIO(data))
+            if info.frames > 0 and info.samplerate > 0:
+                return info.frames / info.samplerate
+        except RuntimeError:
+            pass
+    return len(data) / ESTIMATE_BYTES_PER_SECOND
+
+
+def iter_audio_windows(data, window_seconds, mono=True, sr=None, duration=None):
+    """
+    Yield (y, sr) windows of window_seconds from audio bytes
+
+    Formats soundfile can read are decoded one block at a time, so memory
+    stays bounded by the window size however long the recording is. Other
+    codecs are decoded in full and then sliced. sr resamples each window;
+    duration stops after that many seconds of input.
+    """
+    container = sniff_format(data)
+    _, sf_format = FORMATS.get(container, ('.mp3', None))
+
+    sound_file = None
+    if container is None or sf_format in SOUNDFILE_FORMATS:
+        try:
+            sound_file = sf.SoundFile(io.BytesIO(data))
+        except RuntimeError:
+            sound_file = None
+
+    if sound_file is not None:
+        with sound_file:
+            native_sr = sound_file.samplerate
+            blocksize = max(1, int(window_seconds * native_sr))
+            frames = -1 if duration is None else int(duration * native_sr)
+            for block in sound_file.blocks(blocksize=blocksize, frames=frames,
+                                           dtype='float32', always_2d=True):
+                y = block.T
+                if mono:
+                    y = librosa.to_mono(y)
+                if sr is not None and sr != native_sr:
+                    yield librosa.resample(y, orig_sr=native_sr, target_sr=sr), sr
+                else:
+                    yield y, native_sr
+        return
+
+    y, sr = decode_audio(data, sr=sr, mono=mono, duration=duration)
+    blocksize = max(1, int(window_seconds * sr))
+    for offset in range(0, y.shape[-1], blocksize):
+        yield y[..., offset:offset + blocksize], sr
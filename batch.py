@@ -0,0 +1,74 @@
+"""
+Process Pool for Batch Detection
+
+librosa feature extraction is CPU-bound and holds the GIL for much of its
+work, so /detect/batch fans clips out across a pool of worker processes
+(one per core by default) instead of threads. The pool is created lazily
+in each gunicorn worker on first use and rebuilt if a child process dies.
+"""
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1))
+
+_pool = None
+# Request threads share the pool; only one of them may create or replace it
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the shared process pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # fork lets children inherit the already-imported app and librosa
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+            else:
+                context = multiprocessing.get_context()
+            _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=context)
+        return _pool
+
+
+def shutdown_pool(pool=None):
+    """
+    Stop the pool's worker processes (a new pool is created on next use)
+
+    With pool, only if that is still the current pool: a broken pool seen
+    late must not take down the replacement another request already made.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and (pool is None or pool is _pool):
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def map_ordered(func, items):
+    """
+    Apply func to every item in the process pool, preserving input order
+
+    Returns a list of (result, error) pairs. An item that raises yields
+    (None, error message) without failing the rest of the batch.
+    """
+    pool = get_pool()
+    futures = [pool.submit(func, item) for item in items]
+
+    results = []
+    broken = False
+    for future in futures:
+        try:
+            results.append((future.result(), None))
+        except BrokenProcessPool as e:
+            broken = True
+            results.append((None, f"Worker process failed: {e}"))
+        except Exception as e:
+            results.append((None, str(e) or type(e).__name__))
+
+    if broken:
+        shutdown_pool(pool)
+    return results
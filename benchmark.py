@@ -0,0 +1,346 @@
+"""
+Detection Pipeline Benchmark
+
+Generates a deterministic corpus of synthetic clips (tones, noise and
+speech-like modulated signals at several lengths, sample rates and formats),
+times every pipeline stage on each clip, measures peak memory, and drives
+the Flask app in-process through its test client. Results are written as
+JSON so runs can be compared between commits:
+
+    python benchmark.py --output bench_before.json
+    ... change something ...
+    python benchmark.py --output bench_after.json --baseline bench_before.json
+
+With --baseline, any stage whose median time grew by more than --threshold
+(default 20%) is reported as a regression and the exit status is 1.
+"""
+
+import os
+import io
+import gc
+import sys
+import json
+import time
+import base64
+import shutil
+import tempfile
+import platform
+import argparse
+import resource
+import statistics
+import subprocess
+import tracemalloc
+
+# Benchmark the analysis itself, not cache hits
+os.environ.setdefault('RESULT_CACHE', 'off')
+
+import numpy as np
+import soundfile as sf
+
+# (kind, sample rate, seconds, format)
+CORPUS_SPEC = [
+    ('tone', 16000, 3, 'wav'),
+    ('tone', 44100, 10, 'flac'),
+    ('noise', 22050, 3, 'wav'),
+    ('noise', 16000, 10, 'ogg'),
+    ('speech', 16000, 3, 'wav'),
+    ('speech', 16000, 10, 'flac'),
+    ('speech', 22050, 3, 'ogg'),
+    ('speech', 22050, 30, 'wav'),
+    ('speech', 44100, 3, 'flac'),
+    ('speech', 44100, 10, 'wav'),
+    ('silence_heavy', 16000, 10, 'wav'),
+]
+QUICK_SPEC = [spec for spec in CORPUS_SPEC if spec[2] <= 3]
+
+FORMAT_SUBTYPES = {'wav': 'PCM_16', 'flac': 'PCM_16', 'ogg': 'VORBIS'}
+
+DEFAULT_THRESHOLD = 0.20
+DEFAULT_REPEATS = 3
+
+# Stages faster than this are timer noise and never flagged
+MIN_COMPARE_SECONDS = 0.001
+
+
+def synth_signal(kind, sr, seconds, seed=0):
+    """Deterministic float32 test signal of the given kind"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(sr * seconds)) / sr
+
+    if kind == 'tone':
+        y = 0.5 * np.sin(2 * np.pi * 220.0 * t)
+    elif kind == 'noise':
+        y = 0.1 * rng.standard_normal(len(t))
+    else:
+        # Harmonic source with drifting pitch and a syllable-rate envelope
+        f0 = 140.0 + 30.0 * np.sin(2 * np.pi * 0.7 * t)
+        phase = 2 * np.pi * np.cumsum(f0) / sr
+        y = sum(np.sin(k * phase) / k for k in range(1, 8))
+        y *= (0.5 + 0.5 * np.sin(2 * np.pi * 3.0 * t)) ** 2
+        y = 0.3 * y + 0.01 * rng.standard_normal(len(t))
+        if kind == 'silence_heavy':
+            # Speech only in the middle fifth, near-silence elsewhere
+            mask = np.zeros(len(t))
+            mask[2 * len(t) // 5:3 * len(t) // 5] = 1.0
+            y = y * mask + 0.0005 * rng.standard_normal(len(t))
+
+    return y.astype(np.float32)
+
+
+def generate_corpus(spec=CORPUS_SPEC, seed=0):
+    """List of clip dicts: name, encoded bytes, and generation parameters"""
+    corpus = []
+    for index, (kind, sr, seconds, fmt) in enumerate(spec):
+        y = synth_signal(kind, sr, seconds, seed + index)
+        buffer = io.BytesIO()
+        sf.write(buffer, y, sr, format=fmt.upper(), subtype=FORMAT_SUBTYPES[fmt])
+        corpus.append({
+            "name": f"{kind}_{sr}_{seconds}s.{fmt}",
+            "kind": kind,
+            "sample_rate": sr,
+            "seconds": seconds,
+            "format": fmt,
+            "bytes": buffer.getvalue(),
+        })
+    return corpus
+
+
+def time_call(func, repeats):
+    """Median / min / mean wall time of func() over repeats runs"""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "mean": statistics.fmean(samples),
+    }
+
+
+def peak_memory(func):
+    """Peak traced allocation (MB) during one func() call"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def clip_stages(app_module, clip, path, client, headers):
+    """(stage name, callable) pairs exercised for one clip"""
+    from app_ml import extract_ml_features
+    from audio_io import decode_audio
+    from model_registry import get_registry
+    from vad import trim_silence
+
+    data = clip["bytes"]
+    y, sr = decode_audio(data)
+    features = app_module.extract_signal_features(y, sr)
+    encoded = base64.b64encode(data).decode('utf-8')
+
+    stages = [
+        ("decode", lambda: decode_audio(data)),
+        ("extract_audio_features", lambda: app_module.extract_audio_features(path)),
+        ("rule_features", lambda: app_module.extract_signal_features(y, sr)),
+        # Silence trimming included in the timing, so the saving is net of its cost
+        ("rule_features_vad", lambda: app_module.extract_signal_features(trim_silence(y, sr)[0], sr)),
+        ("detect_ai_voice", lambda: app_module.detect_ai_voice(features)),
+        ("extract_ml_features", lambda: extract_ml_features(path)),
+        ("detect_binary", lambda: client.post(
+            '/detect', data=data, headers=headers, content_type='application/octet-stream')),
+        ("detect_base64", lambda: client.post('/detect', json={"audio": encoded}, headers=headers)),
+        ("detect_binary_vad", lambda: client.post(
+            '/detect?vad=1', data=data, headers=headers, content_type='application/octet-stream')),
+    ]
+    if get_registry().get() is not None:
+        stages.append(("detect_ml", lambda: client.post(
+            '/detect?mode=ml', data=data, headers=headers, content_type='application/octet-stream')))
+    return stages
+
+
+def trimmed_ratio(data):
+    """Share of a clip that silence trimming removes"""
+    from audio_io import decode_audio
+    from vad import trim_silence
+
+    y, sr = decode_audio(data)
+    return trim_silence(y, sr)[1]["trimmed_ratio"]
+
+
+def vad_savings(report):
+    """(clip, trimmed ratio, stage, ms without, ms with trimming) for the VAD stage pairs"""
+    rows = []
+    for name, clip in report["clips"].items():
+        for plain, trimmed in (("rule_features", "rule_features_vad"), ("detect_binary", "detect_binary_vad")):
+            stages = clip["stages"]
+            if plain in stages and trimmed in stages:
+                rows.append((name, clip.get("vad_trimmed_ratio", 0.0), plain,
+                             stages[plain]["median"] * 1000, stages[trimmed]["median"] * 1000))
+    return rows
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(spec=CORPUS_SPEC, repeats=DEFAULT_REPEATS, memory=True):
+    """Benchmark every stage on every clip; returns the JSON-ready report"""
+    start = time.perf_counter()
+    import app as app_module
+    import_seconds = time.perf_counter() - start
+
+    client = app_module.app.test_client()
+    headers = {'X-API-Key': app_module.API_KEY}
+    corpus = generate_corpus(spec)
+
+    clips = {}
+    totals = {}
+    workdir = tempfile.mkdtemp(prefix='voice-bench-')
+    try:
+        for clip in corpus:
+            path = os.path.join(workdir, clip["name"])
+            with open(path, 'wb') as f:
+                f.write(clip["bytes"])
+
+            stages = clip_stages(app_module, clip, path, client, headers)
+
+            # One untimed pass, which also checks the handler succeeds
+            for name, func in stages:
+                result = func()
+                if hasattr(result, 'status_code') and result.status_code != 200:
+                    raise RuntimeError(f"{name} returned {result.status_code} for {clip['name']}")
+
+            results = {}
+            for name, func in stages:
+                results[name] = time_call(func, repeats)
+                if memory:
+                    results[name]["peak_mb"] = peak_memory(func)
+                totals[name] = totals.get(name, 0.0) + results[name]["median"]
+
+            clips[clip["name"]] = {
+                "kind": clip["kind"],
+                "sample_rate": clip["sample_rate"],
+                "seconds": clip["seconds"],
+                "format": clip["format"],
+                "bytes": len(clip["bytes"]),
+                "vad_trimmed_ratio": trimmed_ratio(clip["bytes"]),
+                "stages": results,
+            }
+            print(f"{clip['name']:<28} " + "  ".join(
+                f"{name}={stage['median'] * 1000:.1f}ms" for name, stage in results.items()))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "librosa": __import__('librosa').__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeats": repeats,
+            "import_seconds": import_seconds,
+            # ru_maxrss is KB on Linux, bytes on macOS
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                          / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+        },
+        "clips": clips,
+        "totals": totals,
+    }
+
+
+def compare_reports(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Stage timings that got slower than baseline by more than threshold
+
+    Compares per-clip medians and the per-stage totals; returns a list of
+    regression dicts (empty when nothing regressed).
+    """
+    regressions = []
+
+    def check(clip, stage, new, old):
+        if max(new, old) >= MIN_COMPARE_SECONDS and new > old * (1 + threshold):
+            regressions.append({
+                "clip": clip,
+                "stage": stage,
+                "baseline": old,
+                "current": new,
+                "change": new / old - 1,
+            })
+
+    for clip, entry in current["clips"].items():
+        old_entry = baseline["clips"].get(clip)
+        if old_entry is None:
+            continue
+        for stage, timing in entry["stages"].items():
+            old_timing = old_entry["stages"].get(stage)
+            if old_timing is not None:
+                check(clip, stage, timing["median"], old_timing["median"])
+
+    for stage, total in current["totals"].items():
+        if stage in baseline["totals"]:
+            check("TOTAL", stage, total, baseline["totals"][stage])
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the voice detection pipeline")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to write the JSON report")
+    parser.add_argument('--baseline', help="Earlier report to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown flagged as a regression (0.2 = 20%%)")
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help="Timed runs per stage")
+    parser.add_argument('--quick', action='store_true', help="Only the short clips")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the peak-memory pass")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(QUICK_SPEC if args.quick else CORPUS_SPEC, args.repeats, not args.no_memory)
+
+    print()
+    print("Stage totals (sum of per-clip medians):")
+    for stage, total in report["totals"].items():
+        print(f"  {stage:<24} {total * 1000:9.1f} ms")
+
+    print()
+    print("Silence trimming (vad=1), median ms:")
+    for name, ratio, stage, plain, trimmed in vad_savings(report):
+        print(f"  {name:<28} {stage:<16} trimmed {ratio:4.0%}  {plain:8.1f} -> {trimmed:8.1f} "
+              f"({trimmed / max(plain, 1e-9) - 1:+.0%})")
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.threshold)
+        report["baseline"] = {"path": args.baseline, "git_revision": baseline["meta"].get("git_revision"),
+                              "threshold": args.threshold, "regressions": regressions}
+        print()
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for r in regressions:
+                print(f"  {r['clip']:<28} {r['stage']:<24} {r['baseline'] * 1000:.1f} -> "
+                      f"{r['current'] * 1000:.1f} ms (+{r['change']:.0%})")
+            status = 1
+        else:
+            print(f"No regressions over {args.threshold:.0%} against {args.baseline}")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,314 @@
+"""
+Offline Bulk Scoring
+
+Scores stored audio files without going through the HTTP API: no base64,
+no request overhead, files are read straight from disk and decoded in
+memory. Input is a directory (searched recursively for audio files) or a
+JSONL manifest with one {"path": ...} object per line (an "id" field is
+carried through, relative paths are taken from the manifest's folder).
+Files are scored across a process pool with the same pipeline as /detect
+and each result is appended to the output JSONL as soon as it finishes.
+
+The output doubles as the checkpoint: on restart, files that already have
+a result from the same detector version (mode, profile, rules and model
+version) are skipped, so a killed run picks up where it stopped. A line
+cut short by the kill is dropped. Use --retry-errors to rescore failures.
+
+    python bulk_score.py /data/calls --output scores.jsonl --mode ml --workers 4
+    python bulk_score.py manifest.jsonl --output scores.jsonl      # resumes if scores.jsonl exists
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.ogg', '.aiff', '.aif', '.m4a', '.webm')
+
+DEFAULT_OUTPUT = 'bulk_scores.jsonl'
+# Submitted-but-unfinished files per worker; keeps memory flat on huge inputs
+QUEUE_DEPTH = 4
+# fsync the output after this many results
+CHECKPOINT_EVERY = 100
+PROGRESS_SECONDS = 10.0
+# A file whose worker dies this many times is recorded as an error, not retried
+MAX_WORKER_DEATHS = 3
+
+
+def iter_directory(folder):
+    """(id, path) for every audio file under folder, in a stable order"""
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.lower().endswith(AUDIO_EXTENSIONS):
+                path = os.path.join(root, filename)
+                yield os.path.relpath(path, folder), path
+
+
+def iter_manifest(manifest_path, path_field='path', id_field='id'):
+    """(id, path) for each line of a JSONL manifest; a line may also be a bare JSON string path"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                print(f"Skipping {manifest_path}:{line_number}: invalid JSON ({e})")
+                continue
+            if isinstance(entry, str):
+                entry = {path_field: entry}
+            path = entry.get(path_field) if isinstance(entry, dict) else None
+            if not path:
+                print(f"Skipping {manifest_path}:{line_number}: no '{path_field}' field")
+                continue
+            yield str(entry.get(id_field, path)), os.path.join(base, path)
+
+
+def iter_inputs(source, path_field='path', id_field='id'):
+    if os.path.isdir(source):
+        return iter_directory(source)
+    return iter_manifest(source, path_field, id_field)
+
+
+def load_checkpoint(output_path, detector, retry_errors=False):
+    """
+    Ids already scored by this detector version in an existing output file
+
+    A trailing partial line (the process was killed mid-write) is cut off
+    so appended results start on a fresh line.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'rb+') as f:
+        valid_end = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            valid_end += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('detector') != detector:
+                continue
+            if record.get('status') == 'success' or not retry_errors:
+                done.add(record['id'])
+        f.truncate(valid_end)
+    return done
+
+
+def score_file(path, mode='rules', profile=None, include_features=False, vad=False):
+    """Score one file in a pool worker; returns the result fields"""
+    from app import score_audio_item
+
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        audio_bytes = f.read()
+    entry = score_audio_item(audio_bytes, mode=mode, profile=profile, vad=vad)
+    if entry['features'] is None:
+        raise ValueError("Could not decode or analyse audio")
+    result = {
+        "classification": entry['classification'],
+        "confidence": entry['confidence'],
+        "explanation": entry['explanation'],
+        "seconds": time.perf_counter() - start,
+    }
+    if entry.get('speech_activity') is not None:
+        result["speech_activity"] = entry['speech_activity']
+    if include_features:
+        result["features"] = entry['features']
+    return result
+
+
+def make_pool(workers):
+    # fork lets children inherit the imported app, warmed kernels (see main) and loaded model
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def run_bulk(inputs, output_path, detector, score, workers, checkpoint_every=CHECKPOINT_EVERY,
+             retry_errors=False):
+    """
+    Score every (id, path) in inputs not already in output_path
+
+    score(path) runs in the pool; results are appended to output_path as
+    they complete. Returns counts of scored, failed and skipped files.
+
+    If a worker process dies (killed for memory, a crashing decoder) the
+    pool is rebuilt and the files it had in flight are resubmitted. Files
+    caught in a second crash are rescored one at a time after the rest, so
+    a crash there has a single cause; a file that kills its worker
+    MAX_WORKER_DEATHS times is recorded as an error.
+    """
+    done = load_checkpoint(output_path, detector, retry_errors)
+    counts = {"scored": 0, "failed": 0, "skipped": 0}
+    start = time.perf_counter()
+    last_progress = start
+    pool = make_pool(workers)
+    running = {}
+    deaths = {}
+    suspects = []
+
+    def write(record):
+        out.write(json.dumps(record) + '\n')
+        if (counts["scored"] + counts["failed"]) % checkpoint_every == 0:
+            out.flush()
+            os.fsync(out.fileno())
+
+    def recover():
+        """Replace a broken pool; the files lost with it are scored again"""
+        nonlocal pool
+        lost = [running.pop(future) for future in list(running)
+                if not future.done() or isinstance(future.exception(), BrokenProcessPool)]
+        pool.shutdown(wait=False, cancel_futures=True)
+        pool = make_pool(workers)
+        print(f"  Worker process died; pool restarted, {len(lost)} files in flight rescheduled")
+        for item in lost:
+            deaths[item] = deaths.get(item, 0) + 1
+            if deaths[item] >= MAX_WORKER_DEATHS:
+                counts["failed"] += 1
+                write({"id": item[0], "path": item[1], "detector": detector, "status": "error",
+                       "error": f"Worker process died ({deaths[item]} attempts)"})
+            elif deaths[item] == 1:
+                running[pool.submit(score, item[1])] = item
+            else:
+                suspects.append(item)
+
+    def submit(item):
+        try:
+            running[pool.submit(score, item[1])] = item
+        except BrokenProcessPool:
+            recover()
+            running[pool.submit(score, item[1])] = item
+
+    def collect(finished):
+        broken = False
+        for future in finished:
+            item_id, path = running[future]
+            record = {"id": item_id, "path": path, "detector": detector}
+            try:
+                record.update(future.result())
+                record["status"] = "success"
+                counts["scored"] += 1
+            except BrokenProcessPool:
+                # No result: left in running for recover() to reschedule
+                broken = True
+                continue
+            except Exception as e:
+                record.update({"status": "error", "error": str(e) or type(e).__name__})
+                counts["failed"] += 1
+            del running[future]
+            write(record)
+        if broken:
+            recover()
+        # Lines are flushed as they finish so a kill loses at most the ones in flight
+        out.flush()
+
+    try:
+        with open(output_path, 'a') as out:
+            for item_id, path in inputs:
+                if item_id in done:
+                    counts["skipped"] += 1
+                    continue
+                # Duplicate ids in the input are scored once
+                done.add(item_id)
+                submit((item_id, path))
+                if len(running) >= workers * QUEUE_DEPTH:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    collect(finished)
+
+                now = time.perf_counter()
+                if now - last_progress >= PROGRESS_SECONDS:
+                    last_progress = now
+                    finished = counts["scored"] + counts["failed"]
+                    print(f"  {finished} scored ({counts['failed']} failed), {counts['skipped']} skipped, "
+                          f"{finished / (now - start):.1f} files/s")
+
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                collect(finished)
+
+            # Appended to by recover() while this runs
+            for item in suspects:
+                submit(item)
+                while running:
+                    finished, _ = wait(running)
+                    collect(finished)
+            os.fsync(out.fileno())
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+    counts["seconds"] = time.perf_counter() - start
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score stored audio files offline, resumably")
+    parser.add_argument('source', help="Folder of audio files, or a JSONL manifest of paths")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="Results JSONL (also the checkpoint)")
+    parser.add_argument('--mode', default='rules', help="rules, ml or hybrid")
+    parser.add_argument('--profile', help="Analysis profile (default: the API default)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--path-field', default='path', help="Manifest field holding the file path")
+    parser.add_argument('--id-field', default='id', help="Manifest field holding the result id")
+    parser.add_argument('--vad', action='store_true', help="Analyse speech regions only (silence trimmed)")
+    parser.add_argument('--include-features', action='store_true', help="Write extracted features too")
+    parser.add_argument('--retry-errors', action='store_true', help="Rescore files that failed before")
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY,
+                        help="Results between fsyncs of the output")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.source):
+        print(f"No {args.source} found.")
+        return 1
+
+    # The result cache would only fill up with entries nobody reads again
+    os.environ.setdefault('RESULT_CACHE', 'off')
+    from functools import partial
+    from app import DETECTION_MODES, detector_version
+    from model_registry import get_registry
+    from profiles import ANALYSIS_PROFILES, DEFAULT_PROFILE
+
+    if args.mode not in DETECTION_MODES:
+        print(f"Unknown mode '{args.mode}'; expected one of {', '.join(DETECTION_MODES)}")
+        return 1
+    profile = args.profile or DEFAULT_PROFILE
+    if profile not in ANALYSIS_PROFILES:
+        print(f"Unknown profile '{profile}'; expected one of {', '.join(ANALYSIS_PROFILES)}")
+        return 1
+    bundle = get_registry().get() if args.mode != 'rules' else None
+    if args.mode == 'ml' and bundle is None:
+        print("No trained model found; run python app_ml.py first.")
+        return 1
+
+    # Compile the kernels this run uses once here, not once per pool worker
+    from warmup import synthetic_clip
+    from app import score_audio_item
+    score_audio_item(synthetic_clip(), mode=args.mode, profile=profile, vad=args.vad)
+
+    detector = detector_version(args.mode, profile, bundle, args.vad)
+    print(f"Scoring {args.source} with {detector} on {args.workers} workers -> {args.output}")
+    score = partial(score_file, mode=args.mode, profile=profile, include_features=args.include_features,
+                    vad=args.vad)
+    counts = run_bulk(iter_inputs(args.source, args.path_field, args.id_field), args.output, detector,
+                      score, args.workers, args.checkpoint_every, args.retry_errors)
+
+    finished = counts["scored"] + counts["failed"]
+    print(f"\nScored {counts['scored']}, failed {counts['failed']}, skipped {counts['skipped']} already done "
+          f"in {counts['seconds']:.1f}s ({finished / max(counts['seconds'], 1e-9):.1f} files/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+Rule Threshold Calibration
+
+Tunes the thresholds of the rule-based detector (rule_engine.RULES) and its
+decision cut-off on labelled audio laid out like train_model expects:
+
+    training_data/
+        human/  *.mp3 / *.wav
+        ai/     *.mp3 / *.wav
+
+Rule features are extracted once into a feature store next to the data
+(rule_feature_store.npz), so re-running the search never decodes audio
+again unless files change. The search is coordinate descent: for one rule
+at a time, every candidate threshold is scored against all clips in a
+single vectorized pass while the other rules stay fixed.
+
+    python calibrate.py training_data --output thresholds.json
+
+writes the threshold config the API loads at startup (RULE_THRESHOLDS_PATH)
+and an accuracy / ROC report comparing it with the built-in defaults.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+from rule_engine import (DECISION_THRESHOLD, DEFAULT_THRESHOLDS, RULE_COLUMNS, RULES,
+                         fire_rules, rule_values, save_threshold_config)
+
+RULE_FEATURE_SCHEMA_VERSION = 'rules-v1'
+
+# Candidate thresholds per rule: this many quantiles of the observed values
+N_CANDIDATES = 64
+MAX_ROUNDS = 10
+DEFAULT_HOLDOUT = 0.2
+METRICS = ('accuracy', 'balanced_accuracy')
+
+
+def extract_rule_features(audio_path):
+    """Rule feature vector (RULE_COLUMNS order) for one file, as /detect computes it"""
+    import librosa
+    from feature_engine import compute_spectral_frames, rule_features
+
+    y, sr = librosa.load(audio_path, sr=None)
+    features = rule_features(y, sr, compute_spectral_frames(y, sr))
+    return np.array([features.get(column, 0) for column in RULE_COLUMNS], dtype=np.float64)
+
+
+def load_labelled_features(training_data_folder, feature_store_path=None):
+    """(feature matrix, labels, paths) for the labelled folders; 1 = AI"""
+    from feature_store import collect_labelled_files, extract_with_store
+
+    samples = collect_labelled_files(training_data_folder)
+    store_path = feature_store_path or os.path.join(training_data_folder, 'rule_feature_store.npz')
+    vectors = extract_with_store([path for path, _ in samples], store_path,
+                                 RULE_FEATURE_SCHEMA_VERSION, extract_rule_features)
+
+    kept = [(path, label) for path, label in samples if path in vectors]
+    matrix = np.array([vectors[path] for path, _ in kept]).reshape(len(kept), len(RULE_COLUMNS))
+    labels = np.array([label for _, label in kept], dtype=np.int8)
+    return matrix, labels, [path for path, _ in kept]
+
+
+def split_holdout(labels, fraction, seed=0):
+    """Stratified boolean mask selecting the holdout rows"""
+    rng = np.random.default_rng(seed)
+    holdout = np.zeros(len(labels), dtype=bool)
+    if fraction <= 0:
+        return holdout
+    for label in (0, 1):
+        rows = np.flatnonzero(labels == label)
+        n = int(round(len(rows) * fraction))
+        # Keep at least one training example per class
+        n = min(n, len(rows) - 1)
+        if n > 0:
+            holdout[rng.choice(rows, n, replace=False)] = True
+    return holdout
+
+
+def score_predictions(predictions, labels, metric):
+    """metric for every column of a (rows, candidates) prediction array"""
+    predictions = predictions.reshape(len(labels), -1)
+    positive = labels[:, None] == 1
+    tp = (predictions & positive).sum(axis=0)
+    tn = (~predictions & ~positive).sum(axis=0)
+    if metric == 'balanced_accuracy':
+        n_pos = max(int(positive.sum()), 1)
+        n_neg = max(len(labels) - int(positive.sum()), 1)
+        return (tp / n_pos + tn / n_neg) / 2
+    return (tp + tn) / len(labels)
+
+
+def decision_for(min_fired):
+    """Decision threshold under which min_fired or more rules mean AI"""
+    return (min_fired - 0.5) / len(RULES)
+
+
+def min_fired_for(decision_threshold):
+    """Smallest number of fired rules classified AI under decision_threshold"""
+    return int(np.floor(decision_threshold * len(RULES))) + 1
+
+
+def candidate_thresholds(values, current, n_candidates=N_CANDIDATES):
+    """Midpoints between quantiles of the observed values, plus the current threshold"""
+    quantiles = np.unique(np.quantile(values, np.linspace(0, 1, n_candidates)))
+    midpoints = (quantiles[:-1] + quantiles[1:]) / 2
+    edges = [quantiles[0] - 1e-9, quantiles[-1] + 1e-9] if len(quantiles) else []
+    return np.unique(np.concatenate([[current], midpoints, edges]))
+
+
+def calibrate(values, labels, metric='accuracy', start=None, max_rounds=MAX_ROUNDS):
+    """
+    Coordinate-descent search over rule thresholds and the decision cut-off
+
+    values is rule_values() of the training rows. Returns (thresholds,
+    decision_threshold, score, rounds).
+    """
+    thresholds = dict(start or DEFAULT_THRESHOLDS)
+    fired = fire_rules(values, thresholds)
+    min_fired = min_fired_for(DECISION_THRESHOLD)
+    best = score_predictions(fired.sum(axis=1) >= min_fired, labels, metric)[0]
+
+    rounds = 0
+    for rounds in range(1, max_rounds + 1):
+        improved = False
+        for j, rule in enumerate(RULES):
+            others = fired.sum(axis=1) - fired[:, j]
+            candidates = candidate_thresholds(values[:, j], thresholds[rule.name])
+            if rule.direction == '>':
+                candidate_fired = values[:, j][:, None] > candidates[None, :]
+            else:
+                candidate_fired = values[:, j][:, None] < candidates[None, :]
+            counts = others[:, None] + candidate_fired
+
+            for m in range(1, len(RULES) + 1):
+                scores = score_predictions(counts >= m, labels, metric)
+                index = int(np.argmax(scores))
+                if scores[index] > best + 1e-12:
+                    best = scores[index]
+                    thresholds[rule.name] = float(candidates[index])
+                    min_fired = m
+                    fired[:, j] = candidate_fired[:, index]
+                    improved = True
+        if not improved:
+            break
+
+    # Keep the default cut-off when it already selects the same rule count
+    if min_fired == min_fired_for(DECISION_THRESHOLD):
+        decision_threshold = DECISION_THRESHOLD
+    else:
+        decision_threshold = decision_for(min_fired)
+    return thresholds, decision_threshold, float(best), rounds
+
+
+def evaluate(values, labels, thresholds, decision_threshold):
+    """Accuracy, confusion matrix and ROC (score = number of fired rules)"""
+    counts = fire_rules(values, thresholds).sum(axis=1)
+    predictions = counts >= min_fired_for(decision_threshold)
+    positive = labels == 1
+
+    tp = int((predictions & positive).sum())
+    tn = int((~predictions & ~positive).sum())
+    fp = int((predictions & ~positive).sum())
+    fn = int((~predictions & positive).sum())
+    n_pos = max(tp + fn, 1)
+    n_neg = max(tn + fp, 1)
+
+    # One ROC point per possible cut-off on the fired-rule count
+    roc = []
+    for m in range(len(RULES) + 2):
+        flagged = counts >= m
+        roc.append({
+            "min_rules_fired": m,
+            "tpr": float((flagged & positive).sum() / n_pos),
+            "fpr": float((flagged & ~positive).sum() / n_neg),
+        })
+    fpr = np.array([point["fpr"] for point in roc][::-1])
+    tpr = np.array([point["tpr"] for point in roc][::-1])
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+    return {
+        "samples": int(len(labels)),
+        "accuracy": (tp + tn) / max(len(labels), 1),
+        "balanced_accuracy": (tp / n_pos + tn / n_neg) / 2,
+        "confusion": {"tp": tp, "tn": tn, "fp": fp, "fn": fn},
+        "roc_auc": auc,
+        "roc": roc,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the rule-based detector's thresholds")
+    parser.add_argument('training_data', nargs='?', default='training_data',
+                        help="Folder with human/ and ai/ subfolders")
+    parser.add_argument('--output', default='thresholds.json', help="Threshold config to write")
+    parser.add_argument('--report', default='calibration_report.json', help="Accuracy / ROC report to write")
+    parser.add_argument('--feature-store', help="Feature store path (default <training_data>/rule_feature_store.npz)")
+    parser.add_argument('--metric', choices=METRICS, default='accuracy', help="Objective to maximise")
+    parser.add_argument('--holdout', type=float, default=DEFAULT_HOLDOUT,
+                        help="Fraction of clips held out for evaluation (0 = fit on everything)")
+    parser.add_argument('--seed', type=int, default=0, help="Holdout split seed")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.training_data):
+        print(f"No {args.training_data} folder found.")
+        return 1
+
+    start = time.perf_counter()
+    matrix, labels, _ = load_labelled_features(args.training_data, args.feature_store)
+    if len(np.unique(labels)) < 2:
+        print("Need both human and AI samples to calibrate.")
+        return 1
+    print(f"Loaded {len(labels)} clips ({int(np.sum(labels == 0))} human, "
+          f"{int(np.sum(labels == 1))} AI) in {time.perf_counter() - start:.1f}s")
+
+    values = rule_values(matrix)
+    holdout = split_holdout(labels, args.holdout, args.seed)
+    train = ~holdout
+
+    start = time.perf_counter()
+    thresholds, decision_threshold, score, rounds = calibrate(values[train], labels[train], args.metric)
+    print(f"Search finished in {rounds} round(s), {time.perf_counter() - start:.2f}s: "
+          f"training {args.metric} {score:.3f}")
+
+    report = {
+        "training_data": args.training_data,
+        "metric": args.metric,
+        "holdout_fraction": args.holdout if holdout.any() else 0.0,
+        "calibrated": {"thresholds": thresholds, "decision_threshold": decision_threshold},
+        "defaults": {"thresholds": DEFAULT_THRESHOLDS, "decision_threshold": DECISION_THRESHOLD},
+        "results": {},
+    }
+    splits = [('train', train)] + ([('holdout', holdout)] if holdout.any() else [])
+    for name, rows in splits:
+        report["results"][name] = {
+            "defaults": evaluate(values[rows], labels[rows], DEFAULT_THRESHOLDS, DECISION_THRESHOLD),
+            "calibrated": evaluate(values[rows], labels[rows], thresholds, decision_threshold),
+        }
+
+    print()
+    print(f"{'split':<10}{'thresholds':<12}{'accuracy':>10}{'balanced':>10}{'ROC AUC':>10}")
+    for name, results in report["results"].items():
+        for which, result in results.items():
+            print(f"{name:<10}{which:<12}{result['accuracy']:>10.3f}"
+                  f"{result['balanced_accuracy']:>10.3f}{result['roc_auc']:>10.3f}")
+    print()
+    for rule in RULES:
+        print(f"  {rule.name:<22} {rule.direction} {DEFAULT_THRESHOLDS[rule.name]:>10g} -> "
+              f"{thresholds[rule.name]:.6g}")
+    print(f"  {'decision_threshold':<22}   {DECISION_THRESHOLD:>10g} -> {decision_threshold:.6g}")
+
+    save_threshold_config(args.output, thresholds, decision_threshold, extra={
+        "calibrated_at": time.time(),
+        "metric": args.metric,
+        "samples": int(len(labels)),
+    })
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nThresholds written to {args.output}; report written to {args.report}")
+    print("Restart the API (or set RULE_THRESHOLDS_PATH) to use them.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
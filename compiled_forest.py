@@ -0,0 +1,273 @@
+"""
+Array-Based RandomForest Inference
+
+Flattens the trained RandomForestClassifier and its StandardScaler into a
+handful of NumPy arrays (split features and thresholds, child indices,
+normalised leaf class fractions, one root per tree) and scores samples by
+walking every tree at once, one depth level per step. This skips sklearn's
+per-call input validation and joblib dispatch, which cost more than the
+trees themselves for a single clip.
+
+The arrays are written to one file (COMPILED_MODEL_PATH) laid out so each
+array can be opened with np.memmap: processes loading it share the same
+page-cache pages instead of each holding its own copy. Scores are identical
+to scaler.transform + model.predict_proba: inputs are scaled in float64,
+cast to float32 for the splits as sklearn does, and the per-tree
+probabilities are summed in tree order.
+
+    python compiled_forest.py        # export model.pkl / scaler.pkl and verify
+
+train_model exports automatically after training.
+"""
+
+import os
+import sys
+import json
+import hashlib
+
+import numpy as np
+
+COMPILED_MODEL_PATH = os.environ.get('COMPILED_MODEL_PATH', 'model_arrays.bin')
+
+MAGIC = b'VDFOREST'
+FORMAT_VERSION = 1
+# Array offsets are aligned to this many bytes
+ALIGNMENT = 64
+
+
+def source_digest(*blobs):
+    """Short hash identifying the pickled model/scaler an export was made from"""
+    digest = hashlib.sha256()
+    for blob in blobs:
+        digest.update(hashlib.sha256(blob).digest())
+    return digest.hexdigest()[:16]
+
+
+class CompiledForest:
+    """
+    Scaler plus forest as flat arrays
+
+    Nodes of all trees are concatenated; children holds each node's (left,
+    right) global node indices, -1 at leaves. value holds each node's class fractions already
+    normalised the way DecisionTreeClassifier.predict_proba normalises them.
+    """
+
+    ARRAYS = ('mean', 'scale', 'feature', 'threshold', 'children', 'missing_left',
+              'value', 'roots', 'classes', 'feature_importances')
+
+    # Rows scored per tree walk; keeps the working set cache-sized for big batches
+    CHUNK_ROWS = 256
+
+    def __init__(self, arrays, meta):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.max_depth = meta['max_depth']
+        self.source = meta.get('source')
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def memory_mapped(self):
+        return isinstance(self.value, np.memmap)
+
+    @property
+    def feature_importances_(self):
+        # Same attribute name as the sklearn model, for the feature profiler
+        return self.feature_importances
+
+    @classmethod
+    def from_sklearn(cls, model, scaler, source=None):
+        """Flatten a fitted RandomForestClassifier and StandardScaler"""
+        n_classes = len(model.classes_)
+        features, thresholds, children, missing, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            leaf = tree.children_left < 0
+            roots.append(offset)
+            # Leaves get feature 0 so indexing stays in bounds; they never compare
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            children.append(np.where(leaf[:, np.newaxis], -1,
+                                     np.stack([tree.children_left, tree.children_right], axis=1) + offset))
+            missing.append(np.asarray(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count)),
+                                      dtype=bool))
+
+            proba = tree.value[:, 0, :n_classes].copy()
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+            values.append(proba)
+
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        n_features = model.n_features_in_
+        mean = scaler.mean_ if getattr(scaler, 'with_mean', True) else None
+        scale = scaler.scale_ if getattr(scaler, 'with_std', True) else None
+        arrays = {
+            'mean': np.zeros(n_features) if mean is None else np.asarray(mean, dtype=np.float64),
+            'scale': np.ones(n_features) if scale is None else np.asarray(scale, dtype=np.float64),
+            'feature': np.concatenate(features).astype(np.int32),
+            'threshold': np.concatenate(thresholds).astype(np.float64),
+            'children': np.concatenate(children).astype(np.int32),
+            'missing_left': np.concatenate(missing),
+            'value': np.concatenate(values).astype(np.float64),
+            'roots': np.array(roots, dtype=np.int32),
+            'classes': np.asarray(model.classes_),
+            'feature_importances': np.asarray(model.feature_importances_, dtype=np.float64),
+        }
+        meta = {
+            'max_depth': int(max_depth),
+            'n_features': int(n_features),
+            'source': source,
+            'feature_names': getattr(model, 'voice_feature_names', None),
+        }
+        return cls(arrays, meta)
+
+    def scale_features(self, X):
+        """StandardScaler.transform, then the float32 cast the trees split on"""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(self.mean))
+        return ((X - self.mean) / self.scale).astype(np.float32)
+
+    def leaves(self, X_scaled):
+        """(samples, trees) leaf node index reached in every tree"""
+        n_samples = len(X_scaled)
+        nodes = np.repeat(self.roots[np.newaxis, :], n_samples, axis=0).ravel()
+        samples = np.repeat(np.arange(n_samples), self.n_trees)
+        has_missing = np.isnan(X_scaled).any()
+        # Only (sample, tree) walks still at an inner node are advanced each level
+        active = np.arange(len(nodes))
+        for _ in range(self.max_depth):
+            current = nodes[active]
+            inner = self.children[current, 0] >= 0
+            if not inner.all():
+                active, current = active[inner], current[inner]
+                if not len(active):
+                    break
+            x = X_scaled[samples[active], self.feature[current]]
+            # float32 inputs against float64 thresholds, as the Cython tree compares them
+            go_right = ~(x <= self.threshold[current])
+            if has_missing:
+                go_right &= ~(np.isnan(x) & self.missing_left[current])
+            nodes[active] = self.children[current, go_right.view(np.int8)]
+        return nodes.reshape(n_samples, self.n_trees)
+
+    def predict_proba(self, X):
+        """Class probabilities for unscaled feature rows, like scaler + model.predict_proba"""
+        X_scaled = self.scale_features(X)
+        proba = np.empty((len(X_scaled), self.value.shape[1]))
+        for start in range(0, len(X_scaled), self.CHUNK_ROWS):
+            values = self.value[self.leaves(X_scaled[start:start + self.CHUNK_ROWS])]
+            # Sequential sum over trees (cumsum), the order the forest accumulates in
+            proba[start:start + self.CHUNK_ROWS] = np.cumsum(values, axis=1)[:, -1] / self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def save(self, path):
+        """Write the arrays and metadata to one memory-mappable file (atomically)"""
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        layout = {}
+        with open(tmp_path, 'wb') as f:
+            # Preamble: magic, format version, offset of the JSON header (written last)
+            f.write(MAGIC + np.array([FORMAT_VERSION, 0], dtype='<u8').tobytes())
+            for name in self.ARRAYS:
+                array = np.ascontiguousarray(getattr(self, name))
+                f.write(b'\0' * (-f.tell() % ALIGNMENT))
+                layout[name] = {'offset': f.tell(), 'dtype': array.dtype.str, 'shape': list(array.shape)}
+                f.write(array.tobytes())
+            header_offset = f.tell()
+            f.write(json.dumps({'arrays': layout, 'meta': self.meta}).encode('utf-8'))
+            f.seek(len(MAGIC) + 8)
+            f.write(np.array([header_offset], dtype='<u8').tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open an exported file; arrays are read-only memory maps when mmap is true"""
+        with open(path, 'rb') as f:
+            preamble = f.read(len(MAGIC) + 16)
+            if preamble[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a compiled forest")
+            version, header_offset = np.frombuffer(preamble[len(MAGIC):], dtype='<u8')
+            if version != FORMAT_VERSION:
+                raise ValueError(f"{path} has format {version}, expected {FORMAT_VERSION}")
+            f.seek(int(header_offset))
+            header = json.loads(f.read().decode('utf-8'))
+
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            shape = tuple(spec['shape'])
+            if mmap and int(np.prod(shape)) > 0:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=spec['offset'], shape=shape)
+            else:
+                count = int(np.prod(shape))
+                arrays[name] = np.fromfile(path, dtype=dtype, count=count,
+                                           offset=spec['offset']).reshape(shape)
+        return cls(arrays, header['meta'])
+
+
+def export_compiled_model(model, scaler, path=COMPILED_MODEL_PATH, source=None):
+    """Flatten model + scaler and write them to path; returns the CompiledForest"""
+    compiled = CompiledForest.from_sklearn(model, scaler, source)
+    compiled.save(path)
+    return compiled
+
+
+def load_compiled_model(path=COMPILED_MODEL_PATH, source=None):
+    """
+    The exported forest at path, or None if missing, unreadable or stale
+
+    source is the digest of the pickles being served; an export made from
+    other pickles is ignored.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        compiled = CompiledForest.load(path)
+    except Exception as e:
+        print(f"Could not load compiled model from {path}: {e}")
+        return None
+    if source is not None and compiled.source != source:
+        print(f"Compiled model {path} was exported from a different model.pkl; ignoring it")
+        return None
+    return compiled
+
+
+def main():
+    import pickle
+    from model_registry import MODEL_PATH, SCALER_PATH
+
+    if not os.path.exists(MODEL_PATH) or not os.path.exists(SCALER_PATH):
+        print(f"No {MODEL_PATH} / {SCALER_PATH} found; train a model first (python app_ml.py).")
+        return 1
+    with open(MODEL_PATH, 'rb') as f:
+        model_bytes = f.read()
+    with open(SCALER_PATH, 'rb') as f:
+        scaler_bytes = f.read()
+    model = pickle.loads(model_bytes)
+    scaler = pickle.loads(scaler_bytes)
+
+    export_compiled_model(model, scaler, COMPILED_MODEL_PATH, source_digest(model_bytes, scaler_bytes))
+    compiled = CompiledForest.load(COMPILED_MODEL_PATH)
+    print(f"Exported {compiled.n_trees} trees ({len(compiled.feature)} nodes, depth {compiled.max_depth}) "
+          f"to {COMPILED_MODEL_PATH} ({os.path.getsize(COMPILED_MODEL_PATH) / 1024:.0f} KB)")
+
+    # Check against sklearn on points spread around the training distribution
+    rng = np.random.default_rng(0)
+    X = scaler.mean_ + rng.standard_normal((1000, len(compiled.mean))) * scaler.scale_ * 2
+    expected = model.predict_proba(scaler.transform(X))
+    mismatched = int(np.sum(np.any(compiled.predict_proba(X) != expected, axis=1)))
+    print(f"Verified on {len(X)} samples: {mismatched} differ from sklearn")
+    return 1 if mismatched else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
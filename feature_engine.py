@@ -0,0 +1,471 @@
+"""
+Shared Spectral Feature Engine
+
+Computes the STFT magnitude of a signal once and derives every spectral
+feature used by the rule-based detector (app.py) and the ML detector
+(app_ml.py) from it. Calling librosa.feature.* with y= makes each feature
+run its own STFT / mel spectrogram, which dominated per-request CPU time.
+
+Both detectors read a FeatureRecord: one float64 array laid out by the
+named FEATURE_SCHEMA (the ML vector's columns followed by the rule-only
+ones), so running both costs one extraction.
+
+ML features come in groups that share one computation (ML_FEATURE_GROUPS).
+A model trained on a pruned subset (see feature_profiler.py) only needs the
+frame features and stages of its groups, which frame_groups_for() lists
+for compute_spectral_frames(groups=...).
+"""
+
+import os
+
+import numpy as np
+import librosa
+from scipy.stats import kurtosis, skew
+
+from metrics import StageTimer
+
+# STFT parameters (librosa defaults, so results match the per-feature calls)
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MFCC = 20
+
+# Bump when ml_feature_vector's layout or computation changes; stored
+# training features from an older schema are then re-extracted
+ML_FEATURE_SCHEMA_VERSION = 'ml-v1'
+
+# Pitch stage: 'piptrack' (peaks of the shared STFT, default) or 'yin' (decimated signal)
+PITCH_METHOD = os.environ.get('PITCH_METHOD', 'piptrack')
+PIPTRACK_FMIN = 150.0
+PIPTRACK_FMAX = 4000.0
+PIPTRACK_THRESHOLD = 0.1
+YIN_SR = 8000
+YIN_FMIN = 65.0
+YIN_FMAX = 500.0
+YIN_FRAME_LENGTH = 256
+# YIN frames whose best period is more aperiodic than this (normalized difference) are unvoiced
+YIN_VOICING_THRESHOLD = 0.25
+YIN_TROUGH_THRESHOLD = 0.1
+
+# Columns of ml_feature_vector by the computation that produces them, in order
+ML_FEATURE_GROUPS = {
+    'spectral_centroid': tuple(f'spectral_centroid_{stat}' for stat in ('mean', 'std', 'max', 'min')),
+    'mfcc': tuple(f'mfcc_{i}_{stat}' for i in range(N_MFCC) for stat in ('mean', 'std', 'max', 'min')),
+    **{name: (f'{name}_mean', f'{name}_std') for name in (
+        'zcr', 'rms', 'spectral_rolloff', 'spectral_bandwidth', 'spectral_flatness', 'chroma')},
+    'tempo': ('tempo',),
+}
+ML_FEATURE_NAMES = tuple(name for columns in ML_FEATURE_GROUPS.values() for name in columns)
+ML_FEATURE_GROUP = {name: group for group, columns in ML_FEATURE_GROUPS.items() for name in columns}
+
+# Per-frame features compute_spectral_frames can produce, and which of them
+# each ML feature group reads (tempo's onset envelope comes from the mel spectrogram)
+FRAME_GROUPS = ('spectral_centroid', 'spectral_rolloff', 'spectral_bandwidth', 'spectral_flatness',
+                'chroma', 'mel', 'mfcc', 'zcr', 'rms')
+ML_GROUP_FRAMES = {'mfcc': ('mel', 'mfcc'), 'tempo': ('mel',)}
+
+# rule_features keys that the ML vector does not already hold
+RULE_ONLY_FEATURE_NAMES = ('pitch_mean', 'pitch_std', 'pitch_range', 'duration',
+                           'audio_kurtosis', 'audio_skew')
+
+FEATURE_SCHEMA = ML_FEATURE_NAMES + RULE_ONLY_FEATURE_NAMES
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_SCHEMA)}
+
+
+def ml_feature_groups(feature_names=None):
+    """ML feature groups holding feature_names (all groups for None), in schema order"""
+    if feature_names is None:
+        return tuple(ML_FEATURE_GROUPS)
+    unknown = [name for name in feature_names if name not in ML_FEATURE_GROUP]
+    if unknown:
+        raise ValueError(f"Unknown ML features: {', '.join(unknown)}")
+    wanted = {ML_FEATURE_GROUP[name] for name in feature_names}
+    return tuple(group for group in ML_FEATURE_GROUPS if group in wanted)
+
+
+def frame_groups_for(feature_names=None):
+    """Frame groups compute_spectral_frames needs for these ML features (None = all)"""
+    if feature_names is None:
+        return None
+    needed = set()
+    for group in ml_feature_groups(feature_names):
+        needed.update(ML_GROUP_FRAMES.get(group, (group,)))
+    return tuple(group for group in FRAME_GROUPS if group in needed)
+
+
+def compute_spectral_frames(y, sr, n_fft=N_FFT, hop_length=HOP_LENGTH, timings=None, groups=None,
+                            center=True):
+    """
+    Compute frame-level features from a single STFT
+
+    Returns a dict of per-frame arrays. 'magnitude' is the |STFT| the
+    spectral features were derived from, kept so later stages (pitch,
+    tempo) can reuse it instead of transforming the signal again; 'n_fft'
+    and 'hop_length' record the framing it was computed with. If a timings
+    dict is given, each step's seconds are added under 'feature_<step>'.
+    groups limits the work to those FRAME_GROUPS (None computes all).
+    center=False frames y without padding its ends, so consecutive chunks of
+    a live stream give the frames of one continuous STFT.
+    """
+    wanted = set(FRAME_GROUPS if groups is None else groups)
+    if 'mfcc' in wanted:
+        wanted.add('mel')
+    timer = StageTimer(timings)
+    S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length, center=center))
+    S_power = S ** 2
+    timer.lap('feature_stft')
+
+    frames = {'magnitude': S, 'n_fft': n_fft, 'hop_length': hop_length}
+
+    if wanted & {'spectral_centroid', 'spectral_bandwidth'}:
+        # Bandwidth is measured around the centroid, so it reuses it
+        centroid = librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=n_fft, hop_length=hop_length)
+        frames['spectral_centroid'] = centroid[0]
+    if 'spectral_rolloff' in wanted:
+        frames['spectral_rolloff'] = librosa.feature.spectral_rolloff(
+            S=S, sr=sr, n_fft=n_fft, hop_length=hop_length)[0]
+    if 'spectral_bandwidth' in wanted:
+        frames['spectral_bandwidth'] = librosa.feature.spectral_bandwidth(
+            S=S, sr=sr, n_fft=n_fft, hop_length=hop_length, centroid=centroid)[0]
+    if 'spectral_flatness' in wanted:
+        frames['spectral_flatness'] = librosa.feature.spectral_flatness(
+            S=S, n_fft=n_fft, hop_length=hop_length)[0]
+    timer.lap('feature_spectral')
+    if 'chroma' in wanted:
+        frames['chroma'] = librosa.feature.chroma_stft(
+            S=S_power, sr=sr, n_fft=n_fft, hop_length=hop_length)
+    timer.lap('feature_chroma')
+
+    # MFCCs go through the same power spectrogram via the mel filterbank
+    if 'mel' in wanted:
+        mel = librosa.feature.melspectrogram(S=S_power, sr=sr, n_fft=n_fft, hop_length=hop_length)
+        frames['mel_db'] = librosa.power_to_db(mel)
+    if 'mfcc' in wanted:
+        frames['mfcc'] = librosa.feature.mfcc(S=frames['mel_db'], sr=sr, n_mfcc=N_MFCC)
+    timer.lap('feature_mel_mfcc')
+
+    # Time-domain features are cheap and don't need the STFT
+    if 'zcr' in wanted:
+        frames['zcr'] = librosa.feature.zero_crossing_rate(
+            y, frame_length=n_fft, hop_length=hop_length, center=center)[0]
+    if 'rms' in wanted:
+        frames['rms'] = librosa.feature.rms(y=y, frame_length=n_fft, hop_length=hop_length, center=center)[0]
+    timer.lap('feature_zcr_rms')
+
+    return frames
+
+
+def pitch_values(frames, sr, fmin=PIPTRACK_FMIN, fmax=PIPTRACK_FMAX, threshold=PIPTRACK_THRESHOLD):
+    """
+    Per-frame dominant pitch (Hz) from the shared STFT, piptrack-equivalent
+
+    Reproduces librosa.piptrack followed by a per-frame argmax over the
+    magnitudes, but only over the fmin..fmax band (plus one neighbouring
+    bin on each side for the gradient and local-max tests) and with array
+    operations instead of a Python loop over frames.
+    """
+    S = frames['magnitude']
+    n_fft = frames['n_fft']
+    if S.shape[1] == 0:
+        return S[0, :0]
+
+    fft_freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    band = np.flatnonzero((max(fmin, 0) <= fft_freqs) & (fft_freqs < min(fmax, float(sr) / 2)))
+    if band.size == 0:
+        return S[0, :0]
+    lo, hi = band[0], band[-1] + 1
+
+    # Band with one neighbour either side; interior rows are the band itself
+    Sb = S[lo - 1:hi + 1]
+    centre = Sb[1:-1]
+
+    # Parabolic interpolation around every band bin (librosa's stencil)
+    a = Sb[2:] + Sb[:-2] - 2 * centre
+    b = (Sb[2:] - Sb[:-2]) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(np.abs(b) >= np.abs(a), 0, -b / a).astype(S.dtype)
+    avg = (Sb[2:] - Sb[:-2]) / 2.0
+    mags = centre + 0.5 * avg * shift
+
+    # Local maxima of the thresholded spectrum, threshold relative to the frame max
+    ref_value = threshold * S.max(axis=0)
+    Sb_thr = Sb * (Sb > ref_value)
+    peaks = (Sb_thr[1:-1] > Sb_thr[:-2]) & (Sb_thr[1:-1] >= Sb_thr[2:])
+    mags = np.where(peaks, mags, 0)
+
+    # Strongest peak per frame; frames without a positive peak have no pitch
+    cols = np.arange(S.shape[1])
+    best = mags.argmax(axis=0)
+    voiced = mags[best, cols] > 0
+    pitch = ((lo + best + shift[best, cols]) * float(sr) / n_fft).astype(S.dtype)
+    pitch = pitch[voiced]
+    return pitch[pitch > 0]
+
+
+def yin_track(y, sr, fmin=YIN_FMIN, fmax=YIN_FMAX, frame_length=YIN_FRAME_LENGTH,
+              hop_length=YIN_FRAME_LENGTH // 2, trough_threshold=YIN_TROUGH_THRESHOLD):
+    """
+    Per-frame (f0, aperiodicity) by YIN
+
+    Same frames, period search and parabolic refinement as librosa.yin,
+    but also returns each frame's cumulative mean normalized difference at
+    the chosen period: near 0 for a periodic frame, near 1 for noise.
+    librosa.yin discards it, and librosa.pyin (which keeps a voicing
+    decision) costs hundreds of times more.
+    """
+    win_length = frame_length // 2
+    min_period = int(np.floor(sr / fmax))
+    max_period = min(int(np.ceil(sr / fmin)), frame_length - win_length - 1)
+
+    y = np.pad(y, frame_length // 2)
+    frames = librosa.util.frame(y, frame_length=frame_length, hop_length=hop_length)
+
+    # Difference function from the autocorrelation and windowed energies
+    a = np.fft.rfft(frames, frame_length, axis=0)
+    b = np.fft.rfft(frames[win_length:0:-1], frame_length, axis=0)
+    acf = np.fft.irfft(a * b, frame_length, axis=0)[win_length:]
+    acf[np.abs(acf) < 1e-6] = 0
+    energy = np.cumsum(frames ** 2, axis=0)
+    energy = energy[win_length:] - energy[:-win_length]
+    energy[np.abs(energy) < 1e-6] = 0
+    diff = energy[:1] + energy - 2 * acf
+
+    # Cumulative mean normalization over the searched periods
+    cumulative_mean = np.cumsum(diff[1:max_period + 1], axis=0) / np.arange(1, max_period + 1)[:, None]
+    denominator = cumulative_mean[min_period - 1:max_period]
+    cmnd = diff[min_period:max_period + 1] / (denominator + np.finfo(denominator.dtype).tiny)
+
+    # First trough under the threshold, else the global minimum
+    trough = np.zeros(cmnd.shape, dtype=bool)
+    trough[1:-1] = (cmnd[1:-1] < cmnd[:-2]) & (cmnd[1:-1] <= cmnd[2:])
+    trough[0] = cmnd[0] < cmnd[1]
+    trough[-1] = cmnd[-1] < cmnd[-2]
+    below = trough & (cmnd < trough_threshold)
+    period = np.where(below.any(axis=0), below.argmax(axis=0), cmnd.argmin(axis=0))
+
+    cols = np.arange(cmnd.shape[1])
+    aperiodicity = cmnd[period, cols]
+    # Parabolic refinement around the chosen lag (none at the ends)
+    inner = (period > 0) & (period < len(cmnd) - 1)
+    left = cmnd[np.maximum(period - 1, 0), cols]
+    right = cmnd[np.minimum(period + 1, len(cmnd) - 1), cols]
+    curve = right + left - 2 * aperiodicity
+    slope = (right - left) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(inner & (np.abs(slope) < np.abs(curve)), -slope / curve, 0)
+    f0 = sr / (min_period + period + shift)
+    return f0, aperiodicity
+
+
+def yin_pitch_values(y, sr, fmin=YIN_FMIN, fmax=YIN_FMAX, target_sr=YIN_SR):
+    """
+    Per-frame pitch (Hz) from YIN on a decimated copy of the signal
+
+    Needs no full-rate STFT since the signal is analysed at target_sr, and
+    tracks the fundamental rather than the strongest harmonic. A frame is
+    voiced when its YIN aperiodicity is under YIN_VOICING_THRESHOLD (noise
+    and silence are not) and its energy is at least 10% of the peak
+    frame's, mirroring piptrack's relative threshold.
+    """
+    if sr > target_sr:
+        y = librosa.resample(y, orig_sr=sr, target_sr=target_sr)
+        sr = target_sr
+    if len(y) < YIN_FRAME_LENGTH:
+        return np.zeros(0, dtype=np.float32)
+
+    f0, aperiodicity = yin_track(y, sr, fmin, fmax)
+    rms = librosa.feature.rms(y=y, frame_length=YIN_FRAME_LENGTH,
+                              hop_length=YIN_FRAME_LENGTH // 2)[0]
+    n = min(len(f0), len(rms))
+    voiced = (aperiodicity[:n] < YIN_VOICING_THRESHOLD) & (rms[:n] > PIPTRACK_THRESHOLD * rms.max())
+    return f0[:n][voiced].astype(np.float32)
+
+
+def pitch_track(y, sr, frames, method=None):
+    """
+    Per-frame pitch values (Hz) of voiced frames
+
+    method is 'piptrack' (default, matches the original extraction) or
+    'yin'; when omitted the PITCH_METHOD environment setting is used.
+    """
+    method = method or PITCH_METHOD
+    if method == 'piptrack':
+        return pitch_values(frames, sr)
+    if method == 'yin':
+        return yin_pitch_values(y, sr)
+    raise ValueError(f"Unknown pitch method: {method}")
+
+
+def pitch_statistics(y, sr, frames, method=None):
+    """Pitch stage: pitch_mean, pitch_std and pitch_range for detect_ai_voice"""
+    values = pitch_track(y, sr, frames, method)
+
+    if len(values):
+        return {
+            'pitch_mean': np.mean(values),
+            'pitch_std': np.std(values),
+            'pitch_range': np.max(values) - np.min(values),
+        }
+    return {'pitch_mean': 0, 'pitch_std': 0, 'pitch_range': 0}
+
+
+def rule_features(y, sr, frames, pitch_method=None, timings=None):
+    """Build the named feature dict used by app.detect_ai_voice"""
+    timer = StageTimer(timings)
+    features = {}
+
+    # 1. Spectral Features
+    features['spectral_centroid_mean'] = np.mean(frames['spectral_centroid'])
+    features['spectral_centroid_std'] = np.std(frames['spectral_centroid'])
+    features['spectral_rolloff_mean'] = np.mean(frames['spectral_rolloff'])
+    features['spectral_bandwidth_mean'] = np.mean(frames['spectral_bandwidth'])
+    features['spectral_bandwidth_std'] = np.std(frames['spectral_bandwidth'])
+
+    # 2. MFCCs
+    mfccs = frames['mfcc']
+    for i in range(min(13, mfccs.shape[0])):
+        features[f'mfcc_{i}_mean'] = np.mean(mfccs[i])
+        features[f'mfcc_{i}_std'] = np.std(mfccs[i])
+
+    # 3. Zero Crossing Rate
+    features['zcr_mean'] = np.mean(frames['zcr'])
+    features['zcr_std'] = np.std(frames['zcr'])
+
+    # 4. Energy and RMS
+    features['rms_mean'] = np.mean(frames['rms'])
+    features['rms_std'] = np.std(frames['rms'])
+
+    # 5. Pitch and Harmonics
+    timer.lap('feature_stats')
+    features.update(pitch_statistics(y, sr, frames, method=pitch_method))
+    timer.lap('feature_pitch')
+
+    # 6. Temporal Features
+    features['duration'] = len(y) / sr
+
+    # 7. Spectral Flatness
+    features['spectral_flatness_mean'] = np.mean(frames['spectral_flatness'])
+    features['spectral_flatness_std'] = np.std(frames['spectral_flatness'])
+
+    # 8. Chroma features
+    features['chroma_mean'] = np.mean(frames['chroma'])
+    features['chroma_std'] = np.std(frames['chroma'])
+
+    # 9. Statistical measures
+    features['audio_kurtosis'] = kurtosis(y)
+    features['audio_skew'] = skew(y)
+    timer.lap('feature_stats')
+
+    return features
+
+
+def ml_group_values(group, y, sr, frames):
+    """Values of one ML feature group, in ML_FEATURE_GROUPS[group] order"""
+    if group == 'tempo':
+        # Onset envelope from the shared log-mel spectrogram
+        hop_length = frames['hop_length']
+        onset_env = librosa.onset.onset_strength(
+            S=frames['mel_db'], sr=sr, n_fft=frames['n_fft'], hop_length=hop_length, aggregate=np.median)
+        tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+        # librosa >= 0.10.2 returns tempo as a 1-element array
+        return [float(np.atleast_1d(tempo)[0])]
+
+    if group == 'spectral_centroid':
+        centroid = frames['spectral_centroid']
+        return [np.mean(centroid), np.std(centroid), np.max(centroid), np.min(centroid)]
+
+    if group == 'mfcc':
+        # More coefficients for ML
+        mfccs = frames['mfcc']
+        values = []
+        for i in range(N_MFCC):
+            values.extend([np.mean(mfccs[i]), np.std(mfccs[i]), np.max(mfccs[i]), np.min(mfccs[i])])
+        return values
+
+    # Zero crossing rate, RMS energy, rolloff, bandwidth, flatness, chroma
+    return [np.mean(frames[group]), np.std(frames[group])]
+
+
+def ml_feature_vector(y, sr, frames, timings=None, feature_names=None):
+    """
+    Build the unnamed feature vector used by the app_ml model
+
+    feature_names selects (and orders) a subset of ML_FEATURE_NAMES, for a
+    model trained on a pruned feature set; only the groups holding those
+    features are computed, so frames only needs frame_groups_for() them.
+    """
+    timer = StageTimer(timings)
+    values = {}
+
+    for group in ml_feature_groups(feature_names):
+        if group == 'tempo':
+            timer.lap('feature_stats')
+        values.update(zip(ML_FEATURE_GROUPS[group], ml_group_values(group, y, sr, frames)))
+        if group == 'tempo':
+            timer.lap('feature_tempo')
+    timer.lap('feature_stats')
+
+    return np.array([values[name] for name in (feature_names or ML_FEATURE_NAMES)])
+
+
+class FeatureRecord:
+    """
+    Named, array-backed features of one clip
+
+    values is a float64 array in FEATURE_SCHEMA order; features that were
+    not computed (e.g. tempo for a rules-only analysis) are NaN. get() and
+    'in' behave like the rule feature dict, so detect_ai_voice reads a
+    record directly, and ml_vector() is exactly ml_feature_vector's output.
+    dtype is the precision the frame features were computed in.
+    """
+
+    __slots__ = ('values', 'dtype')
+
+    def __init__(self, values=None, dtype=np.float64):
+        if values is None:
+            values = np.full(len(FEATURE_SCHEMA), np.nan)
+        self.values = values
+        self.dtype = dtype
+
+    def __contains__(self, name):
+        index = FEATURE_INDEX.get(name)
+        return index is not None and not np.isnan(self.values[index])
+
+    def __bool__(self):
+        return not np.all(np.isnan(self.values))
+
+    def get(self, name, default=None):
+        return float(self.values[FEATURE_INDEX[name]]) if name in self else default
+
+    def has_ml(self, feature_names=None):
+        return not np.any(np.isnan(self.ml_vector(feature_names)))
+
+    def ml_vector(self, feature_names=None):
+        """ML features in model order (ML_FEATURE_NAMES, or a pruned model's feature_names)"""
+        if feature_names is None:
+            return self.values[:len(ML_FEATURE_NAMES)].copy()
+        return self.values[[FEATURE_INDEX[name] for name in feature_names]]
+
+    def to_dict(self):
+        """Computed features as {name: float}"""
+        return {name: float(value) for name, value in zip(FEATURE_SCHEMA, self.values)
+                if not np.isnan(value)}
+
+
+def feature_record(y, sr, frames, rules=True, ml=True, pitch_method=None, timings=None,
+                   ml_features=None):
+    """
+    FeatureRecord from shared frames, with the rule and/or ML features
+
+    The expensive stages each run once: pitch only for rules, tempo only
+    for ML; the frame statistics both need come from the same frames.
+    ml_features limits the ML part to a pruned model's features.
+    """
+    record = FeatureRecord(dtype=frames['magnitude'].dtype)
+    if ml:
+        columns = [FEATURE_INDEX[name] for name in (ml_features or ML_FEATURE_NAMES)]
+        record.values[columns] = ml_feature_vector(y, sr, frames, timings=timings,
+                                                   feature_names=ml_features)
+    if rules:
+        for name, value in rule_features(y, sr, frames, pitch_method, timings=timings).items():
+            record.values[FEATURE_INDEX[name]] = value
+    return record
@@ -0,0 +1,254 @@
+"""
+Feature Cost Profiler
+
+Measures what each ML feature group (feature_engine.ML_FEATURE_GROUPS: the
+columns one computation produces, e.g. the 80 MFCC statistics or the single
+beat_track tempo) costs to compute across the training corpus, and weighs
+it against what the trained RandomForest gets out of it: the model's
+feature_importances_ summed over the group's columns. Groups that cost the
+most per unit of importance are dropped until the importance given up would
+exceed --max-importance-loss, and the remaining features are written as a
+feature set:
+
+    python feature_profiler.py training_data --output feature_set.json
+    python app_ml.py        # retrains on the pruned features
+
+train_model picks the set up from FEATURE_SET_PATH and stores the feature
+names in the model, so the API then extracts and scores only that subset.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+FEATURE_SET_PATH = os.environ.get('FEATURE_SET_PATH', 'feature_set.json')
+
+DEFAULT_MAX_IMPORTANCE_LOSS = 0.05
+# Clips timed per run; enough for stable per-group costs without decoding everything
+DEFAULT_LIMIT = 50
+
+
+def load_feature_set(path=FEATURE_SET_PATH):
+    """
+    Pruned ML feature names from a feature set file, or None for all features
+
+    A missing file means the full vector; an invalid one (unknown features,
+    or written for another ML_FEATURE_SCHEMA_VERSION) is reported and
+    ignored.
+    """
+    from feature_engine import ML_FEATURE_GROUP, ML_FEATURE_NAMES, ML_FEATURE_SCHEMA_VERSION
+
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            config = json.load(f)
+        if config.get('schema_version') != ML_FEATURE_SCHEMA_VERSION:
+            raise ValueError(f"schema {config.get('schema_version')}, expected {ML_FEATURE_SCHEMA_VERSION}")
+        names = set(config['features'])
+        unknown = names - set(ML_FEATURE_GROUP)
+        if unknown:
+            raise ValueError(f"unknown features {', '.join(sorted(unknown))}")
+        if not names:
+            raise ValueError("no features")
+    except Exception as e:
+        print(f"Could not load feature set from {path}, using all features: {e}")
+        return None
+    # Always in schema order, whatever order the file lists them in
+    return tuple(name for name in ML_FEATURE_NAMES if name in names)
+
+
+def save_feature_set(path, feature_names, extra=None):
+    """Write a feature set that load_feature_set accepts"""
+    from feature_engine import ML_FEATURE_SCHEMA_VERSION
+
+    config = {
+        "schema_version": ML_FEATURE_SCHEMA_VERSION,
+        "features": list(feature_names),
+        **(extra or {}),
+    }
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def group_costs(y, sr):
+    """
+    Seconds each ML feature group takes on one signal, beyond the shared STFT
+
+    Each group is computed on its own with the frame features it reads, so
+    a shared intermediate (the mel spectrogram behind both the MFCCs and the
+    tempo) is charged to every group that needs it.
+    """
+    from feature_engine import ML_FEATURE_GROUPS, compute_spectral_frames, frame_groups_for, ml_group_values
+
+    costs = {}
+    for group, columns in ML_FEATURE_GROUPS.items():
+        timings = {}
+        start = time.perf_counter()
+        frames = compute_spectral_frames(y, sr, timings=timings, groups=frame_groups_for(columns))
+        ml_group_values(group, y, sr, frames)
+        costs[group] = time.perf_counter() - start - timings['feature_stft']
+    return costs
+
+
+def extraction_seconds(y, sr, feature_names=None):
+    """Seconds for the whole ML extraction (STFT included) with feature_names only"""
+    from feature_engine import compute_spectral_frames, frame_groups_for, ml_feature_vector
+
+    start = time.perf_counter()
+    frames = compute_spectral_frames(y, sr, groups=frame_groups_for(feature_names))
+    ml_feature_vector(y, sr, frames, feature_names=feature_names)
+    return time.perf_counter() - start
+
+
+def profile_costs(paths, repeats=1):
+    """
+    Per-group compute seconds summed over the clips (best of repeats per clip)
+
+    Returns (costs, audio_seconds, full_extraction_seconds).
+    """
+    import librosa
+
+    costs = {}
+    audio_seconds = 0.0
+    full_seconds = 0.0
+    for index, path in enumerate(paths):
+        y, sr = librosa.load(path, sr=None)
+        if index == 0:
+            # Untimed pass so librosa's lazily compiled kernels don't count
+            group_costs(y, sr)
+        runs = [group_costs(y, sr) for _ in range(repeats)]
+        for group in runs[0]:
+            costs[group] = costs.get(group, 0.0) + min(run[group] for run in runs)
+        full_seconds += min(extraction_seconds(y, sr) for _ in range(repeats))
+        audio_seconds += len(y) / sr
+    return costs, audio_seconds, full_seconds
+
+
+def group_importances(model, feature_names=None):
+    """The model's feature_importances_ summed per ML feature group"""
+    from feature_engine import ML_FEATURE_GROUP, ML_FEATURE_GROUPS, ML_FEATURE_NAMES
+
+    importances = {group: 0.0 for group in ML_FEATURE_GROUPS}
+    for name, importance in zip(feature_names or ML_FEATURE_NAMES, model.feature_importances_):
+        importances[ML_FEATURE_GROUP[name]] += float(importance)
+    return importances
+
+
+def select_groups(costs, importances, max_importance_loss=DEFAULT_MAX_IMPORTANCE_LOSS, keep=(), drop=()):
+    """
+    Groups to keep: drop the most expensive per unit of importance first
+
+    Groups in drop are always dropped and those in keep always kept; the
+    rest are dropped in order of importance / cost as long as the total
+    importance given up stays within max_importance_loss. At least one
+    group is always kept.
+    """
+    dropped = [group for group in costs if group in drop and group not in keep]
+    lost = sum(importances[group] for group in dropped)
+
+    candidates = [group for group in costs if group not in keep and group not in dropped]
+    candidates.sort(key=lambda group: importances[group] / max(costs[group], 1e-9))
+    for group in candidates:
+        if len(dropped) == len(costs) - 1:
+            break
+        if lost + importances[group] > max_importance_loss:
+            continue
+        dropped.append(group)
+        lost += importances[group]
+
+    kept = [group for group in costs if group not in dropped]
+    return kept, dropped, lost
+
+
+def main(argv=None):
+    from feature_engine import ML_FEATURE_GROUP, ML_FEATURE_GROUPS, ML_FEATURE_NAMES
+    from feature_store import collect_labelled_files
+    from model_registry import get_registry
+
+    parser = argparse.ArgumentParser(description="Profile ML feature cost against importance and prune")
+    parser.add_argument('training_data', nargs='?', default='training_data',
+                        help="Folder with human/ and ai/ subfolders")
+    parser.add_argument('--output', default=FEATURE_SET_PATH, help="Feature set to write")
+    parser.add_argument('--max-importance-loss', type=float, default=DEFAULT_MAX_IMPORTANCE_LOSS,
+                        help="Total RandomForest importance the dropped groups may hold (0.05 = 5%%)")
+    parser.add_argument('--keep', action='append', default=[], choices=list(ML_FEATURE_GROUPS),
+                        help="Feature group to keep regardless (repeatable)")
+    parser.add_argument('--drop', action='append', default=[], choices=list(ML_FEATURE_GROUPS),
+                        help="Feature group to drop regardless (repeatable)")
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT, help="Clips to time (0 = all)")
+    parser.add_argument('--repeats', type=int, default=1, help="Timed runs per clip (best is kept)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.training_data):
+        print(f"No {args.training_data} folder found.")
+        return 1
+    bundle = get_registry().load()
+    if bundle is None:
+        print("No trained model found; run python app_ml.py first.")
+        return 1
+
+    paths = [path for path, _ in collect_labelled_files(args.training_data)]
+    if args.limit:
+        # Spread the timed clips over both classes rather than taking the first folder
+        paths = paths[::max(1, len(paths) // args.limit)][:args.limit]
+    if not paths:
+        print("No audio files found.")
+        return 1
+
+    print(f"Timing {len(ML_FEATURE_GROUPS)} feature groups on {len(paths)} clips...")
+    costs, audio_seconds, full_seconds = profile_costs(paths, args.repeats)
+    importances = group_importances(bundle.model, bundle.feature_names)
+    kept, dropped, lost = select_groups(costs, importances, args.max_importance_loss, args.keep, args.drop)
+    feature_names = [name for name in ML_FEATURE_NAMES if ML_FEATURE_GROUP[name] in kept]
+
+    # Measure the pruned extraction rather than trusting the per-group sum
+    import librosa
+    pruned_seconds = 0.0
+    for path in paths:
+        y, sr = librosa.load(path, sr=None)
+        pruned_seconds += min(extraction_seconds(y, sr, feature_names) for _ in range(args.repeats))
+
+    total_cost = sum(costs.values()) or 1.0
+    print()
+    print(f"{'group':<20}{'features':>9}{'ms/audio s':>12}{'cost':>8}{'importance':>12}  kept")
+    for group in sorted(costs, key=costs.get, reverse=True):
+        print(f"{group:<20}{len(ML_FEATURE_GROUPS[group]):>9}"
+              f"{costs[group] / audio_seconds * 1000:>12.2f}{costs[group] / total_cost:>8.1%}"
+              f"{importances[group]:>12.3f}  {'yes' if group in kept else 'no'}")
+    print()
+    print(f"Keeping {len(feature_names)} of {len(ML_FEATURE_NAMES)} features; dropped groups hold "
+          f"{lost:.1%} of the model's importance")
+    print(f"ML extraction: {full_seconds:.2f}s -> {pruned_seconds:.2f}s for {audio_seconds:.0f}s of audio "
+          f"({1 - pruned_seconds / max(full_seconds, 1e-9):.0%} faster)")
+
+    save_feature_set(args.output, feature_names, extra={
+        "profiled_at": time.time(),
+        "model_version": bundle.version,
+        "clips": len(paths),
+        "audio_seconds": audio_seconds,
+        "max_importance_loss": args.max_importance_loss,
+        "dropped_groups": dropped,
+        "importance_lost": lost,
+        "extraction_seconds": {"full": full_seconds, "pruned": pruned_seconds},
+        "groups": {
+            group: {
+                "features": len(ML_FEATURE_GROUPS[group]),
+                "seconds": costs[group],
+                "importance": importances[group],
+                "kept": group in kept,
+            }
+            for group in costs
+        },
+    })
+    print(f"\nFeature set written to {args.output}")
+    print("Retrain (python app_ml.py) to use it; the new model records its feature list.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
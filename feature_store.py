@@ -0,0 +1,110 @@
+"""
+On-Disk Feature Store for Training
+
+Persists extracted ML feature vectors in a single .npz file keyed by file
+path, modification time and size, tagged with the feature-schema version.
+train_model and the threshold calibration only re-extract files that are
+new or changed since the last run; bumping the schema version invalidates
+the whole store.
+"""
+
+import os
+
+import numpy as np
+
+
+def file_signature(path):
+    """(mtime_ns, size) used to detect changed training files"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_feature_store(store_path, schema_version):
+    """
+    Load the store as {path: (mtime_ns, size, vector)}
+
+    Returns an empty dict if the file is missing, unreadable, or was written
+    with a different feature schema.
+    """
+    if not os.path.exists(store_path):
+        return {}
+    try:
+        with np.load(store_path, allow_pickle=False) as data:
+            if str(data['schema_version']) != schema_version:
+                print(f"Feature store schema changed ({data['schema_version']} -> {schema_version}); rebuilding")
+                return {}
+            return {
+                str(path): (int(mtime), int(size), vector)
+                for path, mtime, size, vector in zip(
+                    data['paths'], data['mtimes'], data['sizes'], data['features'])
+            }
+    except Exception as e:
+        print(f"Could not read feature store {store_path}: {e}; rebuilding")
+        return {}
+
+
+def save_feature_store(store_path, schema_version, entries):
+    """Write {path: (mtime_ns, size, vector)} atomically to store_path"""
+    paths = sorted(entries)
+    if paths:
+        features = np.vstack([entries[p][2] for p in paths])
+    else:
+        features = np.zeros((0, 0))
+
+    tmp_path = f"{store_path}.tmp.{os.getpid()}.npz"
+    np.savez(
+        tmp_path,
+        schema_version=np.array(schema_version),
+        paths=np.array(paths, dtype=str),
+        mtimes=np.array([entries[p][0] for p in paths], dtype=np.int64),
+        sizes=np.array([entries[p][1] for p in paths], dtype=np.int64),
+        features=features,
+    )
+    os.replace(tmp_path, store_path)
+
+
+def collect_labelled_files(training_data_folder):
+    """(path, label) for the .mp3/.wav files in human/ (0) and ai/ (1)"""
+    samples = []
+    for label, subfolder in ((0, 'human'), (1, 'ai')):
+        folder = os.path.join(training_data_folder, subfolder)
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith('.mp3') or filename.endswith('.wav'):
+                samples.append((os.path.join(folder, filename), label))
+    return samples
+
+
+def extract_with_store(paths, store_path, schema_version, extract):
+    """
+    Feature vectors for paths as {path: vector}, extracting only what the store lacks
+
+    extract(path) runs across the process pool for new or changed files;
+    files that fail are reported and left out. The store is rewritten when
+    anything was extracted.
+    """
+    from batch import map_ordered
+
+    store = load_feature_store(store_path, schema_version)
+    entries = {}
+    pending = []
+    for path in paths:
+        signature = file_signature(path)
+        cached = store.get(path)
+        if cached is not None and cached[:2] == signature:
+            entries[path] = cached
+        else:
+            pending.append((path, signature))
+    print(f"Feature store: {len(entries)} cached, {len(pending)} new or changed")
+
+    # Extract the rest in parallel across cores
+    if pending:
+        extracted = map_ordered(extract, [path for path, _ in pending])
+        for (path, signature), (features, error) in zip(pending, extracted):
+            if error is not None:
+                print(f"Error loading {os.path.basename(path)}: {error}")
+                continue
+            entries[path] = (*signature, features)
+            print(f"Extracted: {path}")
+        save_feature_store(store_path, schema_version, entries)
+
+    return {path: entry[2] for path, entry in entries.items()}
@@ -0,0 +1,20 @@
+"""
+Gunicorn Hooks
+
+Runs the start-up warm-up (warmup.py) from the server rather than at
+import. With --preload (the Procfile) the master warms up before forking
+the workers, which then share the compiled kernels; without it each worker
+warms up in the background and /health reports 503 until it is done.
+"""
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app import start_warm_up
+        start_warm_up()
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        from app import start_warm_up
+        start_warm_up(background=True)
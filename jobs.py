@@ -0,0 +1,202 @@
+"""
+Asynchronous Detection Jobs
+
+/jobs accepts a clip, returns a job id immediately and runs the analysis on
+the local process pool, so long uploads don't hold a gunicorn worker for
+the whole analysis. Job state lives in a SQLite file rather than process
+memory, so a poll can land on any gunicorn worker; no broker is needed.
+
+The number of queued + running jobs is bounded (MAX_QUEUED_JOBS), finished
+jobs expire after JOB_RESULT_TTL seconds, and jobs still queued, or still
+running, JOB_TIMEOUT seconds after they were queued or started (their
+worker vanished) are failed. A timed-out job is not started late.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+from batch import get_pool, shutdown_pool
+
+JOBS_DB_PATH = os.environ.get('JOBS_DB_PATH', 'jobs.sqlite3')
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_JOBS', 32))
+JOB_RESULT_TTL = float(os.environ.get('JOB_RESULT_TTL', 900))
+JOB_TIMEOUT = float(os.environ.get('JOB_TIMEOUT', 600))
+
+
+class JobStore:
+    """Job rows (id, status, timestamps, result) in a SQLite file"""
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT, created REAL, started REAL, "
+            "finished REAL, result TEXT, error TEXT)"
+        )
+
+    def _connect(self):
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create(self, max_queued=MAX_QUEUED_JOBS):
+        """Insert a queued job; returns its id, or None if the queue is full"""
+        conn = self._connect()
+        self.purge()
+        job_id = uuid.uuid4().hex
+        # BEGIN IMMEDIATE makes count-then-insert atomic across worker processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            active = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+            if active >= max_queued:
+                conn.execute("ROLLBACK")
+                return None
+            conn.execute("INSERT INTO jobs (id, status, created) VALUES (?, 'queued', ?)",
+                         (job_id, time.time()))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def insert_done(self, result):
+        """Insert an already finished job; not counted against MAX_QUEUED_JOBS"""
+        self.purge()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, created, started, finished, result) VALUES (?, 'done', ?, ?, ?, ?)",
+            (job_id, now, now, now, json.dumps(result)))
+        return job_id
+
+    def mark_running(self, job_id):
+        """Returns False if the job is no longer queued (it timed out waiting)"""
+        self.purge()
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'running', started = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id))
+        return cursor.rowcount > 0
+
+    def finish(self, job_id, result=None, error=None):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? "
+            "WHERE id = ? AND status IN ('queued', 'running')",
+            ('failed' if error is not None else 'done', time.time(),
+             json.dumps(result) if result is not None else None, error, job_id))
+
+    def get(self, job_id):
+        """Job as a dict, or None if unknown or expired"""
+        self.purge()
+        row = self._connect().execute(
+            "SELECT id, status, created, started, finished, result, error FROM jobs WHERE id = ?",
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(('job_id', 'status', 'created', 'started', 'finished', 'result', 'error'), row))
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def purge(self):
+        """Drop expired results and fail jobs that outlived JOB_TIMEOUT"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?",
+                     (now - JOB_RESULT_TTL,))
+        # Running jobs are timed from when they started, so queue wait doesn't count
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', finished = ?, error = 'Job timed out' "
+            "WHERE (status = 'queued' AND created < ?) OR (status = 'running' AND started < ?)",
+            (now, now - JOB_TIMEOUT, now - JOB_TIMEOUT))
+
+    def stats(self):
+        counts = dict(self._connect().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            "queued": counts.get('queued', 0),
+            "running": counts.get('running', 0),
+            "done": counts.get('done', 0),
+            "failed": counts.get('failed', 0),
+            "max_queued": MAX_QUEUED_JOBS,
+        }
+
+
+_store = None
+
+
+def get_job_store():
+    """Process-wide job store for JOBS_DB_PATH"""
+    global _store
+    if _store is None:
+        _store = JobStore()
+    return _store
+
+
+def run_job(job_id, func, payload):
+    """Pool-side wrapper: record running/done in the store around func(payload); None if it timed out queued"""
+    store = get_job_store()
+    if not store.mark_running(job_id):
+        # Timed out while queued; nobody is waiting for the result
+        return None
+    result = func(payload)
+    store.finish(job_id, result=result)
+    return result
+
+
+def submit_job(func, payload, on_result=None):
+    """
+    Queue func(payload) on the process pool
+
+    Returns the job id, or None when MAX_QUEUED_JOBS are already pending.
+    on_result(result) is called in this process when the job succeeds. A
+    pool broken by a dead child is replaced and the submit retried once; if
+    that fails too the job is marked failed and the error raised.
+    """
+    store = get_job_store()
+    job_id = store.create()
+    if job_id is None:
+        return None
+
+    def _done(future):
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            # The next submit gets a fresh pool
+            shutdown_pool(pool)
+            store.finish(job_id, error=f"Worker process failed: {e}")
+            return
+        except Exception as e:
+            store.finish(job_id, error=str(e) or type(e).__name__)
+            return
+        if on_result is not None and result is not None:
+            on_result(result)
+
+    pool = get_pool()
+    try:
+        try:
+            future = pool.submit(run_job, job_id, func, payload)
+        except BrokenProcessPool:
+            shutdown_pool(pool)
+            pool = get_pool()
+            future = pool.submit(run_job, job_id, func, payload)
+    except Exception as e:
+        store.finish(job_id, error=str(e) or type(e).__name__)
+        raise
+    future.add_done_callback(_done)
+    return job_id
+
+
+def complete_job(result):
+    """Record an already-known result (e.g. a cache hit) as a finished job"""
+    return get_job_store().insert_done(result)
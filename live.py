@@ -0,0 +1,360 @@
+"""
+Live Stream Detection
+
+Scores a call while it is still in progress. Raw PCM arrives in chunks of
+any size; LiveStream frames it exactly like one continuous STFT (no edge
+padding, the last n_fft - hop_length samples carried over to the next
+chunk), folds each new frame's spectral, RMS, ZCR, MFCC and pitch features
+into streaming.RunningFeatures, and re-runs the detector every
+LIVE_VERDICT_SECONDS of audio. Each chunk is touched once; a stream's
+memory is the fixed-size aggregates plus less than one FFT frame of
+samples, however long the call runs.
+
+app.py serves streams over HTTP (POST /live to open, POST /live/<id> per
+chunk, DELETE /live/<id> for the final verdict) and, when flask-sock is
+installed, over a WebSocket at /live/ws. Open streams are kept in a SQLite
+table next to the job store's, not in process memory, so consecutive
+chunks of one stream may land on any gunicorn worker. A stream's state is
+small (about 10 KB pickled), so loading and saving it per chunk costs well
+under a millisecond.
+
+Stand-in client, which replays a file as a paced live stream:
+
+    python live.py call.wav --url http://localhost:5000 --chunk-ms 100 --realtime
+    python live.py call.wav --local      # no server, time the processing in-process
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import pickle
+import sqlite3
+import argparse
+import threading
+
+import numpy as np
+
+from feature_engine import HOP_LENGTH, N_FFT, compute_spectral_frames
+from jobs import JOBS_DB_PATH
+from streaming import RunningFeatures
+
+# Shares the job store's SQLite file by default
+LIVE_DB_PATH = os.environ.get('LIVE_DB_PATH', JOBS_DB_PATH)
+LIVE_VERDICT_SECONDS = float(os.environ.get('LIVE_VERDICT_SECONDS', 2.0))
+LIVE_MAX_STREAMS = int(os.environ.get('LIVE_MAX_STREAMS', 64))
+# Streams with no chunk for this many seconds are dropped
+LIVE_IDLE_TIMEOUT = float(os.environ.get('LIVE_IDLE_TIMEOUT', 60.0))
+MIN_VERDICT_SECONDS = 0.5
+
+# encoding -> (little-endian sample dtype, full-scale value)
+PCM_ENCODINGS = {
+    'pcm_s16le': ('<i2', 32768.0),
+    'pcm_f32le': ('<f4', 1.0),
+}
+
+
+class LiveStream:
+    """
+    Incremental detection over one PCM stream
+
+    push() takes raw bytes (interleaved channels are averaged to mono) and
+    returns the verdicts that became due; close() returns the final one.
+    detect is a detect_ai_voice-style callable.
+    """
+
+    def __init__(self, sample_rate, detect, encoding='pcm_s16le', channels=1,
+                 verdict_seconds=LIVE_VERDICT_SECONDS, n_fft=N_FFT, hop_length=HOP_LENGTH, pitch_method=None):
+        if encoding not in PCM_ENCODINGS:
+            raise ValueError(f"Unknown encoding '{encoding}'; expected one of {', '.join(PCM_ENCODINGS)}")
+        if sample_rate <= 0 or channels < 1:
+            raise ValueError("'sample_rate' and 'channels' must be positive")
+        if verdict_seconds < MIN_VERDICT_SECONDS:
+            raise ValueError(f"'verdict_seconds' must be at least {MIN_VERDICT_SECONDS}")
+
+        self.sample_rate = int(sample_rate)
+        self.detect = detect
+        self.encoding = encoding
+        self.channels = int(channels)
+        self.verdict_seconds = float(verdict_seconds)
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.dtype, self.full_scale = PCM_ENCODINGS[encoding]
+        self.frame_bytes = np.dtype(self.dtype).itemsize * self.channels
+
+        self.features = RunningFeatures(pitch_method, n_fft, hop_length)
+        # Bytes of an incomplete sample frame, and samples not yet in a full STFT frame
+        self._pending = b''
+        self._carry = np.zeros(0, dtype=np.float32)
+        # Verdicts are due every verdict_samples samples (counted exactly, not in float seconds)
+        self.verdict_samples = max(1, int(round(self.verdict_seconds * self.sample_rate)))
+        self._next_verdict = self.verdict_samples
+        self.last_verdict = None
+        self.chunks = 0
+        self.processing_seconds = 0.0
+        self.max_chunk_seconds = 0.0
+
+    @property
+    def seconds(self):
+        return self.features.seconds
+
+    def _samples(self, data):
+        """(samples decoded from whole sample frames of data, the partial frame left over)"""
+        data = self._pending + data
+        usable = len(data) - len(data) % self.frame_bytes
+        samples = np.frombuffer(data[:usable], dtype=self.dtype).astype(np.float32)
+        if self.full_scale != 1.0:
+            samples /= self.full_scale
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        return samples, data[usable:]
+
+    def _verdict(self):
+        classification, confidence, explanation = self.detect(self.features.features())
+        self.last_verdict = {
+            "seconds": round(self.seconds, 3),
+            "classification": classification,
+            "confidence": confidence,
+            "explanation": explanation,
+        }
+        return self.last_verdict
+
+    def push(self, data):
+        """
+        Fold in a chunk of PCM bytes; returns the list of verdicts now due (usually 0 or 1)
+
+        Nothing is folded in until the chunk's frames are computed, so a chunk
+        that fails there leaves the stream as it was.
+        """
+        start = time.perf_counter()
+        samples, pending = self._samples(data)
+
+        buffer = np.concatenate([self._carry, samples]) if len(self._carry) else samples
+        if len(buffer) >= self.n_fft:
+            n_frames = 1 + (len(buffer) - self.n_fft) // self.hop_length
+            segment = buffer[:(n_frames - 1) * self.hop_length + self.n_fft]
+            frames = compute_spectral_frames(segment, self.sample_rate, self.n_fft, self.hop_length, center=False)
+            self.features.update_frames(frames, self.sample_rate, segment)
+            buffer = buffer[n_frames * self.hop_length:]
+        self.features.update_samples(samples, self.sample_rate)
+        self._pending = pending
+        # Copy so the chunk's array isn't kept alive through a view
+        self._carry = buffer.copy()
+
+        verdicts = []
+        if self.features.samples >= self._next_verdict and self.features.frames:
+            verdicts.append(self._verdict())
+            self._next_verdict = (self.features.samples // self.verdict_samples + 1) * self.verdict_samples
+
+        elapsed = time.perf_counter() - start
+        self.chunks += 1
+        self.processing_seconds += elapsed
+        self.max_chunk_seconds = max(self.max_chunk_seconds, elapsed)
+        return verdicts
+
+    def close(self):
+        """Final verdict over everything received, plus processing statistics"""
+        verdict = dict(self._verdict())
+        verdict["processing"] = self.stats()
+        return verdict
+
+    def stats(self):
+        return {
+            "chunks": self.chunks,
+            "audio_seconds": round(self.seconds, 3),
+            "mean_chunk_ms": self.processing_seconds / self.chunks * 1000 if self.chunks else 0.0,
+            "max_chunk_ms": self.max_chunk_seconds * 1000,
+            # Processing time per second of audio; must stay well below 1
+            "real_time_factor": self.processing_seconds / self.seconds if self.seconds else 0.0,
+        }
+
+
+class LiveStreamStore:
+    """
+    Open streams by id in a SQLite table shared by every worker process
+
+    get() returns an unpickled copy; save() writes it back only if nobody
+    saved the stream in between (a revision counter), so two chunks of one
+    stream racing on different workers can't silently drop one of them.
+    """
+
+    def __init__(self, path=LIVE_DB_PATH, max_streams=LIVE_MAX_STREAMS, idle_timeout=LIVE_IDLE_TIMEOUT):
+        self.path = path
+        self.max_streams = max_streams
+        self.idle_timeout = idle_timeout
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS live_streams ("
+            "id TEXT PRIMARY KEY, revision INTEGER, updated REAL, state BLOB)"
+        )
+
+    def _connect(self):
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _expire(self, conn):
+        """Drop streams with no chunk for idle_timeout seconds"""
+        conn.execute("DELETE FROM live_streams WHERE updated < ?", (time.time() - self.idle_timeout,))
+
+    def open(self, stream):
+        """Register stream; returns its id, or None when max_streams are open"""
+        conn = self._connect()
+        stream_id = uuid.uuid4().hex
+        state = pickle.dumps(stream, protocol=pickle.HIGHEST_PROTOCOL)
+        # BEGIN IMMEDIATE makes count-then-insert atomic across worker processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._expire(conn)
+            if conn.execute("SELECT COUNT(*) FROM live_streams").fetchone()[0] >= self.max_streams:
+                conn.execute("ROLLBACK")
+                return None
+            conn.execute("INSERT INTO live_streams (id, revision, updated, state) VALUES (?, 0, ?, ?)",
+                         (stream_id, time.time(), state))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        stream.revision = 0
+        return stream_id
+
+    def get(self, stream_id):
+        """The stream as last saved, or None if unknown or expired"""
+        row = self._connect().execute(
+            "SELECT revision, state FROM live_streams WHERE id = ? AND updated >= ?",
+            (stream_id, time.time() - self.idle_timeout)).fetchone()
+        if row is None:
+            return None
+        stream = pickle.loads(row[1])
+        stream.revision = row[0]
+        return stream
+
+    def save(self, stream_id, stream):
+        """Write back a stream from get(); False if it was saved, closed or expired since"""
+        cursor = self._connect().execute(
+            "UPDATE live_streams SET revision = revision + 1, updated = ?, state = ? "
+            "WHERE id = ? AND revision = ?",
+            (time.time(), pickle.dumps(stream, protocol=pickle.HIGHEST_PROTOCOL), stream_id, stream.revision))
+        if cursor.rowcount == 0:
+            return False
+        stream.revision += 1
+        return True
+
+    def close(self, stream_id):
+        """Remove a stream; returns it as last saved, or None if unknown or expired"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state, updated FROM live_streams WHERE id = ?", (stream_id,)).fetchone()
+            conn.execute("DELETE FROM live_streams WHERE id = ?", (stream_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None or row[1] < time.time() - self.idle_timeout:
+            return None
+        return pickle.loads(row[0])
+
+    def stats(self):
+        conn = self._connect()
+        self._expire(conn)
+        return {"open": conn.execute("SELECT COUNT(*) FROM live_streams").fetchone()[0],
+                "max": self.max_streams}
+
+
+_store = None
+
+
+def get_live_store():
+    """Process-wide handle on the stream store at LIVE_DB_PATH"""
+    global _store
+    if _store is None:
+        _store = LiveStreamStore()
+    return _store
+
+
+def load_pcm(path, sample_rate=None):
+    """(int16 mono PCM bytes, sample rate) for an audio file"""
+    import librosa
+
+    y, sr = librosa.load(path, sr=sample_rate, mono=True)
+    pcm = (np.clip(y, -1.0, 1.0 - 1 / 32768) * 32768).astype('<i2')
+    return pcm.tobytes(), sr
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay an audio file as a live detection stream")
+    parser.add_argument('audio', help="Audio file to stream")
+    parser.add_argument('--url', default='http://localhost:5000', help="API server")
+    parser.add_argument('--api-key', default=os.environ.get('API_KEY', 'your_secure_api_key_here_123456'))
+    parser.add_argument('--local', action='store_true', help="Process in this process instead of a server")
+    parser.add_argument('--sample-rate', type=int, help="Resample before streaming (default: file rate)")
+    parser.add_argument('--chunk-ms', type=float, default=100.0, help="Audio per pushed chunk")
+    parser.add_argument('--verdict-seconds', type=float, default=LIVE_VERDICT_SECONDS)
+    parser.add_argument('--realtime', action='store_true', help="Pace chunks at the speed of the audio")
+    args = parser.parse_args(argv)
+
+    pcm, sr = load_pcm(args.audio, args.sample_rate)
+    chunk_bytes = max(2, int(sr * args.chunk_ms / 1000) * 2)
+    chunks = [pcm[i:i + chunk_bytes] for i in range(0, len(pcm), chunk_bytes)]
+    print(f"Streaming {len(pcm) / 2 / sr:.1f}s at {sr} Hz in {len(chunks)} chunks of {args.chunk_ms:g} ms")
+
+    if args.local:
+        from app import detect_ai_voice
+        stream = LiveStream(sr, detect_ai_voice, verdict_seconds=args.verdict_seconds)
+        push = stream.push
+        finish = stream.close
+    else:
+        import requests
+        session = requests.Session()
+        headers = {'X-API-Key': args.api_key}
+        response = session.post(f"{args.url.rstrip('/')}/live", headers=headers, json={
+            "sample_rate": sr, "encoding": "pcm_s16le", "channels": 1,
+            "verdict_seconds": args.verdict_seconds,
+        })
+        if response.status_code != 201:
+            print(f"Could not open stream: {response.status_code} {response.text}")
+            return 1
+        stream_url = f"{args.url.rstrip('/')}/live/{response.json()['stream_id']}"
+
+        def push(chunk):
+            response = session.post(stream_url, data=chunk, headers={
+                **headers, 'Content-Type': 'application/octet-stream'})
+            response.raise_for_status()
+            return response.json()['verdicts']
+
+        def finish():
+            response = session.delete(stream_url, headers=headers)
+            response.raise_for_status()
+            return response.json()
+
+    latencies = []
+    started = time.perf_counter()
+    for index, chunk in enumerate(chunks):
+        if args.realtime:
+            delay = started + index * args.chunk_ms / 1000 - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        sent = time.perf_counter()
+        verdicts = push(chunk)
+        latencies.append(time.perf_counter() - sent)
+        for verdict in verdicts:
+            print(f"  {verdict['seconds']:7.1f}s  {verdict['classification']:<13} {verdict['confidence']:.2f}")
+
+    final = finish()
+    latencies = np.array(latencies) * 1000
+    print(f"\nFinal: {final['classification']} ({final['confidence']:.2f}) - {final['explanation']}")
+    print(f"Chunk round trip: p50 {np.percentile(latencies, 50):.1f} ms, p95 {np.percentile(latencies, 95):.1f} ms, "
+          f"max {latencies.max():.1f} ms for {args.chunk_ms:g} ms of audio each")
+    print("Server processing: " + json.dumps(final['processing']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
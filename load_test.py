@@ -0,0 +1,345 @@
+"""
+Concurrent Load Test
+
+Drives /detect with many concurrent clients and reports throughput, latency
+percentiles and error rates, so the number of gunicorn workers can be
+sized offline. Each client thread keeps its own pooled keep-alive
+connection. Payloads are synthetic speech-like clips (benchmark.py's
+generator) in a weighted mix of lengths and formats.
+
+    # Against a running server
+    python load_test.py --url http://localhost:5000 --concurrency 8 --duration 60
+
+    # Start app.py under gunicorn with 1, 2 and 4 workers and test each
+    python load_test.py --start-server --workers 1 2 4 --concurrency 8 --rate 10
+
+With --rate the requests follow a fixed open-loop schedule (that many per
+second overall) and latency is measured from each request's scheduled
+time, so a saturated server shows up as growing latency instead of being
+hidden by clients that slow down. Without --rate every client sends its
+next request as soon as the previous one returns.
+
+Servers started here run with RESULT_CACHE=off: the mix repeats the same
+few clips, which a caching server would otherwise answer from the cache.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import platform
+import argparse
+import threading
+import subprocess
+
+import numpy as np
+import requests
+import soundfile as sf
+from requests.adapters import HTTPAdapter
+
+DEFAULT_API_KEY = os.environ.get('API_KEY', 'your_secure_api_key_here_123456')
+# seconds.format=weight entries of speech-like clips at --sample-rate
+DEFAULT_MIX = '3s.wav=4,10s.flac=3,30s.wav=1,10s.ogg=1'
+DEFAULT_SAMPLE_RATE = 16000
+UPLOAD_MODES = ('binary', 'base64', 'multipart')
+SERVER_START_TIMEOUT = 180
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(spec, sample_rate=DEFAULT_SAMPLE_RATE):
+    """'3s.wav=4,10s.flac=1' -> [(seconds, format, sample rate, weight)]"""
+    from benchmark import FORMAT_SUBTYPES
+
+    mix = []
+    for entry in spec.split(','):
+        clip, _, weight = entry.strip().partition('=')
+        seconds, _, fmt = clip.partition('.')
+        fmt = fmt.lower()
+        if not seconds.endswith('s') or fmt not in FORMAT_SUBTYPES:
+            raise ValueError(f"Bad mix entry '{entry}'; expected e.g. 10s.wav=2 "
+                             f"(formats: {', '.join(FORMAT_SUBTYPES)})")
+        mix.append((float(seconds[:-1]), fmt, sample_rate, float(weight or 1)))
+    return mix
+
+
+def build_payloads(mix):
+    """One encoded clip per mix entry, with its share of the traffic"""
+    from benchmark import FORMAT_SUBTYPES, synth_signal
+
+    total_weight = sum(weight for *_, weight in mix)
+    payloads = []
+    for index, (seconds, fmt, sr, weight) in enumerate(mix):
+        y = synth_signal('speech', sr, seconds, seed=index)
+        buffer = io.BytesIO()
+        sf.write(buffer, y, sr, format=fmt.upper(), subtype=FORMAT_SUBTYPES[fmt])
+        data = buffer.getvalue()
+        payloads.append({
+            "name": f"{seconds:g}s.{fmt}",
+            "seconds": seconds,
+            "format": fmt,
+            "bytes": data,
+            "base64": base64.b64encode(data).decode('utf-8'),
+            "share": weight / total_weight,
+        })
+    return payloads
+
+
+def make_session(pool_size=1):
+    """Session with a keep-alive connection pool and no automatic retries"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def send(session, url, payload, upload, headers, params, timeout):
+    """One /detect request; returns the response status code"""
+    if upload == 'base64':
+        response = session.post(url, json={"audio": payload["base64"]}, headers=headers,
+                                params=params, timeout=timeout)
+    elif upload == 'multipart':
+        response = session.post(url, files={"audio": (payload["name"], payload["bytes"])},
+                                headers=headers, params=params, timeout=timeout)
+    else:
+        response = session.post(url, data=payload["bytes"], params=params, timeout=timeout,
+                                headers={**headers, 'Content-Type': 'application/octet-stream'})
+    # Read the whole body so the connection goes back to the pool
+    response.content
+    return response.status_code
+
+
+def run_load(url, payloads, concurrency, duration, rate=None, upload='binary', api_key=DEFAULT_API_KEY,
+             params=None, timeout=120.0, seed=0):
+    """
+    Send requests for duration seconds from concurrency client threads
+
+    Returns a list of per-request samples: payload name, status (HTTP code,
+    or the exception name), latency and, for a fixed rate, how late the
+    request was sent relative to its schedule.
+    """
+    detect_url = url.rstrip('/') + '/detect'
+    headers = {'X-API-Key': api_key}
+    rng = np.random.default_rng(seed)
+    shares = [payload["share"] for payload in payloads]
+
+    # Payloads drawn up front, so the mix is reproducible and the clients share no RNG
+    max_requests = int(rate * duration) + 1 if rate else None
+    choices = rng.choice(len(payloads), size=max_requests or 100000, p=shares)
+
+    samples = []
+    lock = threading.Lock()
+    next_index = [0]
+    start = time.perf_counter() + 0.05
+    deadline = start + duration
+
+    def client():
+        session = make_session()
+        while True:
+            with lock:
+                index = next_index[0]
+                next_index[0] += 1
+            if max_requests is not None and index >= max_requests:
+                break
+            scheduled = start + index / rate if rate else None
+            if scheduled is not None:
+                if scheduled >= deadline:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter()
+            if sent >= deadline and scheduled is None:
+                break
+
+            payload = payloads[choices[index % len(choices)]]
+            try:
+                status = send(session, detect_url, payload, upload, headers, params, timeout)
+            except requests.RequestException as e:
+                status = type(e).__name__
+            finished = time.perf_counter()
+
+            with lock:
+                samples.append({
+                    "payload": payload["name"],
+                    "status": status,
+                    "started": sent - start,
+                    "latency": finished - (scheduled if scheduled is not None else sent),
+                    "service_latency": finished - sent,
+                    "send_lag": sent - scheduled if scheduled is not None else 0.0,
+                })
+        session.close()
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def latency_stats(latencies):
+    if not len(latencies):
+        return None
+    latencies = np.asarray(latencies)
+    stats = {f"p{p}": float(np.percentile(latencies, p)) for p in PERCENTILES}
+    stats.update(mean=float(latencies.mean()), max=float(latencies.max()))
+    return stats
+
+
+def summarize(samples, wall_seconds, payloads):
+    """Throughput, latency percentiles and error counts for one run"""
+    ok = [s for s in samples if s["status"] == 200]
+    errors = {}
+    for s in samples:
+        if s["status"] != 200:
+            errors[str(s["status"])] = errors.get(str(s["status"]), 0) + 1
+    audio_seconds = {payload["name"]: payload["seconds"] for payload in payloads}
+
+    return {
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "errors": errors,
+        "error_rate": (len(samples) - len(ok)) / len(samples) if samples else 0.0,
+        "throughput_rps": len(ok) / wall_seconds if wall_seconds else 0.0,
+        "audio_seconds_per_second": sum(audio_seconds[s["payload"]] for s in ok) / wall_seconds
+                                    if wall_seconds else 0.0,
+        "latency": latency_stats([s["latency"] for s in ok]),
+        "service_latency": latency_stats([s["service_latency"] for s in ok]),
+        "max_send_lag": max((s["send_lag"] for s in samples), default=0.0),
+        "by_payload": {
+            payload["name"]: {
+                "requests": sum(1 for s in samples if s["payload"] == payload["name"]),
+                "latency": latency_stats([s["latency"] for s in ok if s["payload"] == payload["name"]]),
+            }
+            for payload in payloads
+        },
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, port=None, threads=1):
+    """Start app.py under gunicorn on localhost; returns (process, base URL) once /health is ready"""
+    port = port or free_port()
+    env = {**os.environ, 'RESULT_CACHE': 'off'}
+    command = [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--threads', str(threads), '--timeout', '120', '--preload']
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            if requests.get(url + '/health', timeout=2).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    stop_server(process)
+    raise RuntimeError(f"Server did not become ready within {SERVER_START_TIMEOUT}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def print_summary(label, summary):
+    latency = summary["latency"] or {}
+    print(f"{label:<14}{summary['requests']:>9}{summary['throughput_rps']:>9.2f}"
+          f"{summary['error_rate']:>8.1%}"
+          + "".join(f"{latency.get(f'p{p}', float('nan')) * 1000:>10.0f}" for p in PERCENTILES))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the /detect endpoint")
+    parser.add_argument('--url', default='http://localhost:5000', help="Server to test (ignored with --start-server)")
+    parser.add_argument('--api-key', default=DEFAULT_API_KEY)
+    parser.add_argument('--start-server', action='store_true',
+                        help="Start app.py under gunicorn locally for each --workers value")
+    parser.add_argument('--workers', type=int, nargs='+', default=[2], help="gunicorn worker counts to test")
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker (as in the Procfile)")
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent client connections")
+    parser.add_argument('--rate', type=float, help="Requests per second overall (default: as fast as possible)")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds to send requests for")
+    parser.add_argument('--warmup', type=float, default=5.0, help="Seconds of untimed traffic first")
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help="Payload mix as seconds.format=weight entries (default %(default)s)")
+    parser.add_argument('--sample-rate', type=int, default=DEFAULT_SAMPLE_RATE)
+    parser.add_argument('--upload', choices=UPLOAD_MODES, default='binary', help="How the audio is sent")
+    parser.add_argument('--mode', default='rules', help="Detector (?mode=)")
+    parser.add_argument('--profile', help="Analysis profile (?profile=)")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument('--output', default='load_test_results.json', help="Where to write the JSON report")
+    args = parser.parse_args(argv)
+
+    payloads = build_payloads(parse_mix(args.mix, args.sample_rate))
+    params = {'mode': args.mode}
+    if args.profile:
+        params['profile'] = args.profile
+
+    print("Payload mix: " + ", ".join(
+        f"{p['name']} {p['share']:.0%} ({len(p['bytes']) / 1024:.0f} KB)" for p in payloads))
+    print(f"{'run':<14}{'requests':>9}{'req/s':>9}{'errors':>8}"
+          + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES))
+
+    runs = []
+    for workers in (args.workers if args.start_server else [None]):
+        process = None
+        url = args.url
+        if args.start_server:
+            process, url = start_server(workers, threads=args.threads)
+        try:
+            options = dict(upload=args.upload, api_key=args.api_key, params=params, timeout=args.timeout)
+            if args.warmup > 0:
+                run_load(url, payloads, args.concurrency, args.warmup, args.rate, **options)
+            started = time.perf_counter()
+            samples = run_load(url, payloads, args.concurrency, args.duration, args.rate, **options)
+            wall_seconds = time.perf_counter() - started
+        finally:
+            if process is not None:
+                stop_server(process)
+
+        summary = summarize(samples, wall_seconds, payloads)
+        runs.append({"workers": workers, "url": url, "wall_seconds": wall_seconds, **summary})
+        print_summary(f"workers={workers}" if workers else "server", summary)
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "duration": args.duration,
+            "upload": args.upload,
+            "params": params,
+            "threads": args.threads if args.start_server else None,
+            "mix": [{"name": p["name"], "seconds": p["seconds"], "format": p["format"],
+                     "share": p["share"], "bytes": len(p["bytes"])} for p in payloads],
+        },
+        "runs": runs,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    return 1 if any(run["succeeded"] == 0 for run in runs) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
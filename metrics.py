@@ -0,0 +1,188 @@
+"""
+Request Metrics
+
+Per-stage latency histograms and request/error/payload/audio counters,
+rendered in the Prometheus text exposition format on /metrics. Updating a
+metric is a dict lookup and a few additions under a lock, so it stays
+cheap enough to record on every request.
+
+Metrics live in the process that served the request: under gunicorn each
+worker exposes its own series (scrape each worker, or run a single worker
+per container), and analyses run inside the batch/job process pool only
+contribute their request-level counters.
+"""
+
+import bisect
+import threading
+import time
+
+# Seconds; spans a cached hit (~1 ms) to a long recording (~1 min)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Gauge:
+    """Value that can go up and down, with optional labels"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ('le',)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(f"{self.name}_bucket{_format_labels(names, key + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total:g}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class StageTimer:
+    """
+    Lap timer that adds elapsed seconds to a timings dict
+
+    lap(name) charges the time since the previous lap (or construction) to
+    timings[name]. With timings=None it does nothing.
+    """
+
+    __slots__ = ('timings', 'last')
+
+    def __init__(self, timings):
+        self.timings = timings
+        self.last = time.perf_counter() if timings is not None else 0.0
+
+    def lap(self, name):
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings[name] = self.timings.get(name, 0.0) + now - self.last
+        self.last = now
+
+
+REQUESTS = Counter('voice_requests_total', "HTTP requests handled", ('endpoint', 'method', 'status'))
+ERRORS = Counter('voice_request_errors_total', "HTTP requests answered with a 4xx/5xx status",
+                 ('endpoint', 'status'))
+PAYLOAD_BYTES = Counter('voice_payload_bytes_total', "Request body bytes received", ('endpoint',))
+AUDIO_SECONDS = Counter('voice_audio_seconds_total', "Seconds of audio analysed", ('endpoint',))
+REQUEST_LATENCY = Histogram('voice_request_duration_seconds', "End-to-end request latency",
+                            ('endpoint',))
+STAGE_LATENCY = Histogram('voice_stage_duration_seconds', "Latency of each /detect pipeline stage",
+                          ('stage',))
+
+ADMISSION_INFLIGHT = Gauge('voice_admission_inflight', "Analyses running in this worker")
+ADMISSION_QUEUE_DEPTH = Gauge('voice_admission_queue_depth', "Requests waiting for an analysis slot")
+ADMISSION_QUEUED_SECONDS = Gauge('voice_admission_queued_audio_seconds',
+                                 "Seconds of audio waiting for an analysis slot")
+ADMISSION_REJECTIONS = Counter('voice_admission_rejections_total',
+                               "Requests turned away by admission control", ('reason',))
+
+ALL_METRICS = (REQUESTS, ERRORS, PAYLOAD_BYTES, AUDIO_SECONDS, REQUEST_LATENCY, STAGE_LATENCY,
+               ADMISSION_INFLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_QUEUED_SECONDS, ADMISSION_REJECTIONS)
+
+# Entries of a timings dict that are not stage durations
+NON_STAGE_TIMINGS = ('total', 'audio_seconds', 'audio_cost_seconds')
+
+
+def record_request(endpoint, method, status, payload_bytes, seconds, timings=None):
+    """Update every metric for one finished request"""
+    REQUESTS.inc(endpoint=endpoint, method=method, status=status)
+    if status >= 400:
+        ERRORS.inc(endpoint=endpoint, status=status)
+    if payload_bytes:
+        PAYLOAD_BYTES.inc(payload_bytes, endpoint=endpoint)
+    REQUEST_LATENCY.observe(seconds, endpoint=endpoint)
+
+    if timings:
+        for stage, value in timings.items():
+            if stage in NON_STAGE_TIMINGS or not isinstance(value, float):
+                continue
+            STAGE_LATENCY.observe(value, stage=stage)
+        if timings.get('audio_seconds'):
+            AUDIO_SECONDS.inc(timings['audio_seconds'], endpoint=endpoint)
+
+
+def render_metrics():
+    """All metrics in Prometheus text format"""
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,159 @@
+"""
+Model Registry for the ML Detector
+
+Loads model.pkl / scaler.pkl once per process instead of on every call, and
+hot-swaps them when a new version is written to disk. Loading at import time
+under gunicorn --preload means forked workers share the unpickled forest's
+arrays copy-on-write rather than each holding its own copy.
+
+Scoring goes through the forest flattened into arrays (compiled_forest):
+the export next to the pickles (COMPILED_MODEL_PATH, memory-mapped) when it
+was made from them, otherwise one flattened in memory at load time.
+"""
+
+import gc
+import os
+import time
+import pickle
+import threading
+from collections import namedtuple
+
+from compiled_forest import COMPILED_MODEL_PATH, CompiledForest, load_compiled_model, source_digest
+
+MODEL_PATH = os.environ.get('MODEL_PATH', 'model.pkl')
+SCALER_PATH = os.environ.get('SCALER_PATH', 'scaler.pkl')
+
+# Seconds between checks for a new model version on disk
+MODEL_CHECK_INTERVAL = float(os.environ.get('MODEL_CHECK_INTERVAL', 5.0))
+
+# feature_names: the ML features the model was trained on, in order (None =
+# the full feature_engine.ML_FEATURE_NAMES vector, as for older models)
+# compiled: CompiledForest scoring model + scaler, or None (sklearn is used)
+ModelBundle = namedtuple('ModelBundle', ['version', 'model', 'scaler', 'loaded_at', 'feature_names',
+                                         'compiled'])
+
+
+class ModelRegistry:
+    """Holds the current (model, scaler) pair and reloads it when the files change"""
+
+    def __init__(self, model_path=MODEL_PATH, scaler_path=SCALER_PATH,
+                 check_interval=MODEL_CHECK_INTERVAL, compiled_path=COMPILED_MODEL_PATH):
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.compiled_path = compiled_path
+        self.check_interval = check_interval
+        self._bundle = None
+        # Disk version refused for another feature schema, so it isn't re-read every check
+        self._rejected_version = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _disk_version(self):
+        """Version string from the files' mtimes and sizes, or None if missing"""
+        try:
+            model_stat = os.stat(self.model_path)
+            scaler_stat = os.stat(self.scaler_path)
+        except OSError:
+            return None
+        return (f"{model_stat.st_mtime_ns:x}-{model_stat.st_size:x}-"
+                f"{scaler_stat.st_mtime_ns:x}-{scaler_stat.st_size:x}")
+
+    def load(self):
+        """Load the model from disk now; returns the current bundle (or None)"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            version = self._disk_version()
+            if version is None or (self._bundle is not None and self._bundle.version == version):
+                return self._bundle
+            if version == self._rejected_version:
+                return self._bundle
+
+            try:
+                with open(self.model_path, 'rb') as f:
+                    model_bytes = f.read()
+                with open(self.scaler_path, 'rb') as f:
+                    scaler_bytes = f.read()
+                model = pickle.loads(model_bytes)
+                scaler = pickle.loads(scaler_bytes)
+            except Exception as e:
+                # Half-written files during a deploy: keep serving the old model
+                print(f"Model reload failed, keeping current model: {e}")
+                return self._bundle
+
+            # Files changed while we were reading them; pick it up on the next check
+            if self._disk_version() != version:
+                return self._bundle
+
+            # A model trained on another feature layout would score garbage; older
+            # models without the attribute use the full ml-v1 vector
+            from feature_engine import ML_FEATURE_SCHEMA_VERSION
+            schema_version = getattr(model, 'voice_feature_schema_version', None)
+            if schema_version is not None and schema_version != ML_FEATURE_SCHEMA_VERSION:
+                self._rejected_version = version
+                print(f"Refusing ML model version {version}: feature schema {schema_version}, "
+                      f"expected {ML_FEATURE_SCHEMA_VERSION}; retrain with python app_ml.py")
+                return self._bundle
+
+            # Single attribute assignment is the atomic swap readers see
+            feature_names = getattr(model, 'voice_feature_names', None)
+            if feature_names is not None:
+                feature_names = tuple(feature_names)
+            compiled = self._compile(model, scaler, source_digest(model_bytes, scaler_bytes))
+            self._bundle = ModelBundle(version, model, scaler, time.time(), feature_names, compiled)
+            print(f"Loaded ML model version {version}")
+            return self._bundle
+
+    def _compile(self, model, scaler, source):
+        """The matching exported forest, else one flattened now; None if the model can't be"""
+        compiled = load_compiled_model(self.compiled_path, source)
+        if compiled is not None:
+            return compiled
+        try:
+            return CompiledForest.from_sklearn(model, scaler, source)
+        except Exception as e:
+            print(f"Could not compile the model, scoring with sklearn: {e}")
+            return None
+
+    def get(self):
+        """Current bundle, reloading first if the files changed since the last check"""
+        if time.monotonic() - self._last_check >= self.check_interval:
+            return self.load()
+        return self._bundle
+
+    def status(self):
+        bundle = self._bundle
+        return {
+            "loaded": bundle is not None,
+            "version": bundle.version if bundle else None,
+            "loaded_at": bundle.loaded_at if bundle else None,
+            # Number of ML features a pruned model reads (None: the full vector)
+            "pruned_features": len(bundle.feature_names) if bundle and bundle.feature_names else None,
+            "model_path": self.model_path,
+            # 'file' (memory-mapped export), 'memory' (flattened at load) or None (sklearn)
+            "compiled": (None if not bundle or bundle.compiled is None
+                         else 'file' if bundle.compiled.memory_mapped else 'memory'),
+        }
+
+
+_registry = None
+
+
+def get_registry():
+    """Process-wide registry for MODEL_PATH / SCALER_PATH"""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
+
+
+def preload():
+    """
+    Load the model before workers fork (call at import under gunicorn --preload)
+
+    gc.freeze() moves the loaded objects out of the collector's generations
+    so garbage collection in the workers doesn't touch (and copy) their pages.
+    """
+    bundle = get_registry().load()
+    if bundle is not None and hasattr(gc, 'freeze'):
+        gc.freeze()
+    return bundle
@@ -0,0 +1,66 @@
+"""
+Analysis Profiles
+
+A profile fixes how much work one analysis does: the sample rate the clip is
+resampled to, the maximum number of seconds analysed, the STFT frame and hop
+sizes, and the sample dtype. Callers pick one per request (profile=...);
+ANALYSIS_PROFILE sets the default.
+
+- fast:     16 kHz, first 30 s, 1024-point frames
+- balanced: 22.05 kHz, first 120 s, 2048-point frames
+- full:     native rate, whole clip, 2048-point frames (original behaviour)
+
+The rule thresholds were tuned on full-rate features, so fast/balanced trade
+some agreement with 'full' for latency.
+"""
+
+import os
+from collections import namedtuple
+
+import numpy as np
+
+AnalysisProfile = namedtuple(
+    'AnalysisProfile',
+    ['name', 'sample_rate', 'max_duration', 'n_fft', 'hop_length', 'dtype', 'description'])
+
+ANALYSIS_PROFILES = {
+    'fast': AnalysisProfile('fast', 16000, 30.0, 1024, 512, 'float32',
+                            "16 kHz, first 30 s, 1024-point frames"),
+    'balanced': AnalysisProfile('balanced', 22050, 120.0, 2048, 512, 'float32',
+                                "22.05 kHz, first 120 s, 2048-point frames"),
+    'full': AnalysisProfile('full', None, None, 2048, 512, 'float32',
+                            "Native sample rate, whole clip, 2048-point frames"),
+}
+
+DEFAULT_PROFILE = os.environ.get('ANALYSIS_PROFILE', 'full')
+if DEFAULT_PROFILE not in ANALYSIS_PROFILES:
+    print(f"Unknown ANALYSIS_PROFILE '{DEFAULT_PROFILE}'; using 'full'")
+    DEFAULT_PROFILE = 'full'
+
+
+def get_profile(name=None):
+    """Profile by name (default profile for None); None if the name is unknown"""
+    return ANALYSIS_PROFILES.get(name or DEFAULT_PROFILE)
+
+
+def apply_profile(y, profile):
+    """Cast a decoded signal to the profile's dtype"""
+    return np.asarray(y, dtype=profile.dtype)
+
+
+def describe_profiles():
+    """JSON-safe description of every profile, for the API info endpoint"""
+    return {
+        "default": DEFAULT_PROFILE,
+        "available": {
+            name: {
+                "sample_rate": profile.sample_rate,
+                "max_duration": profile.max_duration,
+                "n_fft": profile.n_fft,
+                "hop_length": profile.hop_length,
+                "dtype": profile.dtype,
+                "description": profile.description,
+            }
+            for name, profile in ANALYSIS_PROFILES.items()
+        },
+    }
@@ -0,0 +1,197 @@
+"""
+Content-Addressed Result Cache
+
+Caches the feature dict and verdict for a clip, keyed on the SHA-256 of the
+uploaded audio bytes plus the detector version, so byte-identical uploads
+(re-submitted voicemails, client retries) skip feature extraction entirely.
+
+Backends:
+- memory: per-process LRU with a byte budget and TTL (default)
+- sqlite: on-disk LRU shared by all gunicorn workers on the host
+- off:    caching disabled
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+CACHE_BACKEND = os.environ.get('RESULT_CACHE', 'memory')
+CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 3600))
+CACHE_PATH = os.environ.get('RESULT_CACHE_PATH', 'result_cache.sqlite3')
+
+
+def cache_key(audio_bytes, version):
+    """Content hash of the audio bytes, scoped to a detector/model version"""
+    digest = hashlib.sha256(audio_bytes).hexdigest()
+    return f"{version}:{digest}"
+
+
+def to_cacheable(features, classification, confidence, explanation):
+    """JSON-safe cache entry (numpy scalars become plain floats)"""
+    if hasattr(features, 'to_dict'):
+        # FeatureRecord
+        features = features.to_dict()
+    elif isinstance(features, dict):
+        features = {k: float(v) for k, v in features.items()}
+    elif features is not None:
+        # ML feature vector
+        features = [float(v) for v in features]
+    return {
+        "features": features,
+        "classification": classification,
+        "confidence": float(confidence),
+        "explanation": explanation,
+    }
+
+
+class MemoryCache:
+    """In-process LRU cache bounded by approximate entry size and TTL"""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value):
+        size = len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, size, value)
+            self._size += size
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def stats(self):
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SqliteCache:
+    """On-disk LRU cache shared by every worker process using the same file"""
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT, size INTEGER, expires REAL, accessed REAL)"
+        )
+
+    def _connect(self):
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires FROM results WHERE key = ?", (key,)).fetchone()
+        if row is not None and row[1] < now:
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        payload = json.dumps(value)
+        if len(payload) > self.max_bytes:
+            return
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO results (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, payload, len(payload), now + self.ttl, now),
+        )
+        conn.execute("DELETE FROM results WHERE expires < ?", (now,))
+
+        # Evict least recently used entries until back under the byte budget
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total > self.max_bytes:
+            for old_key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall():
+                conn.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                self.evictions += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self):
+        entries, size = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the configured cache backend, or None when caching is off"""
+    global _cache
+    if _cache is None and CACHE_BACKEND != 'off':
+        if CACHE_BACKEND == 'sqlite':
+            _cache = SqliteCache()
+        else:
+            _cache = MemoryCache()
+    return _cache
@@ -0,0 +1,212 @@
+"""
+Vectorized Rule Engine
+
+Evaluates detect_ai_voice's threshold checks over a whole feature matrix
+(rows = clips, named columns) in one NumPy pass, returning every row's
+classification, confidence and per-rule indicator bits. Re-scoring stored
+feature records after a threshold change no longer needs a Python loop
+per clip; app.detect_ai_voice is a one-row call into the same code, so
+the scalar and batch paths agree bit for bit.
+
+Thresholds can be overridden by a JSON config (RULE_THRESHOLDS_PATH, written
+by calibrate.py) that the API loads at startup.
+"""
+
+import os
+import json
+import hashlib
+from collections import namedtuple
+
+import numpy as np
+
+RULE_THRESHOLDS_PATH = os.environ.get('RULE_THRESHOLDS_PATH', 'thresholds.json')
+
+# columns: feature columns the rule reads (several are averaged)
+# direction: '>' flags values above threshold, '<' values below
+Rule = namedtuple('Rule', ['name', 'columns', 'direction', 'threshold', 'reason'])
+
+RULES = (
+    Rule('spectral_flatness', ('spectral_flatness_mean',), '>', 0.3,
+         "High spectral flatness suggests synthetic generation"),
+    Rule('pitch_variation', ('pitch_std',), '<', 20,
+         "Low pitch variation indicates artificial voice"),
+    Rule('centroid_consistency', ('spectral_centroid_std',), '<', 300,
+         "Very consistent spectral centroid pattern"),
+    Rule('energy_consistency', ('rms_std',), '<', 0.02,
+         "Unnaturally consistent energy levels"),
+    Rule('zcr_variation', ('zcr_std',), '<', 0.02,
+         "Limited zero-crossing rate variation"),
+    Rule('mfcc_pattern', tuple(f'mfcc_{i}_std' for i in range(5)), '<', 10,
+         "MFCC patterns suggest synthetic voice"),
+    Rule('spectral_bandwidth', ('spectral_bandwidth_mean',), '<', 1000,
+         "Narrow spectral bandwidth typical of AI"),
+    Rule('chroma_variation', ('chroma_std',), '<', 0.1,
+         "Limited chroma variation"),
+)
+
+# Share of rules that must fire for an AI_GENERATED verdict
+DECISION_THRESHOLD = 0.55
+
+DEFAULT_THRESHOLDS = {rule.name: rule.threshold for rule in RULES}
+
+# Every column the rules read, in first-use order
+RULE_COLUMNS = tuple(dict.fromkeys(column for rule in RULES for column in rule.columns))
+
+HUMAN_EXPLANATION = ("Human voice detected with natural variations in pitch, energy, "
+                     "and spectral characteristics")
+
+RuleScores = namedtuple('RuleScores', ['classifications', 'confidences', 'indicators', 'ai_indicators'])
+
+# version is None for the built-in defaults, else a hash of the loaded config
+ThresholdConfig = namedtuple('ThresholdConfig', ['thresholds', 'decision_threshold', 'version', 'path'])
+
+
+def feature_matrix(records, columns=RULE_COLUMNS):
+    """
+    Stack feature dicts into a float64 matrix with the given columns
+
+    Missing features become 0, as features.get(name, 0) did.
+    """
+    return np.array([[record.get(column, 0) for column in columns] for record in records],
+                    dtype=np.float64).reshape(len(records), len(columns))
+
+
+def _verdict_tables(n_rules, decision_threshold):
+    """AI flag and rounded confidence for every possible number of fired rules"""
+    is_ai = []
+    confidences = []
+    for fired in range(n_rules + 1):
+        ai_score = fired / n_rules
+        if ai_score > decision_threshold:
+            confidence = min(0.6 + (ai_score - decision_threshold) * 0.8, 0.95)
+        else:
+            confidence = min(0.6 + (1 - ai_score) * 0.8, 0.95)
+        is_ai.append(ai_score > decision_threshold)
+        confidences.append(round(confidence, 2))
+    return np.array(is_ai), np.array(confidences)
+
+
+def rule_values(matrix, columns=RULE_COLUMNS, mean_dtype=np.float64):
+    """
+    The value each rule compares against its threshold, per row
+
+    Returns a (rows, len(RULES)) float64 array. Averaged columns (the MFCC
+    rule) are averaged in mean_dtype; float32 reproduces detect_ai_voice on
+    freshly extracted (float32) MFCC statistics.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    n_rows = matrix.shape[0]
+    index = {column: i for i, column in enumerate(columns)}
+
+    values = np.zeros((n_rows, len(RULES)))
+    for j, rule in enumerate(RULES):
+        present = [index[column] for column in rule.columns if column in index]
+        if len(rule.columns) == 1:
+            if present:
+                values[:, j] = matrix[:, present[0]]
+        else:
+            block = np.zeros((n_rows, len(rule.columns)), dtype=mean_dtype)
+            for k, column in enumerate(rule.columns):
+                if column in index:
+                    block[:, k] = matrix[:, index[column]]
+            values[:, j] = block.mean(axis=1)
+    return values
+
+
+def fire_rules(values, thresholds=None):
+    """(rows, len(RULES)) bool array: which rules fire for each row of rule_values"""
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    # Compare against a 1-D threshold array so everything is done in float64
+    limits = np.array([thresholds[rule.name] for rule in RULES], dtype=np.float64)
+    above = np.array([rule.direction == '>' for rule in RULES])
+    return np.where(above, values > limits, values < limits)
+
+
+def evaluate_rules(matrix, columns=RULE_COLUMNS, thresholds=None,
+                   decision_threshold=DECISION_THRESHOLD, mean_dtype=np.float64):
+    """
+    Score every row of a feature matrix
+
+    thresholds maps rule names to overrides of DEFAULT_THRESHOLDS; see
+    rule_values for mean_dtype.
+
+    Returns RuleScores: classifications (str array), confidences,
+    indicators (bit i set when RULES[i] fired) and ai_indicators (count).
+    """
+    fired = fire_rules(rule_values(matrix, columns, mean_dtype), thresholds)
+
+    ai_indicators = fired.sum(axis=1)
+    is_ai_table, confidence_table = _verdict_tables(len(RULES), decision_threshold)
+    is_ai = is_ai_table[ai_indicators]
+
+    return RuleScores(
+        classifications=np.where(is_ai, "AI_GENERATED", "HUMAN"),
+        confidences=confidence_table[ai_indicators],
+        indicators=fired.astype(np.uint32) @ (np.uint32(1) << np.arange(len(RULES), dtype=np.uint32)),
+        ai_indicators=ai_indicators,
+    )
+
+
+def fired_rules(indicators):
+    """Rules whose bit is set in one row's indicator mask"""
+    return [rule for i, rule in enumerate(RULES) if int(indicators) >> i & 1]
+
+
+def explain(classification, indicators):
+    """The explanation detect_ai_voice gives for one scored row"""
+    if classification == "AI_GENERATED":
+        reasons = [rule.reason for rule in fired_rules(indicators)]
+        return "AI-generated voice detected. " + "; ".join(reasons[:3])
+    return HUMAN_EXPLANATION
+
+
+def mean_dtype_for(features):
+    """dtype np.mean would average this feature dict's averaged rule columns in"""
+    # A FeatureRecord stores float64 but knows the precision it was computed in
+    dtype = getattr(features, 'dtype', None)
+    if dtype is not None:
+        return np.float32 if dtype == np.float32 else np.float64
+    values = np.asarray([features.get(column, 0) for rule in RULES if len(rule.columns) > 1
+                         for column in rule.columns])
+    return np.float32 if values.dtype == np.float32 else np.float64
+
+
+def load_threshold_config(path=RULE_THRESHOLDS_PATH):
+    """
+    Thresholds from a calibration config file, or the built-in defaults
+
+    A missing file means defaults; an unreadable or invalid one is reported
+    and ignored rather than stopping the API from starting.
+    """
+    defaults = ThresholdConfig(dict(DEFAULT_THRESHOLDS), DECISION_THRESHOLD, None, None)
+    if not path or not os.path.exists(path):
+        return defaults
+    try:
+        with open(path) as f:
+            raw = f.read()
+        config = json.loads(raw)
+        thresholds = dict(DEFAULT_THRESHOLDS)
+        for name, value in config.get('thresholds', {}).items():
+            if name not in thresholds:
+                raise ValueError(f"unknown rule '{name}'")
+            thresholds[name] = float(value)
+        decision_threshold = float(config.get('decision_threshold', DECISION_THRESHOLD))
+    except Exception as e:
+        print(f"Could not load rule thresholds from {path}, using defaults: {e}")
+        return defaults
+    version = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:12]
+    print(f"Loaded rule thresholds {version} from {path}")
+    return ThresholdConfig(thresholds, decision_threshold, version, path)
+
+
+def save_threshold_config(path, thresholds, decision_threshold, extra=None):
+    """Write a threshold config that load_threshold_config accepts"""
+    config = {
+        "thresholds": {rule.name: float(thresholds[rule.name]) for rule in RULES},
+        "decision_threshold": float(decision_threshold),
+        **(extra or {}),
+    }
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,246 @@
+"""
+Windowed Streaming Analysis
+
+Analyses long recordings one fixed-size window at a time instead of loading
+the whole file. Each window's frame-level features are folded into running,
+mergeable aggregates (count / mean / sum of squared deviations), so the
+clip-level feature dict that detect_ai_voice reads is available after every
+window while memory stays bounded by the window size.
+
+Frames are computed per window, so STFT frames straddling a window boundary
+are padded rather than shared; statistics differ slightly from a
+whole-file analysis.
+"""
+
+import os
+
+import numpy as np
+
+from feature_engine import HOP_LENGTH, N_FFT, compute_spectral_frames, pitch_track
+
+STREAM_WINDOW_SECONDS = float(os.environ.get('STREAM_WINDOW_SECONDS', 10.0))
+
+# Frame-level series whose mean/std feed the rule-based detector
+FRAME_SERIES = ('spectral_centroid', 'spectral_rolloff', 'spectral_bandwidth',
+                'spectral_flatness', 'zcr', 'rms')
+N_MFCC_STATS = 13
+
+
+class RunningStat:
+    """Mergeable population mean/std (Chan et al. parallel update)"""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self, shape=()):
+        self.count = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def update(self, values):
+        """Fold in a batch of observations (along the last axis)"""
+        values = np.asarray(values, dtype=np.float64)
+        n = values.shape[-1]
+        if n == 0:
+            return
+        batch_mean = values.mean(axis=-1)
+        batch_m2 = ((values - batch_mean[..., None]) ** 2).sum(axis=-1)
+        self._combine(n, batch_mean, batch_m2)
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+
+    def _combine(self, n, mean, m2):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / self.count) if self.count else np.zeros_like(self.mean)
+
+
+class RunningFeatures:
+    """
+    Running aggregates of every feature in app.extract_audio_features
+
+    update() folds in one chunk of signal; merge() combines two
+    accumulators; features() returns the same keys as
+    feature_engine.rule_features.
+    """
+
+    def __init__(self, pitch_method=None, n_fft=N_FFT, hop_length=HOP_LENGTH):
+        self.pitch_method = pitch_method
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.series = {name: RunningStat() for name in FRAME_SERIES}
+        self.mfcc = RunningStat((N_MFCC_STATS,))
+        self.chroma = RunningStat()
+        self.pitch = RunningStat()
+        self.pitch_min = np.inf
+        self.pitch_max = -np.inf
+        # Raw power sums of the samples for kurtosis / skew
+        self.samples = 0
+        self.power_sums = np.zeros(4)
+        self.seconds = 0.0
+
+    @property
+    def frames(self):
+        return self.series['rms'].count
+
+    def update(self, y, sr, frames=None):
+        """Fold a chunk of mono signal into the aggregates"""
+        if frames is None:
+            frames = compute_spectral_frames(y, sr, n_fft=self.n_fft, hop_length=self.hop_length)
+        self.update_frames(frames, sr, y)
+        self.update_samples(y, sr)
+
+    def update_frames(self, frames, sr, y=None):
+        """
+        Fold in frame-level features only
+
+        For callers that frame the signal themselves (live streams carry
+        samples across chunk boundaries); y is only read by YIN pitch.
+        """
+        for name in FRAME_SERIES:
+            self.series[name].update(frames[name])
+        self.mfcc.update(frames['mfcc'][:N_MFCC_STATS])
+        self.chroma.update(frames['chroma'].ravel())
+
+        values = pitch_track(y, sr, frames, self.pitch_method)
+        if len(values):
+            self.pitch.update(values)
+            self.pitch_min = min(self.pitch_min, float(np.min(values)))
+            self.pitch_max = max(self.pitch_max, float(np.max(values)))
+
+    def update_samples(self, y, sr):
+        """Fold in sample-level statistics (moments, duration), each sample once"""
+        y64 = np.asarray(y, dtype=np.float64)
+        y2 = y64 * y64
+        self.power_sums += (y64.sum(), y2.sum(), (y2 * y64).sum(), (y2 * y2).sum())
+        self.samples += len(y64)
+        self.seconds += len(y64) / sr
+
+    def merge(self, other):
+        """Combine another accumulator's aggregates into this one"""
+        for name in FRAME_SERIES:
+            self.series[name].merge(other.series[name])
+        self.mfcc.merge(other.mfcc)
+        self.chroma.merge(other.chroma)
+        self.pitch.merge(other.pitch)
+        self.pitch_min = min(self.pitch_min, other.pitch_min)
+        self.pitch_max = max(self.pitch_max, other.pitch_max)
+        self.samples += other.samples
+        self.power_sums += other.power_sums
+        self.seconds += other.seconds
+
+    def _moments(self):
+        """Biased skew and Fisher kurtosis from the raw power sums (scipy.stats defaults)"""
+        if not self.samples:
+            return 0.0, 0.0
+        s1, s2, s3, s4 = self.power_sums / self.samples
+        m2 = s2 - s1 ** 2
+        m3 = s3 - 3 * s1 * s2 + 2 * s1 ** 3
+        m4 = s4 - 4 * s1 * s3 + 6 * s1 ** 2 * s2 - 3 * s1 ** 4
+        if m2 <= 0:
+            return 0.0, 0.0
+        return m3 / m2 ** 1.5, m4 / m2 ** 2 - 3.0
+
+    def features(self):
+        """Clip-level feature dict so far (None before any frames)"""
+        if not self.frames:
+            return None
+        series = self.series
+        features = {
+            'spectral_centroid_mean': series['spectral_centroid'].mean,
+            'spectral_centroid_std': series['spectral_centroid'].std,
+            'spectral_rolloff_mean': series['spectral_rolloff'].mean,
+            'spectral_bandwidth_mean': series['spectral_bandwidth'].mean,
+            'spectral_bandwidth_std': series['spectral_bandwidth'].std,
+        }
+        mfcc_std = self.mfcc.std
+        for i in range(N_MFCC_STATS):
+            features[f'mfcc_{i}_mean'] = self.mfcc.mean[i]
+            features[f'mfcc_{i}_std'] = mfcc_std[i]
+        features['zcr_mean'] = series['zcr'].mean
+        features['zcr_std'] = series['zcr'].std
+        features['rms_mean'] = series['rms'].mean
+        features['rms_std'] = series['rms'].std
+        if self.pitch.count:
+            features['pitch_mean'] = self.pitch.mean
+            features['pitch_std'] = self.pitch.std
+            features['pitch_range'] = self.pitch_max - self.pitch_min
+        else:
+            features['pitch_mean'] = 0
+            features['pitch_std'] = 0
+            features['pitch_range'] = 0
+        features['duration'] = self.seconds
+        features['spectral_flatness_mean'] = series['spectral_flatness'].mean
+        features['spectral_flatness_std'] = series['spectral_flatness'].std
+        features['chroma_mean'] = self.chroma.mean
+        features['chroma_std'] = self.chroma.std
+        skewness, kurt = self._moments()
+        features['audio_kurtosis'] = kurt
+        features['audio_skew'] = skewness
+        return {k: float(v) for k, v in features.items()}
+
+
+def analyze_windows(windows, detect, stable_windows=0, pitch_method=None,
+                    n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """
+    Run detect over running aggregates of successive (y, sr) windows
+
+    detect is a detect_ai_voice-style callable. With stable_windows > 0,
+    analysis stops once the cumulative verdict has been the same for that
+    many consecutive windows, and the rest of the input is never decoded.
+
+    Returns (features, classification, confidence, explanation, details);
+    details holds the per-window verdicts and how much audio was read.
+    """
+    total = RunningFeatures(pitch_method, n_fft, hop_length)
+    window_results = []
+    offset = 0.0
+    streak = 0
+    previous = None
+    early_exit = False
+
+    for y, sr in windows:
+        start = offset
+        offset += len(y) / sr
+        # A tail shorter than one FFT frame adds nothing useful
+        if len(y) < n_fft:
+            continue
+
+        window = RunningFeatures(pitch_method, n_fft, hop_length)
+        window.update(y, sr)
+        total.merge(window)
+
+        window_class, window_confidence, _ = detect(window.features())
+        classification, confidence, _ = detect(total.features())
+        window_results.append({
+            "index": len(window_results),
+            "start": round(start, 3),
+            "end": round(offset, 3),
+            "classification": window_class,
+            "confidence": window_confidence,
+            "cumulative_classification": classification,
+            "cumulative_confidence": confidence,
+        })
+
+        streak = streak + 1 if classification == previous else 1
+        previous = classification
+        if stable_windows and streak >= stable_windows:
+            early_exit = True
+            break
+
+    features = total.features()
+    classification, confidence, explanation = detect(features)
+    details = {
+        "windows": window_results,
+        "windows_analyzed": len(window_results),
+        "analyzed_seconds": round(offset, 3),
+        "early_exit": early_exit,
+    }
+    return features, classification, confidence, explanation, details
@@ -1,6 +1,7 @@
 import requests
 import base64
 import json
+import time
 
 # Configuration
 API_URL = "http://localhost:5000/detect"  # Change this to your deployed URL
@@ -75,6 +76,63 @@ def test_api_with_url(audio_url):
     
     return response.json()
 
+def test_api_with_audio_file_binary(audio_file_path, multipart=False):
+    """Test the API by uploading the raw file bytes (no base64)"""
+    
+    headers = {
+        'Authorization': f'Bearer {API_KEY}'
+    }
+    
+    print(f"Testing API at: {API_URL}")
+    print(f"Audio file: {audio_file_path}")
+    print(f"Upload mode: {'multipart/form-data' if multipart else 'application/octet-stream'}")
+    print("Sending request...\n")
+    
+    with open(audio_file_path, 'rb') as audio_file:
+        if multipart:
+            response = requests.post(API_URL, headers=headers, files={'audio': audio_file})
+        else:
+            headers['Content-Type'] = 'application/octet-stream'
+            # Passing the file object streams it instead of loading it into memory
+            response = requests.post(API_URL, headers=headers, data=audio_file)
+    
+    # Print results
+    print(f"Status Code: {response.status_code}")
+    print(f"Response:")
+    print(json.dumps(response.json(), indent=2))
+    
+    return response.json()
+
+def compare_upload_modes(audio_file_path, repeats=5):
+    """Compare request size and round-trip time of JSON/base64 vs binary uploads"""
+    
+    with open(audio_file_path, 'rb') as audio_file:
+        audio_bytes = audio_file.read()
+    audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+    headers = {'Authorization': f'Bearer {API_KEY}'}
+    
+    modes = {
+        'json': lambda: requests.post(API_URL, headers=headers, json={'audio': audio_base64}),
+        'binary': lambda: requests.post(
+            API_URL, headers={**headers, 'Content-Type': 'application/octet-stream'}, data=audio_bytes),
+        'multipart': lambda: requests.post(API_URL, headers=headers, files={'audio': audio_bytes}),
+    }
+    sizes = {
+        'json': len(json.dumps({'audio': audio_base64})),
+        'binary': len(audio_bytes),
+        'multipart': len(audio_bytes),
+    }
+    
+    print(f"Comparing upload modes for: {audio_file_path}")
+    for mode, send in modes.items():
+        elapsed = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            response = send()
+            elapsed.append(time.perf_counter() - start)
+        print(f"{mode:10s} status={response.status_code} body~{sizes[mode]} bytes "
+              f"best={min(elapsed)*1000:.1f} ms mean={sum(elapsed)/len(elapsed)*1000:.1f} ms")
+
 def test_health_check():
     """Test the health endpoint"""
     response = requests.get(API_URL.replace('/detect', '/health'))
@@ -100,7 +158,15 @@ if __name__ == "__main__":
     # Option 2: Test with URL
     # test_api_with_url("https://example.com/sample_audio.mp3")
     
+    # Option 3: Upload raw bytes instead of base64 JSON
+    # test_api_with_audio_file_binary("sample_audio.mp3")
+    # test_api_with_audio_file_binary("sample_audio.mp3", multipart=True)
+    
+    # Option 4: Compare JSON/base64 against binary uploads
+    # compare_upload_modes("sample_audio.mp3")
+    
     print("\nTo test with your own audio:")
     print("1. Uncomment the appropriate test function above")
     print("2. Provide your audio file path or URL")
     print("3. Run this script again")
+    print("\nFor throughput and latency under concurrent load, use load_test.py")
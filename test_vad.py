@@ -0,0 +1,55 @@
+"""
+Tests for vad.py silence trimming
+
+    python -m pytest test_vad.py      (or: python test_vad.py)
+"""
+
+import numpy as np
+
+from vad import VAD_FRAME_SECONDS, VAD_PAD_SECONDS, pad_mask, trim_silence
+
+SR = 16000
+
+
+def tone(seconds, level=0.3, freq=220.0):
+    t = np.arange(int(SR * seconds)) / SR
+    return (level * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def test_pad_mask_keeps_length():
+    frames = int(round(VAD_PAD_SECONDS / VAD_FRAME_SECONDS))
+    for n in range(1, 4 * frames):
+        mask = np.zeros(n, dtype=bool)
+        mask[n // 2] = True
+        padded = pad_mask(mask, frames)
+        assert len(padded) == n
+        expected = np.abs(np.arange(n) - n // 2) <= frames
+        assert (padded == expected).all()
+
+
+def test_clips_shorter_than_pad_window():
+    # 0.1 s and 0.3 s are under the 2 * pad + 1 frame window
+    for seconds in (0.1, 0.3):
+        y = np.concatenate([np.zeros(int(SR * seconds / 2), dtype=np.float32), tone(seconds / 2)])
+        trimmed, activity = trim_silence(y, SR)
+        assert len(trimmed) <= len(y)
+        assert activity["total_seconds"] == len(y) / SR
+        assert activity["speech_seconds"] <= activity["total_seconds"]
+
+    _, activity = trim_silence(tone(0.1), SR)
+    assert not activity["speech_detected"]
+
+
+def test_trims_long_silence():
+    y = np.concatenate([np.zeros(SR * 2, dtype=np.float32), tone(1.0), np.zeros(SR * 2, dtype=np.float32)])
+    trimmed, activity = trim_silence(y, SR)
+    assert activity["speech_detected"]
+    assert activity["segments"] == 1
+    assert len(trimmed) < len(y) / 2
+
+
+if __name__ == '__main__':
+    test_pad_mask_keeps_length()
+    test_clips_shorter_than_pad_window()
+    test_trims_long_silence()
+    print("vad tests passed")
@@ -0,0 +1,115 @@
+"""
+Voice Activity Trimming
+
+Cheap energy/ZCR voice-activity detection run before feature extraction,
+so long silences (gaps, hold-time dead air, leading and trailing silence)
+neither cost STFT/piptrack time nor flatten the std-based checks in
+detect_ai_voice. The signal is cut into non-overlapping VAD_FRAME_SECONDS
+frames; a frame is speech when its RMS is within VAD_THRESHOLD_DB of the
+clip's loud frames and clearly above its noise floor, or, for unvoiced
+consonants, a little quieter but with a high zero-crossing rate. Speech
+frames are padded by VAD_PAD_SECONDS on each side (which also bridges
+pauses between syllables) and the kept regions are concatenated.
+
+Energy and ZCR cannot tell speech from music at the same level, so hold
+music is only trimmed where it is much quieter than the voice.
+"""
+
+import os
+
+import numpy as np
+
+VAD_FRAME_SECONDS = float(os.environ.get('VAD_FRAME_SECONDS', 0.03))
+# Frames this far below the loud (95th percentile) frames are silence
+VAD_THRESHOLD_DB = float(os.environ.get('VAD_THRESHOLD_DB', 35.0))
+# ...and so are frames within this margin of the noise floor (10th percentile)
+VAD_NOISE_MARGIN_DB = float(os.environ.get('VAD_NOISE_MARGIN_DB', 6.0))
+# Unvoiced consonants: up to this much quieter, if the zero-crossing rate is high
+VAD_ZCR_RELIEF_DB = 10.0
+VAD_ZCR_THRESHOLD = 0.25
+# Steady signals (no quiet frames to set a floor) count as active above this level
+VAD_ABSOLUTE_SILENCE_DB = -60.0
+VAD_PAD_SECONDS = float(os.environ.get('VAD_PAD_SECONDS', 0.15))
+# Less speech than this and the clip is analysed untrimmed
+VAD_MIN_SPEECH_SECONDS = 0.25
+
+# Trimming is off unless a request asks for it (or this is set to 1)
+VAD_DEFAULT = os.environ.get('VAD_DEFAULT', '0') == '1'
+
+
+def frame_activity(y, sr, frame_seconds=VAD_FRAME_SECONDS):
+    """(speech mask per frame, frame length in samples) for a mono signal"""
+    frame_length = max(1, int(sr * frame_seconds))
+    n_frames = len(y) // frame_length
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool), frame_length
+
+    frames = np.asarray(y[:n_frames * frame_length], dtype=np.float32).reshape(n_frames, frame_length)
+    rms = np.sqrt(np.mean(frames * frames, axis=1, dtype=np.float64))
+    level = 20 * np.log10(rms + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame_length
+
+    loud, quiet = np.percentile(level, [95, 10])
+    if loud - quiet < VAD_NOISE_MARGIN_DB:
+        # One steady level throughout: nothing to separate, only true silence is dropped
+        return level > VAD_ABSOLUTE_SILENCE_DB, frame_length
+
+    floor = quiet + VAD_NOISE_MARGIN_DB
+    threshold = max(loud - VAD_THRESHOLD_DB, floor)
+    voiced = level > threshold
+    unvoiced = (level > threshold - VAD_ZCR_RELIEF_DB) & (level > floor) & (zcr > VAD_ZCR_THRESHOLD)
+    return voiced | unvoiced, frame_length
+
+
+def pad_mask(mask, frames):
+    """Extend every True run by frames on both sides"""
+    if frames <= 0 or not mask.any():
+        return mask
+    # Distance-limited dilation via a running count over a 2 * frames + 1 window; the
+    # full convolution is sliced back to len(mask) (mode='same' would return the
+    # kernel's length for masks shorter than the window)
+    counts = np.convolve(mask.astype(np.int32), np.ones(2 * frames + 1, dtype=np.int32))
+    return counts[frames:frames + len(mask)] > 0
+
+
+def trim_silence(y, sr):
+    """
+    Keep only the speech regions of y
+
+    Returns (trimmed signal, activity) where activity reports
+    total_seconds, speech_seconds, trimmed_seconds, trimmed_ratio and the
+    number of speech segments. Without enough detected speech the signal
+    is returned unchanged (speech_detected false).
+    """
+    total_seconds = len(y) / sr
+    mask, frame_length = frame_activity(y, sr)
+    mask = pad_mask(mask, int(round(VAD_PAD_SECONDS / VAD_FRAME_SECONDS)))
+
+    speech_frames = int(np.count_nonzero(mask))
+    if speech_frames * frame_length / sr < VAD_MIN_SPEECH_SECONDS:
+        return y, {
+            "speech_detected": False,
+            "total_seconds": total_seconds,
+            "speech_seconds": total_seconds,
+            "trimmed_seconds": 0.0,
+            "trimmed_ratio": 0.0,
+            "segments": 0,
+        }
+
+    # The partial frame at the end follows the last full frame
+    keep = np.repeat(mask, frame_length)
+    if len(keep) < len(y):
+        keep = np.concatenate([keep, np.full(len(y) - len(keep), mask[-1])])
+    trimmed = y[keep] if not keep.all() else y
+
+    speech_seconds = len(trimmed) / sr
+    edges = np.diff(mask.astype(np.int8))
+    return trimmed, {
+        "speech_detected": True,
+        "total_seconds": total_seconds,
+        "speech_seconds": speech_seconds,
+        "trimmed_seconds": total_seconds - speech_seconds,
+        "trimmed_ratio": (total_seconds - speech_seconds) / total_seconds if total_seconds else 0.0,
+        "segments": int(np.count_nonzero(edges == 1) + mask[0]),
+    }
@@ -0,0 +1,119 @@
+"""
+Worker Warm-Up
+
+librosa's numba kernels are compiled, and its resampling filters and mel
+bases are built, the first time they are used, which made the first request
+each worker served several times slower than the rest. warm_up() pushes a
+built-in synthetic clip through the whole pipeline (decode, every analysis
+profile, the ML model if one is loaded, windowed streaming) before traffic
+is served. It is started from the gunicorn hooks in gunicorn.conf.py rather
+than at import: under --preload once in the master, whose forked workers
+inherit the compiled state copy-on-write, otherwise in a background thread
+of each worker while /health reports it as starting.
+
+Startup and first-request timings are kept here for /health.
+"""
+
+import gc
+import io
+import os
+import time
+
+import numpy as np
+import soundfile as sf
+
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', '1') == '1'
+WARMUP_SAMPLE_RATE = 22050
+WARMUP_SECONDS = 3.0
+
+
+def _process_start_time():
+    """Wall-clock start of this process (from /proc on Linux), else the time of this import"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22, counted after the parenthesised command name
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+# Process-wide startup state reported on /health
+_started = _process_start_time()
+_state = {
+    "ready": False,
+    "warmup": "pending",
+    "warmup_seconds": None,
+    "warmup_error": None,
+    "startup_seconds": None,
+    "first_request_seconds": None,
+}
+
+
+def synthetic_clip(sr=WARMUP_SAMPLE_RATE, seconds=WARMUP_SECONDS):
+    """
+    Deterministic voice-like test signal as WAV bytes
+
+    A harmonic tone with vibrato, a syllable-rate amplitude envelope and a
+    little noise, so pitch tracking, onset detection and every spectral
+    feature have something to work on.
+    """
+    t = np.arange(int(sr * seconds)) / sr
+    f0 = 140.0 + 20.0 * np.sin(2 * np.pi * 5.0 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    y = sum(np.sin(k * phase) / k for k in range(1, 8))
+    y *= 0.5 + 0.5 * np.abs(np.sin(2 * np.pi * 2.0 * t))
+    y += 0.01 * np.random.default_rng(0).standard_normal(len(t))
+    y = (0.3 * y / np.max(np.abs(y))).astype(np.float32)
+
+    buffer = io.BytesIO()
+    sf.write(buffer, y, sr, format='WAV', subtype='PCM_16')
+    return buffer.getvalue()
+
+
+def warm_up(steps):
+    """
+    Run each warm-up step once and mark the process ready
+
+    steps is a list of (name, callable(audio_bytes)). A failing step is
+    reported but does not keep the worker out of service.
+    """
+    start = time.perf_counter()
+    audio_bytes = synthetic_clip()
+    try:
+        for name, step in steps:
+            step(audio_bytes)
+        _state["warmup"] = "done"
+    except Exception as e:
+        print(f"Warm-up failed at {name}: {e}")
+        _state["warmup"] = "failed"
+        _state["warmup_error"] = f"{name}: {e}"
+    _state["warmup_seconds"] = time.perf_counter() - start
+    mark_ready()
+
+
+def mark_ready(skipped=False):
+    """Record the end of startup; /health reports ready from here on"""
+    if skipped:
+        _state["warmup"] = "skipped"
+    # Keep the collector off the warmed objects so forked workers share their pages
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    _state["startup_seconds"] = time.time() - _started
+    _state["ready"] = True
+
+
+def record_first_request(seconds):
+    """Keep the latency of the first detection request this process served"""
+    if _state["first_request_seconds"] is None:
+        _state["first_request_seconds"] = seconds
+
+
+def is_ready():
+    return _state["ready"]
+
+
+def startup_status():
+    return dict(_state)